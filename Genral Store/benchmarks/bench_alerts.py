@@ -0,0 +1,85 @@
+"""
+Wall time of the daily stock alert check (`manage.py check_stock_alerts`)
+and of the dashboard feed as the number of stock batches grows. Most batches
+are sold out or expire far ahead, as in a store with years of history.
+
+    python benchmarks/bench_alerts.py [--batches 100000,1000000] [--repeat 3]
+"""
+
+import argparse
+import random
+from io import StringIO
+from datetime import timedelta
+from decimal import Decimal
+
+from harness import Timer, setup_django
+
+
+def seed(start, count, products, today, rng):
+    from core.models import ItemStock
+
+    batch = []
+    for i in range(start, start + count):
+        total = rng.randrange(1, 50)
+        # 80% sold out, expiring up to three years back; the rest have stock
+        # left and expire from two months back to two years ahead
+        if rng.random() < 0.8:
+            sold, expires = total, rng.randrange(-3 * 365, 2 * 365)
+        else:
+            sold, expires = rng.randrange(total), rng.randrange(-60, 2 * 365)
+        batch.append(ItemStock(
+            order_number=str(i // 50 + 1).zfill(7), vender_code='000001',
+            item_code=str(i % products + 1).zfill(6), product_name='Product', company_name='Acme',
+            barcode_number=f'B{i:08d}', total_qty=total, sale_qty=sold, available_qty=total - sold,
+            rate=Decimal('10.00'), sale_rate=Decimal('12.50'),
+            expire_date=today + timedelta(days=expires),
+        ))
+        if len(batch) >= 5000:
+            ItemStock.objects.bulk_create(batch)
+            batch = []
+    ItemStock.objects.bulk_create(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batches', default='100000,1000000')
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.core.management import call_command
+    from django.utils import timezone
+    from core.alerts import alert_dashboard, refresh_alerts
+    from core.models import StockAlert, StockAssigned
+
+    rng = random.Random(42)
+    today = timezone.now().date()
+    StockAssigned.objects.bulk_create([
+        StockAssigned(item_code=str(i + 1).zfill(6), product_name='Product', company_name='Acme',
+                      reorder_level=rng.choice([0, 0, 100, 500]))
+        for i in range(args.products)
+    ])
+
+    seeded = 0
+    print(f"{'batches':>9} {'expiring':>9} {'low stock':>10} {'check ms':>9} {'dashboard ms':>13}")
+    for count in [int(n) for n in args.batches.split(',')]:
+        seed(seeded, count - seeded, args.products, today, rng)
+        seeded = count
+        call_command('rebuild_stock_summary', stdout=StringIO())
+
+        checks, feeds = [], []
+        for _ in range(args.repeat):
+            with Timer() as timer:
+                written = refresh_alerts()
+            checks.append(timer.ms)
+            with Timer() as timer:
+                alert_dashboard([kind for kind, _ in StockAlert.KIND_CHOICES], 100)
+            feeds.append(timer.ms)
+        print(f"{count:>9} {written[StockAlert.EXPIRING]:>9} {written[StockAlert.LOW_STOCK]:>10} "
+              f"{min(checks):>9.1f} {min(feeds):>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
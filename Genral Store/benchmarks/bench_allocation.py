@@ -0,0 +1,79 @@
+"""
+Wall time and statements of a sale by item code (FEFO allocation across the
+item's open batches) as the number of open batches grows, next to the same
+sale scanned by barcode.
+
+    python benchmarks/bench_allocation.py [--batches 20,100,500,2000] [--repeat 5]
+"""
+
+import argparse
+from datetime import date, timedelta
+from decimal import Decimal
+
+from harness import Timer, setup_django
+
+
+def seed_batches(item_code, count):
+    from core.models import ItemStock
+
+    ItemStock.objects.bulk_create([
+        ItemStock(
+            order_number=str(i // 50 + 1).zfill(7), vender_code='000001', item_code=item_code,
+            product_name='Product', company_name='Acme', barcode_number=f'{item_code}-{i:05d}',
+            total_qty=1_000, available_qty=1_000, rate=Decimal('10.00'),
+            sale_rate=Decimal('12.50'),
+            # shuffled expiry dates, so FEFO order differs from insertion order
+            expire_date=date(2030, 1, 1) + timedelta(days=(i * 7919) % count),
+        )
+        for i in range(count)
+    ], batch_size=500)
+
+
+def line(item_code, barcode, qty):
+    return {
+        'barcode_number': barcode, 'item_code': item_code, 'product_name': 'Product',
+        'company_name': 'Acme', 'specification': '', 'qty': qty,
+        'sale_rate': Decimal('12.50'), 'amount': Decimal('12.50') * qty,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batches', default='20,100,500,2000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from core.sales import post_sale
+
+    counter = 0
+    print(f"{'batches':>8} {'sale':>22} {'statements':>11} {'ms/sale':>9}")
+    for count in [int(n) for n in args.batches.split(',')]:
+        item_code = f'I{count}'
+        seed_batches(item_code, count)
+        cases = (
+            ('barcode, qty 1', [line(item_code, f'{item_code}-00000', 1)]),
+            ('item code, qty 1', [line(item_code, '', 1)]),
+            # 1,000 per batch: spans three batches
+            ('item code, qty 2500', [line(item_code, '', 2500)]),
+        )
+        for name, lines in cases:
+            timings = []
+            for _ in range(args.repeat):
+                counter += 1
+                with CaptureQueriesContext(connection) as queries, Timer() as timer:
+                    post_sale(
+                        lines, sale_number=str(counter).zfill(7), sale_date='2025-01-01',
+                        customer_name='Bench', total_quantity=lines[0]['qty'],
+                        total_amount=lines[0]['amount'],
+                        cash_received=Decimal('0.00'), cash_return=Decimal('0.00'),
+                    )
+                timings.append(timer.ms)
+            print(f"{count:>8} {name:>22} {len(queries.captured_queries):>11} {min(timings):>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
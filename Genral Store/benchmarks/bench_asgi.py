@@ -0,0 +1,246 @@
+"""
+Concurrent-request throughput and tail latency of the read-only lookups
+(barcode scan, sale details) under the WSGI deployment (gunicorn, threaded
+workers, sync views) versus the ASGI deployment (uvicorn, async views).
+
+    python benchmarks/bench_asgi.py [--scale tiny] [--concurrency 32] [--duration 10]
+
+Needs gunicorn and uvicorn (not dependencies of the shop itself). Both
+servers get the same number of worker processes and serve the same seeded
+SQLite file with the production profile (WAL). The ASGI server is also
+measured with the sync views, which Django runs in a thread per request.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from harness import PROJECT_DIR, setup_django
+
+# name -> (server, path of the barcode lookup, path of the sale lookup)
+TARGETS = {
+    'wsgi.sync': ('gunicorn', '/ajax/get-product/', '/get-sale-details/'),
+    'asgi.async': ('uvicorn', '/async/ajax/get-product/', '/async/get-sale-details/'),
+    'asgi.sync': ('uvicorn', '/ajax/get-product/', '/get-sale-details/'),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def write_settings(directory, db_path):
+    """
+    A settings module pointing the servers at the benchmark database.
+    """
+    with open(os.path.join(directory, 'bench_settings.py'), 'w') as f:
+        f.write(
+            'from erp1.settings import *\n\n'
+            f'DATABASES["default"]["NAME"] = {db_path!r}\n'
+            'DEBUG = False\n'
+        )
+
+
+def start_server(server, port, settings_dir, workers, threads, log):
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='bench_settings',
+        ERP_DB_PROFILE='production',
+        PYTHONPATH=os.pathsep.join([settings_dir, str(PROJECT_DIR)]),
+    )
+    if server == 'gunicorn':
+        command = [
+            sys.executable, '-m', 'gunicorn', 'erp1.wsgi:application',
+            '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+            '--threads', str(threads), '--worker-class', 'gthread',
+            '--keep-alive', '30', '--log-level', 'warning',
+        ]
+    else:
+        command = [
+            sys.executable, '-m', 'uvicorn', 'erp1.asgi:application',
+            '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+            '--log-level', 'warning', '--no-access-log',
+        ]
+    process = subprocess.Popen(command, cwd=PROJECT_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=log)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{server} exited with {process.returncode}; see {log.name}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{server} did not start listening on {port}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def read_response(reader):
+    """
+    Read one HTTP/1.1 response; returns (status, keep_alive).
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("server closed the connection")
+    status = int(status_line.split()[1])
+    length = 0
+    keep_alive = True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'connection' and value.strip().lower() == 'close':
+            keep_alive = False
+    await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def client(port, make_path, deadline, latencies, errors):
+    """
+    One keep-alive connection sending requests back to back until deadline.
+    """
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        start = time.perf_counter()
+        try:
+            writer.write(f'GET {make_path()} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            errors.append('connection')
+            writer.close()
+            writer = None
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        if status != 200:
+            errors.append(status)
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, make_path, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(
+        client(port, make_path, deadline, latencies, errors) for _ in range(concurrency)
+    ))
+    return latencies, errors
+
+
+def summarise(latencies, errors, duration):
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2)
+
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(latencies[-1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', default='tiny', help="Store size (see bench_views.py)")
+    parser.add_argument('--concurrency', type=int, default=32, help="Open connections")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per measurement")
+    parser.add_argument('--workers', type=int, default=1, help="Server processes (both servers)")
+    parser.add_argument('--threads', type=int, default=8, help="Threads per gunicorn worker")
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS))
+    parser.add_argument('--output', help="Write the JSON report here")
+    args = parser.parse_args()
+
+    for module in ('gunicorn', 'uvicorn'):
+        if importlib.util.find_spec(module) is None:
+            parser.error(f"this benchmark needs '{module}' (pip install gunicorn uvicorn)")
+
+    from bench_views import LINES_PER_SALE, SCALES, barcode, seed
+
+    scale = SCALES[args.scale]
+    directory = tempfile.mkdtemp(prefix='erp-bench-asgi-')
+    db_path = os.path.join(directory, 'bench.sqlite3')
+    os.environ['ERP_DB_PROFILE'] = 'production'
+    setup_django(db_path)
+    print(f"Seeding {args.scale} store...")
+    seed(scale)
+    from django.db import connections
+    connections.close_all()
+    write_settings(directory, db_path)
+
+    rng = random.Random(42)
+    sales = scale['sale_details'] // LINES_PER_SALE
+    lookups = {
+        'barcode': lambda path: f"{path}?barcode={barcode(rng.randrange(scale['stock']))}",
+        'sale_details': lambda path: f"{path}?sale_number={str(rng.randrange(sales) + 1).zfill(7)}",
+    }
+
+    report = {
+        'meta': {
+            'scale': args.scale, 'concurrency': args.concurrency, 'duration': args.duration,
+            'workers': args.workers, 'threads': args.threads,
+        },
+        'results': {},
+    }
+    print(f"\n{'target':<12} {'lookup':<14} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+    for name in args.targets:
+        server, barcode_path, sale_path = TARGETS[name]
+        port = free_port()
+        with open(os.path.join(directory, f'{name}.log'), 'w') as log:
+            process = start_server(server, port, directory, args.workers, args.threads, log)
+            try:
+                for lookup, path in (('barcode', barcode_path), ('sale_details', sale_path)):
+                    make_path = lambda: lookups[lookup](path)
+                    asyncio.run(load(port, make_path, args.concurrency, 1))  # warm-up
+                    latencies, errors = asyncio.run(load(port, make_path, args.concurrency, args.duration))
+                    result = summarise(latencies, errors, args.duration)
+                    report['results'][f'{name}.{lookup}'] = result
+                    print(f"{name:<12} {lookup:<14} {result['rps']:>9} {result['p50_ms']:>9} "
+                          f"{result['p95_ms']:>9} {result['p99_ms']:>9} {result['max_ms']:>9} "
+                          f"{result['errors']:>7}")
+            finally:
+                stop_server(process)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Concurrent checkout throughput of the default SQLite setup versus the
+production profile (ERP_DB_PROFILE=production: WAL, synchronous=NORMAL,
+busy timeout, mmap/cache pragmas, BEGIN IMMEDIATE, persistent connections).
+
+Several worker processes play tills: each scans a basket (a read of the
+basket's ItemStock rows) and posts it the way the sales view does, then
+releases its connection the way the end of a request does.
+
+    python benchmarks/bench_concurrent_checkout.py [--processes 8] [--sales 100]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from decimal import Decimal
+
+from harness import setup_django
+
+PROFILES = ('development', 'production')
+STOCK = 2_000
+
+
+def barcode(i):
+    return f'BC{i:08d}'
+
+
+def seed(db_path, profile):
+    os.environ['ERP_DB_PROFILE'] = profile
+    setup_django(db_path)
+
+    from core.models import ItemStock
+
+    ItemStock.objects.bulk_create([
+        ItemStock(
+            order_number='0000001', vender_code='000001', item_code=str(i).zfill(6),
+            product_name=f'Product {i}', company_name='Acme', barcode_number=barcode(i),
+            total_qty=1_000_000, available_qty=1_000_000,
+            rate=Decimal('10.00'), sale_rate=Decimal('12.50'),
+        )
+        for i in range(STOCK)
+    ], batch_size=500)
+
+
+def till(args):
+    """
+    Post `sales` baskets and return (completed, failed, seconds).
+    """
+    db_path, profile, sales, lines, worker = args
+    os.environ['ERP_DB_PROFILE'] = profile
+    setup_django(db_path, migrate=False)
+
+    from django.db import OperationalError, close_old_connections, transaction
+    from core.models import ItemStock
+    from core.sales import post_sale
+    from core.sequences import next_number
+
+    rng = random.Random(worker)
+    completed = failed = 0
+    start = time.perf_counter()
+    for _ in range(sales):
+        picks = rng.sample(range(STOCK), lines)
+        try:
+            # scanning: the till reads the basket before checking out
+            list(ItemStock.objects.filter(barcode_number__in=[barcode(i) for i in picks]))
+            sale_number = next_number('sale')
+            with transaction.atomic():
+                post_sale(
+                    [
+                        {
+                            'barcode_number': barcode(i), 'item_code': str(i).zfill(6),
+                            'product_name': f'Product {i}', 'company_name': 'Acme',
+                            'specification': '', 'qty': 1,
+                            'sale_rate': Decimal('12.50'), 'amount': Decimal('12.50'),
+                        }
+                        for i in picks
+                    ],
+                    sale_number=sale_number, sale_date='2025-06-01', customer_name='Load test',
+                    customer_contact='', total_quantity=lines,
+                    total_amount=Decimal('12.50') * lines,
+                    cash_received=Decimal('12.50') * lines, cash_return=Decimal('0.00'),
+                )
+            completed += 1
+        except OperationalError:
+            failed += 1  # "database is locked"
+        finally:
+            close_old_connections()  # what the end of every request does
+    return completed, failed, time.perf_counter() - start
+
+
+def run(profile, processes, sales, lines):
+    db_path = os.path.join(tempfile.mkdtemp(prefix='erp-checkout-'), 'bench.sqlite3')
+    # Seed in a child so this process never configures Django itself
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(1) as pool:
+        pool.apply(seed, (db_path, profile))
+
+    start = time.perf_counter()
+    with ctx.Pool(processes) as pool:
+        results = pool.map(till, [(db_path, profile, sales, lines, w) for w in range(processes)])
+    elapsed = time.perf_counter() - start
+
+    completed = sum(r[0] for r in results)
+    failed = sum(r[1] for r in results)
+    return completed, failed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--sales', type=int, default=100, help="Sales per process")
+    parser.add_argument('--lines', type=int, default=5, help="Lines per basket")
+    parser.add_argument('--profile', choices=PROFILES, action='append',
+                        help="Profile(s) to run (default: both)")
+    args = parser.parse_args()
+
+    print(f"{args.processes} tills x {args.sales} sales x {args.lines} lines")
+    print(f"{'profile':<12} {'completed':>9} {'failed':>7} {'seconds':>8} {'sales/s':>8}")
+    for profile in args.profile or PROFILES:
+        completed, failed, elapsed = run(profile, args.processes, args.sales, args.lines)
+        print(f"{profile:<12} {completed:>9} {failed:>7} {elapsed:>8.2f} {completed / elapsed:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Cost of recomputing a basket's prices on the server as baskets grow: the
+one-query rate lookup (sale_rates) and the single validating pass
+(price_lines), next to the separate sum() passes the return view used to
+make over the posted lists without checking anything.
+
+    python benchmarks/bench_pricing.py [--lines 10,100,1000,10000] [--repeat 20]
+"""
+
+import argparse
+from decimal import Decimal
+
+from harness import Timer, setup_django
+
+
+def seed_stock(count):
+    from core.models import ItemStock
+
+    ItemStock.objects.bulk_create([
+        ItemStock(
+            order_number='0000001', vender_code='000001', item_code=str(i).zfill(6),
+            product_name='Product', company_name='Acme', barcode_number=f'P{i:06d}',
+            total_qty=100, available_qty=100, rate=Decimal('10.00'),
+            sale_rate=Decimal('12.50') + Decimal(i % 100) / 100,
+        )
+        for i in range(count)
+    ], batch_size=500)
+
+
+def basket(count):
+    lines = []
+    for i in range(count):
+        rate = Decimal('12.50') + Decimal(i % 100) / 100
+        qty = i % 3 + 1
+        lines.append({
+            'barcode_number': f'P{i:06d}', 'item_code': str(i).zfill(6),
+            'qty': qty, 'sale_rate': rate, 'amount': rate * qty,
+        })
+    return lines
+
+
+def multi_pass(lines):
+    # What sale_return computed before: one pass per total, nothing checked
+    total_amount = sum(line['sale_rate'] * line['qty'] for line in lines)
+    total_quantity = sum(line['qty'] for line in lines)
+    amount_refunded = sum(line['qty'] * line['sale_rate'] for line in lines)
+    return total_quantity, total_amount, amount_refunded
+
+
+def best(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        with Timer() as timer:
+            fn()
+        timings.append(timer.ms)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', default='10,100,1000,10000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    sizes = [int(n) for n in args.lines.split(',')]
+    setup_django()
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from core.pricing import price_lines, sale_rates
+
+    seed_stock(max(sizes))
+
+    print(f"{'lines':>7} {'rate queries':>13} {'ms/rates':>9} {'ms/price':>9} {'ms/3 sums':>10}")
+    for count in sizes:
+        lines = basket(count)
+        barcodes = [line['barcode_number'] for line in lines]
+        with CaptureQueriesContext(connection) as queries:
+            rates = sale_rates(barcodes)
+        total = sum(line['amount'] for line in lines)
+        rates_ms = best(args.repeat, lambda: sale_rates(barcodes))
+        price_ms = best(args.repeat, lambda: price_lines([dict(line) for line in lines], rates, amount=total))
+        sums_ms = best(args.repeat, lambda: multi_pass(lines))
+        print(f"{count:>7} {len(queries.captured_queries):>13} {rates_ms:>9.2f} {price_ms:>9.2f} {sums_ms:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
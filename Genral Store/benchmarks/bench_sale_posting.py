@@ -0,0 +1,95 @@
+"""
+Statements-per-sale and wall time of the per-line sale loop the sales view
+used to run versus core.sales.post_sale, for 1, 10, 100 and 500 line baskets.
+
+    python benchmarks/bench_sale_posting.py [--repeat 5]
+"""
+
+import argparse
+from decimal import Decimal
+
+from harness import StatementCounter, Timer, setup_django
+
+
+def legacy_post_sale(lines, **header):
+    """
+    The original loop from core.views.sales: one SELECT, INSERT and UPDATE per line.
+    """
+    from django.db import transaction
+    from core.models import ItemStock, SaleDetail, SaleInfo
+
+    with transaction.atomic():
+        sale_info = SaleInfo.objects.create(**header)
+        for line in lines:
+            stock = ItemStock.objects.select_for_update().get(
+                barcode_number=line['barcode_number'],
+                item_code=line['item_code']
+            )
+            if stock.available_qty < line['qty']:
+                raise Exception(f"Insufficient stock for {stock.product_name}")
+            SaleDetail.objects.create(sale=sale_info, **line)
+            stock.sale_qty += line['qty']
+            stock.save()
+    return sale_info
+
+
+def seed_stock(count):
+    from core.models import ItemStock
+
+    ItemStock.objects.bulk_create([
+        ItemStock(
+            order_number='0000001', vender_code='000001', item_code=str(i).zfill(6),
+            product_name=f'Product {i}', company_name='Acme',
+            barcode_number=f'BC{i:08d}', total_qty=1_000_000, available_qty=1_000_000,
+            rate=Decimal('10.00'), sale_rate=Decimal('12.50'),
+        )
+        for i in range(count)
+    ], batch_size=500)
+
+
+def basket(size):
+    return [
+        {
+            'barcode_number': f'BC{i:08d}', 'item_code': str(i).zfill(6),
+            'product_name': f'Product {i}', 'company_name': 'Acme', 'specification': '',
+            'qty': 1, 'sale_rate': Decimal('12.50'), 'amount': Decimal('12.50'),
+        }
+        for i in range(size)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--sizes', default='1,10,100,500')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.db import connection
+    from core.sales import post_sale
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    seed_stock(max(sizes))
+
+    counter = 0
+    print(f"{'lines':>6} {'impl':>8} {'statements':>11} {'ms/sale':>9}")
+    for size in sizes:
+        lines = basket(size)
+        for name, impl in (('legacy', legacy_post_sale), ('bulk', post_sale)):
+            timings = []
+            for _ in range(args.repeat):
+                counter += 1
+                with StatementCounter(connection) as statements, Timer() as timer:
+                    impl(
+                        lines, sale_number=str(counter).zfill(7), sale_date='2025-01-01',
+                        customer_name='Bench', total_quantity=size,
+                        total_amount=Decimal('12.50') * size,
+                        cash_received=Decimal('0.00'), cash_return=Decimal('0.00'),
+                    )
+                timings.append(timer.ms)
+            print(f"{size:>6} {name:>8} {statements.count:>11} {min(timings):>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""
+Query count, p50/p95 latency and peak memory of every core view against a
+synthetic store, written as a JSON report that can be diffed between commits.
+
+    python benchmarks/bench_views.py --scale small --output before.json
+    python benchmarks/bench_views.py --db /tmp/store.sqlite3 --reuse --compare before.json
+
+``--scale full`` seeds 50k products, 500 vendors, 1M ItemStock rows and 2M
+SaleDetail rows (allow several minutes). ``--db`` keeps the seeded database
+so later runs can pass ``--reuse`` and skip seeding.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+from harness import PROJECT_DIR, setup_django
+
+SCALES = {
+    'tiny': dict(products=500, vendors=20, stock=5_000, sale_details=10_000),
+    'small': dict(products=5_000, vendors=100, stock=100_000, sale_details=200_000),
+    'full': dict(products=50_000, vendors=500, stock=1_000_000, sale_details=2_000_000),
+}
+LINES_PER_SALE = 4
+BATCH = 5_000
+
+
+def barcode(i):
+    return f'{i:012d}'
+
+
+def item_code(i):
+    return str(i + 1).zfill(6)
+
+
+def seed(scale, out=sys.stdout):
+    """
+    Fill the database with a deterministic synthetic store.
+    """
+    from django.core.management import call_command
+    from django.db import transaction
+    from core.models import ItemStock, SaleDetail, SaleInfo, StockAssigned, VenderDetails
+
+    products, vendors, stock, details = (
+        scale['products'], scale['vendors'], scale['stock'], scale['sale_details']
+    )
+
+    def bulk(model, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH:
+                model.objects.bulk_create(batch)
+                batch = []
+        model.objects.bulk_create(batch)
+        out.write(f"  seeded {model.__name__}\n")
+
+    with transaction.atomic():
+        bulk(VenderDetails, (
+            VenderDetails(vender_code=str(v + 1).zfill(6), vender_name=f'Vendor {v}',
+                          company_name=f'Company {v % 50}')
+            for v in range(vendors)
+        ))
+        bulk(StockAssigned, (
+            StockAssigned(item_code=item_code(p), product_name=f'Product {p}',
+                          company_name=f'Company {p % 50}', specification='')
+            for p in range(products)
+        ))
+        bulk(ItemStock, (
+            ItemStock(
+                order_number=str(i // 100 + 1).zfill(7), vender_code=str(i % vendors + 1).zfill(6),
+                item_code=item_code(i % products), product_name=f'Product {i % products}',
+                company_name=f'Company {i % products % 50}', barcode_number=barcode(i),
+                total_qty=1_000, available_qty=1_000, rate=Decimal('10.00'),
+                sale_rate=Decimal('12.50'),
+                expire_date=date(2026, 1, 1) + timedelta(days=i % 700),
+            )
+            for i in range(stock)
+        ))
+        sales = details // LINES_PER_SALE
+        bulk(SaleInfo, (
+            SaleInfo(
+                sale_number=str(s + 1).zfill(7), sale_date=date(2024, 1, 1) + timedelta(days=s % 700),
+                customer_name='Walk-in', total_quantity=LINES_PER_SALE,
+                total_amount=Decimal('50.00'), cash_received=Decimal('50.00'),
+                cash_return=Decimal('0.00'),
+            )
+            for s in range(sales)
+        ))
+        first_sale_id = SaleInfo.objects.order_by('id').values_list('id', flat=True).first()
+        bulk(SaleDetail, (
+            SaleDetail(
+                sale_id=first_sale_id + d // LINES_PER_SALE, barcode_number=barcode(d % stock),
+                item_code=item_code(d % stock % products), product_name=f'Product {d % stock % products}',
+                company_name='Company', specification='', qty=1,
+                sale_rate=Decimal('12.50'), amount=Decimal('12.50'),
+            )
+            for d in range(sales * LINES_PER_SALE)
+        ))
+    call_command('rebuild_sales_rollups', stdout=out)
+
+
+def scenarios(scale, rng):
+    """
+    (name, method, url name or (url name, args), data factory) for every
+    view under test.
+    """
+    stock = scale['stock']
+    sales = scale['sale_details'] // LINES_PER_SALE
+
+    def receiving_rows():
+        start = stock + rng.randrange(10 ** 9)
+        return {
+            'vendor': '000001-Vendor 0',
+            'rows': json.dumps([
+                {'item_code': item_code(rng.randrange(scale['products'])),
+                 'barcode_number': f'N{start + i}', 'qty': 10, 'rate': '10', 'sale_rate': '12.5'}
+                for i in range(20)
+            ]),
+        }
+
+    def basket():
+        picks = [rng.randrange(stock) for _ in range(10)]
+        return {
+            'sale_date': '2025-06-01', 'customer_name': 'Bench', 'contact_number': '',
+            'total_quantity': 10, 'total_amount': '125.00',
+            'cash_received': '125.00', 'cash_return': '0.00',
+            'barcode[]': [barcode(i) for i in picks],
+            'item_code[]': [item_code(i % scale['products']) for i in picks],
+            'product_name[]': [f'Product {i % scale["products"]}' for i in picks],
+            'company_name[]': ['Company'] * 10, 'specification[]': [''] * 10,
+            'qty[]': ['1'] * 10, 'sale_rate[]': ['12.50'] * 10, 'amount[]': ['12.50'] * 10,
+        }
+
+    def sale_return():
+        # Return one line actually sold on a sale nothing was returned
+        # against yet, so every call posts a return rather than a rejection.
+        from core.models import SaleDetail, SaleReturnDetail
+
+        while True:
+            sale_number = str(rng.randrange(sales) + 1).zfill(7)
+            if not SaleReturnDetail.objects.filter(sale_number=sale_number).exists():
+                break
+        line = (
+            SaleDetail.objects.filter(sale__sale_number=sale_number).order_by('id')
+            .values('barcode_number', 'product_name', 'sale_rate').first()
+        )
+        return {
+            'sale_number': sale_number, 'return_date': '2025-06-01',
+            'barcode[]': [line['barcode_number']], 'description[]': [line['product_name']],
+            'specification[]': [''], 'qty[]': ['1'],
+            'sale_rate[]': [str(line['sale_rate'])], 'amount[]': [str(line['sale_rate'])],
+        }
+
+    return [
+        ('products', 'get', 'products', None),
+        ('product_search.page', 'get', 'product_search',
+         lambda: {'after': item_code(rng.randrange(scale['products']))}),
+        ('product_search.query', 'get', 'product_search', lambda: {'q': 'Company 7'}),
+        ('vendor_details', 'get', 'vendor_details', None),
+        ('product_typeahead', 'get', 'product_typeahead',
+         lambda: {'q': f'Product {rng.randrange(100)}'}),
+        ('vendor_typeahead', 'get', 'vendor_typeahead', lambda: {'q': 'Vendor 1'}),
+        ('resolve_receiving_barcode', 'get', 'resolve_receiving_barcode',
+         lambda: {'barcode': barcode(rng.randrange(stock))}),
+        ('stock_receiving_list.get', 'get', 'stock_receiving_list', None),
+        ('stock_receiving_list.post', 'post', 'stock_receiving_list', receiving_rows),
+        ('sales.get', 'get', 'sales', None),
+        ('sales.post', 'post', 'sales', basket),
+        ('sale_return.get', 'get', 'Sale_return', None),
+        ('sale_return.post', 'post', 'Sale_return', sale_return),
+        ('sales_report.month', 'get', 'sales_report',
+         lambda: {'from': '2024-01-01', 'to': '2025-12-31', 'period': 'month'}),
+        ('sales_report.item', 'get', 'sales_report',
+         lambda: {'from': '2024-01-01', 'to': '2024-01-31', 'group': 'item', 'format': 'json'}),
+        ('export.sales.csv', 'get', ('export_data', ['sales', 'csv']),
+         lambda: {'from': '2024-01-01', 'to': '2024-03-31'}),
+        ('export.stock.csv', 'get', ('export_data', ['stock', 'csv']), None),
+        ('get_sale_details', 'get', 'get_sale_details',
+         lambda: {'sale_number': str(rng.randrange(sales) + 1).zfill(7)}),
+        ('get_product_by_barcode.cold', 'get', 'get_product_by_barcode',
+         lambda: {'barcode': barcode(rng.randrange(stock)), '_cold': True}),
+        ('get_product_by_barcode.warm', 'get', 'get_product_by_barcode',
+         lambda: {'barcode': barcode(0)}),
+        ('get_products_by_barcodes.cold', 'post', 'get_products_by_barcodes',
+         lambda: {'_json': {'barcodes': [barcode(rng.randrange(stock)) for _ in range(30)]},
+                  '_cold': True}),
+    ]
+
+
+def failure(response):
+    """
+    Why a response is a rejection rather than the work being timed, or None:
+    an HTTP error, a JSON error body or an error message queued for a
+    redirect.
+    """
+    from django.contrib import messages
+
+    if response.status_code >= 400:
+        return f"returned {response.status_code}"
+    if response.get('Content-Type', '').startswith('application/json'):
+        body = response.json()
+        if isinstance(body, dict) and (body.get('success') is False or body.get('status') == 'error'):
+            return f"answered {body}"
+    errors = [
+        str(message) for message in messages.get_messages(response.wsgi_request)
+        if message.level >= messages.ERROR
+    ]
+    if errors:
+        return f"reported {errors}"
+    return None
+
+
+def measure(client, method, url, make_data, iterations):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from core.cache import barcode_cache
+
+    def prepare():
+        # Built before the clock starts: some factories query the store
+        data = make_data() if make_data else {}
+        if data.pop('_cold', False):
+            barcode_cache.clear()
+        return data
+
+    def call(data):
+        if '_json' in data:
+            response = getattr(client, method)(url, data.pop('_json'), content_type='application/json')
+        else:
+            response = getattr(client, method)(url, data)
+        if response.streaming:
+            for _ in response.streaming_content:  # drain without keeping it
+                pass
+        problem = failure(response)
+        if problem:
+            raise RuntimeError(f"{method.upper()} {url} {problem}")
+
+    call(prepare())  # warm-up: imports, template loading
+    timings = []
+    queries = []
+    for _ in range(iterations):
+        data = prepare()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            call(data)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+
+    tracemalloc.start()
+    call(prepare())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'queries': max(queries),
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    print(f"\n{'view':<30} {'queries':>15} {'p50 ms':>19} {'p95 ms':>19}")
+    for name, now in report['results'].items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        print(
+            f"{name:<30} {before['queries']:>6} -> {now['queries']:<6}"
+            f" {before['p50_ms']:>8} -> {now['p50_ms']:<8}"
+            f" {before['p95_ms']:>8} -> {now['p95_ms']:<8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--db', help="SQLite file to seed/keep (default: a temp file)")
+    parser.add_argument('--reuse', action='store_true', help="Skip seeding; --db is already seeded")
+    parser.add_argument('--output', help="Write the JSON report here")
+    parser.add_argument('--compare', help="Print deltas against an earlier JSON report")
+    args = parser.parse_args()
+
+    if args.reuse and not (args.db and os.path.exists(args.db)):
+        parser.error("--reuse needs an existing --db")
+
+    setup_django(args.db)
+    scale = SCALES[args.scale]
+    if not args.reuse:
+        print(f"Seeding {args.scale} store...")
+        seed(scale)
+
+    from django.test import Client
+    from django.urls import reverse
+
+    client = Client()
+    rng = random.Random(42)
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'scale': args.scale,
+            'rows': scale,
+            'python': platform.python_version(),
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': {},
+    }
+    for name, method, url_name, make_data in scenarios(scale, rng):
+        url = reverse(url_name[0], args=url_name[1]) if isinstance(url_name, tuple) else reverse(url_name)
+        result = measure(client, method, url, make_data, args.iterations)
+        report['results'][name] = result
+        print(f"{name:<30} queries={result['queries']:<4} p50={result['p50_ms']:>8}ms "
+              f"p95={result['p95_ms']:>8}ms peak={result['peak_kb']:>9}KB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Shared setup for the benchmark scripts in this directory.
+
+Each benchmark runs against a throwaway SQLite database created in a temp
+directory, so the shop's own db.sqlite3 is never touched. Run the scripts from
+the project directory, e.g. ``python benchmarks/bench_sale_posting.py``.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(db_path=None, migrate=True):
+    """
+    Configure Django against a fresh SQLite file and migrate it (unless
+    `migrate` is False, e.g. in worker processes). Returns the database path.
+    """
+    if str(PROJECT_DIR) not in sys.path:
+        sys.path.insert(0, str(PROJECT_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'erp1.settings')
+
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='erp-bench-'), 'bench.sqlite3')
+
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = db_path
+    settings.DEBUG = False
+
+    import django
+    django.setup()
+
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+    return db_path
+
+
+class Timer:
+    """
+    Context manager recording wall time in milliseconds.
+    """
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.ms = (time.perf_counter() - self.start) * 1000
+
+
+class StatementCounter:
+    """
+    Context manager counting the SQL statements run on `connection`.
+
+    Unlike CaptureQueriesContext it keeps no query log, so the count stays
+    right however many statements a run makes.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.wrapper = self.connection.execute_wrapper(self)
+        self.wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.wrapper.__exit__(*exc)
@@ -5,7 +5,7 @@ from .models import *
 
 @admin.register(StockAssigned)
 class StockAssignedAdmin(admin.ModelAdmin):
-    list_display = ('item_code', 'product_name', 'company_name', 'specification')
+    list_display = ('item_code', 'product_name', 'company_name', 'specification', 'reorder_level')
     search_fields = ('item_code', 'product_name', 'company_name')
     ordering = ('item_code',)
 
@@ -0,0 +1,123 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ItemStock, ProductStockSummary, StockAlert, StockAssigned
+from .utils import chunks
+
+
+# ----------------------------------------------------
+# EXPIRY AND LOW-STOCK ALERTS
+# ----------------------------------------------------
+# `manage.py check_stock_alerts` (run daily) replaces the StockAlert rows
+# with two lists: batches with stock left that expire within N days (or
+# already have), and products whose available stock is below their
+# reorder level. The stock_alerts view only reads StockAlert.
+#
+# Neither list reads the whole batch table. Expiring batches come from a
+# range scan of the partial expire_date index, which only holds batches
+# with stock left; low stock walks the reorder_level index of the products
+# that have one and looks their totals up in ProductStockSummary.
+
+EXPIRING_FIELDS = (
+    'item_code', 'product_name', 'company_name', 'barcode_number', 'expire_date', 'available_qty',
+)
+
+
+def expiry_days():
+    return getattr(settings, 'STOCK_EXPIRY_ALERT_DAYS', 30)
+
+
+def expiring_batches(day, days):
+    """
+    Batches with stock left expiring on or before `day` + `days`, soonest
+    first.
+    """
+    return (
+        ItemStock.objects.filter(
+            available_qty__gt=0, expire_date__lte=day + datetime.timedelta(days=days)
+        )
+        .order_by('expire_date', 'pk')
+    )
+
+
+def low_stock_products():
+    """
+    Products with a reorder level and less stock available than it; a
+    product never received counts as 0 available.
+    """
+    available = ProductStockSummary.objects.filter(item_code=OuterRef('item_code')).values('available_qty')
+    return (
+        StockAssigned.objects.filter(reorder_level__gt=0)
+        .annotate(available=Coalesce(Subquery(available), Value(0)))
+        .filter(available__lt=F('reorder_level'))
+        .order_by('item_code')
+    )
+
+
+@transaction.atomic
+def refresh_alerts(day=None, days=None):
+    """
+    Replace every StockAlert with the current lists. Returns
+    {kind: alerts written}.
+    """
+    day = day or timezone.now().date()
+    days = expiry_days() if days is None else days
+    created_at = timezone.now()
+
+    StockAlert.objects.all().delete()
+    written = {StockAlert.EXPIRING: 0, StockAlert.LOW_STOCK: 0}
+
+    expiring = expiring_batches(day, days).values_list(*EXPIRING_FIELDS)
+    for chunk in chunks(expiring.iterator(chunk_size=2000), 2000):
+        written[StockAlert.EXPIRING] += len(StockAlert.objects.bulk_create([
+            StockAlert(kind=StockAlert.EXPIRING, created_at=created_at, **dict(zip(EXPIRING_FIELDS, row)))
+            for row in chunk
+        ]))
+
+    low = low_stock_products().values_list(
+        'item_code', 'product_name', 'company_name', 'available', 'reorder_level'
+    )
+    for chunk in chunks(low.iterator(chunk_size=2000), 2000):
+        written[StockAlert.LOW_STOCK] += len(StockAlert.objects.bulk_create([
+            StockAlert(
+                kind=StockAlert.LOW_STOCK, item_code=item_code, product_name=product_name,
+                company_name=company_name, available_qty=available, reorder_level=reorder_level,
+                created_at=created_at,
+            )
+            for item_code, product_name, company_name, available, reorder_level in chunk
+        ]))
+    return written
+
+
+def alert_dashboard(kinds, limit, day=None):
+    """
+    Payload of the stock_alerts view: when the alerts were computed, how
+    many there are of each kind and the first `limit` of each kind asked
+    for (expiring soonest first, low stock largest shortfall first).
+    """
+    day = day or timezone.now().date()
+    counts = dict(StockAlert.objects.values_list('kind').annotate(total=Count('id')).order_by())
+    latest = StockAlert.objects.order_by('-id').values_list('created_at', flat=True).first()
+    payload = {
+        'computed_at': latest,
+        'counts': {kind: counts.get(kind, 0) for kind, _ in StockAlert.KIND_CHOICES},
+    }
+    if StockAlert.EXPIRING in kinds:
+        payload[StockAlert.EXPIRING] = [
+            dict(row, days_left=(row['expire_date'] - day).days)
+            for row in StockAlert.objects.filter(kind=StockAlert.EXPIRING)
+            .order_by('expire_date', 'id')
+            .values(*EXPIRING_FIELDS)[:limit]
+        ]
+    if StockAlert.LOW_STOCK in kinds:
+        payload[StockAlert.LOW_STOCK] = list(
+            StockAlert.objects.filter(kind=StockAlert.LOW_STOCK)
+            .order_by(F('available_qty') - F('reorder_level'), 'item_code')
+            .values('item_code', 'product_name', 'company_name', 'available_qty', 'reorder_level')[:limit]
+        )
+    return payload
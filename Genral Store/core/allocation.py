@@ -0,0 +1,139 @@
+import datetime
+import heapq
+from collections import defaultdict, namedtuple
+
+from django.db.models import Q
+
+from .models import ItemStock
+
+
+# ----------------------------------------------------
+# FEFO / FIFO BATCH ALLOCATION
+# ----------------------------------------------------
+# A till may sell by item code instead of scanning a batch barcode. The
+# quantity is then taken from the item's open ItemStock batches, first
+# expiry first out: the batch expiring soonest goes first, batches without
+# an expiry date go last, and batches expiring on the same day go in
+# receiving order (FIFO, by primary key). A line larger than one batch is
+# split across batches.
+#
+# Batches are read through the (item_code, expire_date) index into a heap
+# per item, so every pick costs O(log n) however many batches the item has
+# open. A sale plans its picks from a plain read of the open batches as
+# tuples, then locks only the planned batches (see sales.post_sale).
+
+NO_EXPIRY = datetime.date.max
+
+# The fields planning needs; locked ItemStock rows have the same attributes
+Batch = namedtuple('Batch', 'pk item_code barcode_number expire_date available_qty')
+
+
+class BatchQueue:
+    """
+    Open batches of one item in FEFO/FIFO order, with what is left of each.
+    """
+
+    def __init__(self, batches, reserved=None):
+        reserved = reserved or {}
+        self.left = {}
+        self.heap = []
+        for batch in batches:
+            left = batch.available_qty - reserved.get(batch.pk, 0)
+            if left > 0:
+                self.left[batch.pk] = left
+                self.heap.append((batch.expire_date or NO_EXPIRY, batch.pk, batch))
+        heapq.heapify(self.heap)
+        self.available = sum(self.left.values())
+
+    def take(self, qty):
+        """
+        [(batch, qty)] covering as much of `qty` as the open batches hold;
+        the caller checks `available` first.
+        """
+        picks = []
+        while qty > 0 and self.heap:
+            _, pk, batch = self.heap[0]
+            picked = min(qty, self.left[pk])
+            picks.append((batch, picked))
+            self.left[pk] -= picked
+            self.available -= picked
+            qty -= picked
+            if self.left[pk] <= 0:
+                heapq.heappop(self.heap)
+        return picks
+
+
+def batch_queues(batches, reserved=None):
+    """
+    {item_code: BatchQueue} for the given batches; `reserved` holds
+    {pk: qty} already taken from them by scanned lines of the same sale.
+    """
+    by_item = defaultdict(list)
+    for batch in batches:
+        by_item[batch.item_code].append(batch)
+    return {item_code: BatchQueue(rows, reserved) for item_code, rows in by_item.items()}
+
+
+def open_batches(item_codes, day):
+    """
+    Filter for the batches of `item_codes` that can be sold on `day`.
+    """
+    return (
+        Q(item_code__in=item_codes, available_qty__gt=0)
+        & (Q(expire_date__isnull=True) | Q(expire_date__gte=day))
+    )
+
+
+def is_open(batch, day):
+    """
+    Whether a batch may be allocated on `day`: in stock and not expired.
+    """
+    return batch.available_qty > 0 and (batch.expire_date is None or batch.expire_date >= day)
+
+
+def read_batches(item_codes, day):
+    """
+    Open batches of `item_codes` on `day` as Batch tuples, without locking.
+    """
+    rows = ItemStock.objects.filter(open_batches(item_codes, day)).values_list(*Batch._fields)
+    return [Batch(*row) for row in rows]
+
+
+def plan_batches(quantities, scanned, day):
+    """
+    Primary keys of the batches selling {item_code: qty} on `day` would take
+    from, given the sale's scanned {(barcode, item_code): qty}. Read without
+    locks, so the plan is checked again against the locked rows.
+    """
+    batches = read_batches(quantities, day)
+    reserved = {
+        batch.pk: scanned.get((batch.barcode_number, batch.item_code), 0) for batch in batches
+    }
+    queues = batch_queues(batches, reserved)
+    planned = set()
+    for item_code, qty in quantities.items():
+        if item_code in queues:
+            planned.update(batch.pk for batch, _ in queues[item_code].take(qty))
+    return planned
+
+
+def item_availability(item_code, day=None):
+    """
+    What a till selling `item_code` by code sees: the product, the stock
+    left across its open batches and the sale rate of the batch that goes
+    first. None when nothing can be sold.
+    """
+    day = day or datetime.date.today()
+    queue = BatchQueue(read_batches([item_code], day))
+    if not queue.heap:
+        return None
+    first = ItemStock.objects.get(pk=queue.heap[0][1])
+    return {
+        'item_code': item_code,
+        'product_name': first.product_name,
+        'company_name': first.company_name,
+        'specification': first.specification or '',
+        'sale_rate': first.sale_rate,
+        'available_qty': queue.available,
+        'batches': len(queue.heap),
+    }
@@ -0,0 +1,206 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import ItemStock
+
+
+# ----------------------------------------------------
+# BARCODE -> STOCK SNAPSHOT CACHE
+# ----------------------------------------------------
+# Every scan at the till resolves a barcode to its ItemStock row. The cache
+# keeps a small, bounded snapshot per barcode in process memory so repeated
+# scans do not go back to the database. Views that change an ItemStock row
+# must call invalidate_on_commit() inside their transaction.
+#
+# Each worker process has its own BarcodeCache, so entries are stamped with
+# the barcode's version from the shared Django cache (see CACHES in
+# settings). A commit gives the changed barcodes new versions, which every
+# worker sees on its next read. The version is read before the row, so a
+# lookup racing a sale stores its snapshot under the old version and the
+# entry is already stale when the sale's commit bumps it.
+
+_MISSING = object()
+
+
+def version_key(barcode):
+    return f'barcode_version:{barcode}'
+
+
+def barcode_versions(barcodes):
+    """
+    {barcode: current version}; None for a barcode never changed (or whose
+    version has expired).
+    """
+    versions = cache.get_many([version_key(barcode) for barcode in barcodes])
+    return {barcode: versions.get(version_key(barcode)) for barcode in barcodes}
+
+
+def bump_versions(barcodes):
+    """
+    Give the barcodes new versions, making every worker's entries stale.
+    """
+    version = uuid.uuid4().hex
+    # Outlives any entry stamped with the previous version
+    cache.set_many({version_key(barcode): version for barcode in barcodes}, barcode_cache.ttl * 2)
+
+
+def stock_snapshot(stock):
+    """
+    Build the cached representation of an ItemStock row (None if not found).
+    """
+    if stock is None:
+        return None
+    return {
+        'item_code': stock.item_code,
+        'product_name': stock.product_name,
+        'company_name': stock.company_name,
+        'specification': stock.specification or '',
+        'sale_rate': stock.sale_rate,
+        'available_qty': stock.available_qty,
+    }
+
+
+class BarcodeCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL and hit/miss counters.
+    """
+
+    def __init__(self, max_size=5000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, barcode, default=_MISSING, version=None):
+        """
+        Return the cached snapshot for a barcode, or `default` on a miss.
+        A cached None means "barcode is known not to exist". An entry stored
+        under another `version` is a miss.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(barcode)
+            if entry is None or entry[0] < now or entry[1] != version:
+                if entry is not None:
+                    del self._data[barcode]
+                self.misses += 1
+                return default
+            self._data.move_to_end(barcode)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, barcode, snapshot, version=None):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[barcode] = (expires, version, snapshot)
+            self._data.move_to_end(barcode)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *barcodes):
+        with self._lock:
+            for barcode in barcodes:
+                self._data.pop(barcode, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+barcode_cache = BarcodeCache(
+    max_size=getattr(settings, 'BARCODE_CACHE_SIZE', 5000),
+    ttl=getattr(settings, 'BARCODE_CACHE_TTL', 300),
+)
+
+
+def lookup_barcode(barcode):
+    """
+    Return the stock snapshot for a barcode, loading it on a cache miss.
+    """
+    version = cache.get(version_key(barcode))
+    snapshot = barcode_cache.get(barcode, version=version)
+    if snapshot is _MISSING:
+        snapshot = stock_snapshot(
+            ItemStock.objects.filter(barcode_number=barcode).first()
+        )
+        barcode_cache.set(barcode, snapshot, version)
+    return snapshot
+
+
+async def alookup_barcode(barcode):
+    """
+    lookup_barcode() for async views; a miss is loaded with the async ORM.
+    """
+    version = await cache.aget(version_key(barcode))
+    snapshot = barcode_cache.get(barcode, version=version)
+    if snapshot is _MISSING:
+        snapshot = stock_snapshot(
+            await ItemStock.objects.filter(barcode_number=barcode).afirst()
+        )
+        barcode_cache.set(barcode, snapshot, version)
+    return snapshot
+
+
+def lookup_barcodes(barcodes):
+    """
+    {barcode: snapshot} for a burst of scans; every barcode not in the cache
+    is loaded by one IN query.
+    """
+    snapshots = {}
+    missing = []
+    versions = barcode_versions(list(dict.fromkeys(barcodes)))
+    for barcode, version in versions.items():
+        snapshot = barcode_cache.get(barcode, version=version)
+        if snapshot is _MISSING:
+            missing.append(barcode)
+        else:
+            snapshots[barcode] = snapshot
+
+    if missing:
+        # Same row lookup_barcode() would pick: the first batch by pk
+        stocks = {}
+        for stock in ItemStock.objects.filter(barcode_number__in=missing).order_by('pk'):
+            stocks.setdefault(stock.barcode_number, stock)
+        for barcode in missing:
+            snapshots[barcode] = stock_snapshot(stocks.get(barcode))
+            barcode_cache.set(barcode, snapshots[barcode], versions[barcode])
+    return snapshots
+
+
+def invalidate_on_commit(barcodes):
+    """
+    Drop the given barcodes from the cache of every worker once the current
+    transaction commits, so a rolled-back sale never leaves the cache ahead
+    of the database.
+    """
+    barcodes = [b for b in set(barcodes) if b]
+    if barcodes:
+        def invalidate():
+            bump_versions(barcodes)
+            barcode_cache.invalidate(*barcodes)
+
+        transaction.on_commit(invalidate)
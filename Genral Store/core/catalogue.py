@@ -0,0 +1,174 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import ItemStock, StockAssigned, VenderDetails
+
+
+# ----------------------------------------------------
+# PRODUCT CATALOGUE PAGES
+# ----------------------------------------------------
+# The products page fetches the catalogue in pages of JSON instead of
+# rendering every StockAssigned row. Pages are keyset-paginated on item_code
+# (unique, so already indexed): the client passes the last item_code it has
+# and the next page starts right after it, so page 500 costs the same as
+# page 1.
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+PRODUCT_COUNT_KEY = 'catalogue:product_count'
+
+PRODUCT_FIELDS = ('id', 'item_code', 'product_name', 'company_name', 'specification')
+VENDOR_FIELDS = ('id', 'vender_code', 'vender_name', 'company_name')
+
+
+def search_filter(query):
+    """
+    Item code prefix, or product/company name containing the query.
+    """
+    return (
+        Q(item_code__istartswith=query)
+        | Q(product_name__icontains=query)
+        | Q(company_name__icontains=query)
+    )
+
+
+def product_page(query='', after=None, limit=PAGE_SIZE):
+    """
+    One page of products ordered by item_code.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    products = StockAssigned.objects.order_by('item_code')
+    if query:
+        products = products.filter(search_filter(query))
+    if after:
+        products = products.filter(item_code__gt=after)
+
+    # One extra row tells us whether another page exists
+    rows = list(products.values(*PRODUCT_FIELDS)[:limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1]['item_code']
+    return rows, None
+
+
+def product_count():
+    """
+    Number of products, cached until a product is added or deleted.
+
+    PRODUCT_COUNT_TTL bounds how stale the count can get when products are
+    changed outside the views (admin, imports).
+    """
+    count = cache.get(PRODUCT_COUNT_KEY)
+    if count is None:
+        count = StockAssigned.objects.count()
+        cache.set(PRODUCT_COUNT_KEY, count, getattr(settings, 'PRODUCT_COUNT_TTL', 300))
+    return count
+
+
+# ----------------------------------------------------
+# TYPEAHEAD SUGGESTIONS
+# ----------------------------------------------------
+# The stock receiving screen asks for a handful of matching products or
+# vendors as the user types instead of embedding the whole catalogue.
+# Prefix matches on code or name come first, then substring matches.
+# Results are cached per query; adding, editing or deleting a product or
+# vendor bumps a generation number that is part of every cache key.
+
+TYPEAHEAD_LIMIT = 20
+MAX_TYPEAHEAD_LIMIT = 50
+
+# kind -> (model, code field, name field, other substring fields, returned fields)
+TYPEAHEAD = {
+    'products': (StockAssigned, 'item_code', 'product_name', ('company_name',), PRODUCT_FIELDS),
+    'vendors': (VenderDetails, 'vender_code', 'vender_name', ('company_name',), VENDOR_FIELDS),
+}
+
+
+def generation_key(kind):
+    return f'catalogue:{kind}:generation'
+
+
+def suggestions(kind, query, limit=TYPEAHEAD_LIMIT):
+    """
+    Up to `limit` rows of `kind` ('products' or 'vendors') matching `query`.
+    """
+    limit = max(1, min(limit, MAX_TYPEAHEAD_LIMIT))
+    query = query.strip().lower()
+    generation = cache.get_or_set(generation_key(kind), 0, None)
+    digest = hashlib.md5(query.encode()).hexdigest()
+    key = f'catalogue:{kind}:{generation}:{limit}:{digest}'
+    rows = cache.get(key)
+    if rows is None:
+        rows = find_suggestions(kind, query, limit)
+        cache.set(key, rows, getattr(settings, 'TYPEAHEAD_CACHE_TTL', 60))
+    return rows
+
+
+def find_suggestions(kind, query, limit):
+    model, code, name, others, fields = TYPEAHEAD[kind]
+    rows = model.objects.order_by(code)
+    if not query:
+        return list(rows.values(*fields)[:limit])
+
+    prefix = Q(**{f'{code}__istartswith': query}) | Q(**{f'{name}__istartswith': query})
+    found = list(rows.filter(prefix).values(*fields)[:limit])
+    if len(found) < limit:
+        substring = Q(**{f'{name}__icontains': query})
+        for field in others:
+            substring |= Q(**{f'{field}__icontains': query})
+        found += rows.filter(substring).exclude(prefix).values(*fields)[:limit - len(found)]
+    return found
+
+
+def resolve_barcode(code):
+    """
+    What the receiving screen scanned, or None if unknown:
+
+    - a barcode already in stock: its product, flagged already_received,
+      since a batch barcode is received only once;
+    - a product's item code: the product with the rates its last batch
+      was received at, to receive a new batch of it.
+    """
+    stock = (
+        ItemStock.objects.filter(barcode_number=code)
+        .order_by('-id')
+        .values('item_code', 'rate', 'sale_rate')
+        .first()
+    )
+    item_code = stock['item_code'] if stock else code
+    product = StockAssigned.objects.filter(item_code=item_code).values(*PRODUCT_FIELDS).first()
+    if product is None:
+        return None
+    if stock is not None:
+        return dict(product, barcode_number=code, rate=stock['rate'], sale_rate=stock['sale_rate'],
+                    already_received=True)
+
+    last = (
+        ItemStock.objects.filter(item_code=item_code)
+        .order_by('-id')
+        .values('rate', 'sale_rate')
+        .first()
+    ) or {'rate': 0, 'sale_rate': 0}
+    return dict(product, barcode_number='', already_received=False, **last)
+
+
+def invalidate_catalogue(kind):
+    """
+    Once the current transaction commits, drop cached suggestions for `kind`
+    (and the product count).
+    """
+    def invalidate():
+        try:
+            cache.incr(generation_key(kind))
+        except ValueError:
+            cache.set(generation_key(kind), 1, None)
+        if kind == 'products':
+            cache.delete(PRODUCT_COUNT_KEY)
+
+    transaction.on_commit(invalidate)
@@ -0,0 +1,271 @@
+import csv
+
+from django.db import models
+from django.utils.dateparse import parse_date
+
+from .models import ItemStock, SaleDetail, SaleReturn, StockReceivingDetail, stockreceving
+from .utils import chunks
+
+
+# ----------------------------------------------------
+# DATA EXPORTS
+# ----------------------------------------------------
+# Sales, returns, stock and receiving are exported as flat rows (document
+# header columns repeated on every line). Rows are read with
+# values_list().iterator(), so memory use stays the same however many rows
+# the export has; CSV and Parquet are produced chunk by chunk as the rows
+# arrive.
+
+CHUNK_SIZE = 2000
+
+
+class ExportError(Exception):
+    """
+    Raised for an unknown export or format, a malformed date or a missing
+    optional package.
+    """
+
+
+def export_period(start, end):
+    """
+    The optional first and last day of an export as dates; a value given
+    but not a valid YYYY-MM-DD date raises ExportError.
+    """
+    days = []
+    for value in (start, end):
+        try:
+            day = parse_date(value or '')
+        except ValueError:
+            day = None
+        if value and day is None:
+            raise ExportError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+        days.append(day)
+    return tuple(days)
+
+
+def sales_rows(start=None, end=None):
+    rows = SaleDetail.objects.order_by('sale__sale_date', 'sale_id', 'id')
+    if start:
+        rows = rows.filter(sale__sale_date__gte=start)
+    if end:
+        rows = rows.filter(sale__sale_date__lte=end)
+    return rows
+
+
+def returns_rows(start=None, end=None):
+    rows = SaleReturn.objects.order_by('return_detail__return_date', 'return_detail_id', 'id')
+    if start:
+        rows = rows.filter(return_detail__return_date__gte=start)
+    if end:
+        rows = rows.filter(return_detail__return_date__lte=end)
+    return rows
+
+
+def stock_rows(start=None, end=None):
+    # ItemStock has no date of its own; filter on its receiving order's date
+    rows = ItemStock.objects.order_by('id')
+    if start or end:
+        orders = stockreceving.objects.all()
+        if start:
+            orders = orders.filter(order_date__gte=start)
+        if end:
+            orders = orders.filter(order_date__lte=end)
+        rows = rows.filter(order_number__in=orders.values('order_number'))
+    return rows
+
+
+def receiving_rows(start=None, end=None):
+    rows = StockReceivingDetail.objects.order_by('order_date', 'id')
+    if start:
+        rows = rows.filter(order_date__gte=start)
+    if end:
+        rows = rows.filter(order_date__lte=end)
+    return rows
+
+
+# name -> (rows for a date range, [(column header, field lookup)])
+EXPORTS = {
+    'sales': (sales_rows, [
+        ('sale_number', 'sale__sale_number'),
+        ('sale_date', 'sale__sale_date'),
+        ('customer_name', 'sale__customer_name'),
+        ('customer_contact', 'sale__customer_contact'),
+        ('sale_total_amount', 'sale__total_amount'),
+        ('barcode_number', 'barcode_number'),
+        ('item_code', 'item_code'),
+        ('product_name', 'product_name'),
+        ('company_name', 'company_name'),
+        ('specification', 'specification'),
+        ('qty', 'qty'),
+        ('sale_rate', 'sale_rate'),
+        ('amount', 'amount'),
+    ]),
+    'returns': (returns_rows, [
+        ('return_number', 'return_detail__return_number'),
+        ('return_date', 'return_detail__return_date'),
+        ('sale_number', 'return_detail__sale_number'),
+        ('sale_date', 'return_detail__sale_date'),
+        ('customer_name', 'return_detail__customer_name'),
+        ('reason_for_return', 'return_detail__reason_for_return'),
+        ('amount_refunded', 'return_detail__amount_refunded'),
+        ('barcode_number', 'barcode_number'),
+        ('description', 'description'),
+        ('specification', 'specification'),
+        ('qty', 'qty'),
+        ('sale_amount', 'sale_amount'),
+        ('total_amount', 'total_amount'),
+    ]),
+    'stock': (stock_rows, [
+        ('order_number', 'order_number'),
+        ('vender_code', 'vender_code'),
+        ('item_code', 'item_code'),
+        ('product_name', 'product_name'),
+        ('company_name', 'company_name'),
+        ('specification', 'specification'),
+        ('barcode_number', 'barcode_number'),
+        ('total_qty', 'total_qty'),
+        ('sale_qty', 'sale_qty'),
+        ('sale_return_qty', 'sale_return_qty'),
+        ('stock_return_qty', 'stock_return_qty'),
+        ('available_qty', 'available_qty'),
+        ('rate', 'rate'),
+        ('sale_rate', 'sale_rate'),
+        ('expire_date', 'expire_date'),
+    ]),
+    'receiving': (receiving_rows, [
+        ('order_number', 'order_number'),
+        ('order_date', 'order_date'),
+        ('vender_code', 'vender__vender_code'),
+        ('vender_name', 'vender__vender_name'),
+        ('item_code', 'product__item_code'),
+        ('product_name', 'product__product_name'),
+        ('barcode_number', 'barcode_number'),
+        ('qty', 'qty'),
+        ('rate', 'rate'),
+        ('sale_rate', 'sale_rate'),
+        ('expire_date', 'expire_date'),
+    ]),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def export_rows(name, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """
+    (columns, row tuples) of an export, where columns are (header, model
+    field) pairs; rows are fetched lazily.
+    """
+    if name not in EXPORTS:
+        raise ExportError(f"Unknown export '{name}'.")
+    queryset, columns = EXPORTS[name]
+    rows = queryset(start, end)
+    fields = [lookup_field(rows.model, lookup) for _, lookup in columns]
+    rows = rows.values_list(*[lookup for _, lookup in columns])
+    return list(zip([header for header, _ in columns], fields)), rows.iterator(chunk_size=chunk_size)
+
+
+def lookup_field(model, lookup):
+    """
+    The model field a `a__b__c` lookup ends on.
+    """
+    *relations, name = lookup.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+class Echo:
+    """
+    File-like object whose write() returns the value, for streaming csv.writer.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([header for header, _ in columns])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+class BufferSink:
+    """
+    Write-only sink collecting what pyarrow writes until it is drained.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_type(pa, field):
+    if isinstance(field, models.DecimalField):
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, models.DateField):
+        return pa.date32()
+    if isinstance(field, models.IntegerField):
+        return pa.int64()
+    return pa.string()
+
+
+def parquet_chunks(columns, rows, chunk_size=CHUNK_SIZE):
+    """
+    A Parquet file as an iterator of byte pieces, one row group per
+    `chunk_size` rows (needs pyarrow).
+    """
+    # Imported here (not in the generator) so a missing package is reported
+    # before a response has started streaming
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet exports need the 'pyarrow' package; export CSV instead.")
+
+    schema = pa.schema([(header, parquet_type(pa, field)) for header, field in columns])
+
+    def pieces():
+        sink = BufferSink()
+        writer = pq.ParquetWriter(sink, schema)
+        for chunk in chunks(rows, chunk_size):
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=column.type) for values, column in zip(zip(*chunk), schema)],
+                schema=schema,
+            ))
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+    return pieces()
+
+
+def export_chunks(name, fmt, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """
+    The export `name` in format `fmt` as an iterator of str (CSV) or bytes
+    (Parquet) pieces.
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format '{fmt}'.")
+    columns, rows = export_rows(name, start, end, chunk_size)
+    if fmt == 'parquet':
+        return parquet_chunks(columns, rows, chunk_size)
+    return csv_chunks(columns, rows)
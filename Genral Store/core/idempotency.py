@@ -0,0 +1,58 @@
+from django.db import IntegrityError, transaction
+
+from .models import IdempotencyKey
+
+
+# ----------------------------------------------------
+# IDEMPOTENT SUBMISSIONS
+# ----------------------------------------------------
+# The sale and return forms carry a token generated when the page is
+# rendered. A double click or a browser retry submits the same token again.
+#
+# The view claims the token first thing inside the transaction that writes
+# the document. The unique (scope, key) constraint lets only one submission
+# through: a concurrent duplicate waits on the first one's insert, then hits
+# the constraint, and everything it did rolls back. A retry that arrives
+# after the document committed finds the token before starting any work.
+
+
+class DuplicateSubmission(Exception):
+    """
+    Raised when a token was already used; carries the document it produced.
+    """
+
+    def __init__(self, document_number):
+        super().__init__(f"Already recorded as {document_number}.")
+        self.document_number = document_number
+
+
+def completed_document(scope, key):
+    """
+    Number of the document already recorded for `key`, or None.
+    """
+    if not key:
+        return None
+    return (
+        IdempotencyKey.objects.filter(scope=scope, key=key)
+        .values_list('document_number', flat=True)
+        .first()
+    )
+
+
+def claim(scope, key, document_number):
+    """
+    Record that `key` produces `document_number`; call it inside the
+    transaction that writes the document. Raises DuplicateSubmission if
+    another submission of `key` committed first. A blank key is not
+    tracked.
+    """
+    if not key:
+        return
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(scope=scope, key=key, document_number=document_number)
+    except IntegrityError:
+        existing = completed_document(scope, key)
+        if existing is None:
+            raise
+        raise DuplicateSubmission(existing)
@@ -0,0 +1,221 @@
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger('core.requests')
+
+
+# ----------------------------------------------------
+# REQUEST / QUERY INSTRUMENTATION
+# ----------------------------------------------------
+# RequestStatsMiddleware times every request and, through
+# connection.execute_wrapper, counts the queries it runs and the time spent
+# in the database. Each request is logged to the `core.requests` logger;
+# slow requests and requests repeating one statement many times (the N+1
+# pattern) are logged as warnings. Totals and a latency histogram per view
+# are kept in process memory and served by the request_stats view.
+#
+# Only the work done before the response is returned is measured; the
+# chunks of a streaming response (exports) are produced afterwards.
+
+# Upper bounds (ms) of the latency histogram buckets; the last is open-ended
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class QueryRecorder:
+    """
+    execute_wrapper counting statements, database time and how often each
+    distinct SQL text ran.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def repeated(self, threshold):
+        """
+        (sql, times) of the most repeated statement if it ran `threshold`
+        times or more, else None.
+        """
+        if not self.statements:
+            return None
+        sql, times = self.statements.most_common(1)[0]
+        return (sql, times) if times >= threshold else None
+
+
+class ViewStats:
+    """
+    Totals and latency histogram of one view.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.slow = 0
+        self.n_plus_one = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, elapsed_ms, queries, db_ms, status, slow, n_plus_one):
+        self.requests += 1
+        self.errors += status >= 500
+        self.slow += slow
+        self.n_plus_one += n_plus_one
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.db_ms += db_ms
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def as_dict(self):
+        labels = [f'<={bound}ms' for bound in LATENCY_BUCKETS] + [f'>{LATENCY_BUCKETS[-1]}ms']
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'slow': self.slow,
+            'n_plus_one': self.n_plus_one,
+            'avg_ms': round(self.total_ms / self.requests, 2),
+            'max_ms': round(self.max_ms, 2),
+            'avg_queries': round(self.queries / self.requests, 2),
+            'max_queries': self.max_queries,
+            'avg_db_ms': round(self.db_ms / self.requests, 2),
+            'histogram': dict(zip(labels, self.buckets)),
+        }
+
+
+class RequestStats:
+    """
+    Thread-safe per-view aggregates of the instrumented requests.
+    """
+
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def add(self, view, *args):
+        with self._lock:
+            self._views.setdefault(view, ViewStats()).add(*args)
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {view: stats.as_dict() for view, stats in sorted(self._views.items())}
+
+
+stats_by_view = RequestStats()
+
+
+@contextmanager
+def recording(recorder):
+    """
+    Install `recorder` on every database connection of the current thread.
+    """
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+class RequestStatsMiddleware:
+    """
+    Log and aggregate latency, query count and database time per request.
+    Works in both the WSGI and the ASGI deployment.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with recording(recorder):
+            response = self.get_response(request)
+        return self.record(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        # Connections are per thread and the async ORM runs its queries in
+        # the request's thread-sensitive worker thread, so the recorder is
+        # installed (and removed) there
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(stack.enter_context)(recording(recorder))
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.record(request, response, recorder, start)
+
+    def record(self, request, response, recorder, start):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        db_ms = recorder.time * 1000
+
+        slow = elapsed_ms >= getattr(settings, 'SLOW_REQUEST_MS', 500)
+        repeated = recorder.repeated(getattr(settings, 'N_PLUS_ONE_THRESHOLD', 10))
+        view = view_name(request)
+        stats_by_view.add(view, elapsed_ms, recorder.count, db_ms, response.status_code,
+                          slow, repeated is not None)
+
+        tags = (['slow'] if slow else []) + (['n+1'] if repeated else [])
+        detail = f' ({repeated[1]}x {repeated[0][:200]})' if repeated else ''
+        logger.log(
+            logging.WARNING if tags else logging.INFO,
+            '%s %s %s %s %.1fms queries=%d db=%.1fms%s%s',
+            request.method, request.path, view, response.status_code, elapsed_ms,
+            recorder.count, db_ms, ''.join(f' [{tag}]' for tag in tags), detail,
+            extra={
+                'view': view,
+                'status': response.status_code,
+                'elapsed_ms': round(elapsed_ms, 2),
+                'queries': recorder.count,
+                'db_ms': round(db_ms, 2),
+                'tags': tags,
+                'repeated_sql': repeated[0] if repeated else None,
+            },
+        )
+
+        response['Server-Timing'] = f'app;dur={elapsed_ms:.1f}, db;dur={db_ms:.1f}'
+        return response
@@ -0,0 +1,152 @@
+from django.db import connection, transaction
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .models import ItemStock, StockMovement, StockSnapshot
+from .utils import chunks
+
+
+# ----------------------------------------------------
+# STOCK MOVEMENT LEDGER
+# ----------------------------------------------------
+# Every receiving, sale and return appends StockMovement rows next to the
+# ItemStock counters. take_snapshot() periodically folds the new movements
+# into StockSnapshot balances, so a point-in-time balance is one snapshot
+# plus the short tail of movements recorded after it.
+#
+# A snapshot covers every movement up to its last_movement_id, so it may
+# only be taken up to an id below which nothing can still commit (see
+# settled_movement_id); a movement committing later with a lower id would
+# otherwise be left out of every snapshot.
+
+
+def record_movements(kind, reference, quantities):
+    """
+    Append one movement per (barcode, item_code) -> signed qty entry.
+    Returns the number of movements written.
+    """
+    return len(StockMovement.objects.bulk_create([
+        StockMovement(
+            barcode_number=barcode,
+            item_code=item_code,
+            kind=kind,
+            qty=qty,
+            reference=reference or '',
+        )
+        for (barcode, item_code), qty in quantities.items()
+        if qty
+    ]))
+
+
+def latest_snapshots(barcodes=None, before=None):
+    """
+    {barcode: StockSnapshot} of the newest snapshot per barcode.
+    """
+    candidates = StockSnapshot.objects.filter(barcode_number=OuterRef('barcode_number'))
+    if before is not None:
+        candidates = candidates.filter(taken_at__lte=before)
+    newest = candidates.order_by('-taken_at', '-id').values('id')[:1]
+
+    snapshots = StockSnapshot.objects.filter(id=Subquery(newest))
+    if barcodes is not None:
+        snapshots = snapshots.filter(barcode_number__in=barcodes)
+    return {snapshot.barcode_number: snapshot for snapshot in snapshots}
+
+
+def settled_movement_id():
+    """
+    Highest StockMovement id at or below which every movement has committed.
+
+    On PostgreSQL a movement can commit after one with a higher id, so the
+    table is locked in SHARE mode just long enough to read the highest id:
+    the lock waits for transactions writing movements to finish and holds
+    new ones back meanwhile. SQLite commits one writer at a time, in id
+    order, so its highest id is always settled.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                table = connection.ops.quote_name(StockMovement._meta.db_table)
+                cursor.execute(f'LOCK TABLE {table} IN SHARE MODE')
+        return StockMovement.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+def take_snapshot():
+    """
+    Fold every movement recorded since the previous run into new snapshots.
+
+    Only barcodes that moved get a new row. Returns the number of snapshots
+    written.
+    """
+    # Read before the fold's transaction, so the lock is released at once
+    cutoff = settled_movement_id()
+    with transaction.atomic():
+        return fold_movements(cutoff)
+
+
+def fold_movements(cutoff):
+    watermark = StockSnapshot.objects.aggregate(last=Max('last_movement_id'))['last'] or 0
+    if cutoff <= watermark:
+        return 0
+
+    moved = (
+        StockMovement.objects.filter(id__gt=watermark, id__lte=cutoff)
+        .values('barcode_number', 'item_code')
+        .annotate(delta=Sum('qty'))
+        .order_by()
+    )
+    taken_at = timezone.now()
+    written = 0
+    for chunk in chunks(moved.iterator(chunk_size=500), 500):
+        previous = latest_snapshots([row['barcode_number'] for row in chunk])
+        snapshots = [
+            StockSnapshot(
+                barcode_number=row['barcode_number'],
+                item_code=row['item_code'],
+                balance=(
+                    previous[row['barcode_number']].balance
+                    if row['barcode_number'] in previous else 0
+                ) + row['delta'],
+                last_movement_id=cutoff,
+                taken_at=taken_at,
+            )
+            for row in chunk
+        ]
+        written += len(StockSnapshot.objects.bulk_create(snapshots))
+    return written
+
+
+def balance_as_of(barcode, when=None):
+    """
+    Stock balance of a barcode at `when` (default: now).
+    """
+    when = when or timezone.now()
+    snapshot = latest_snapshots([barcode], before=when).get(barcode)
+    tail = StockMovement.objects.filter(barcode_number=barcode, created_at__lte=when)
+    balance = 0
+    if snapshot:
+        tail = tail.filter(id__gt=snapshot.last_movement_id)
+        balance = snapshot.balance
+    return balance + (tail.aggregate(total=Sum('qty'))['total'] or 0)
+
+
+@transaction.atomic
+def record_opening_balances():
+    """
+    Add an ADJUST movement carrying the current available_qty for every
+    ItemStock barcode that has no movement yet (stock received before the
+    ledger existed). Returns the number of movements written.
+    """
+    tracked = StockMovement.objects.values('barcode_number')
+    untracked = (
+        ItemStock.objects.exclude(barcode_number__in=tracked)
+        .values_list('barcode_number', 'item_code', 'available_qty')
+    )
+    created = 0
+    batch = {}
+    for barcode, item_code, available_qty in untracked.iterator(chunk_size=2000):
+        batch[(barcode, item_code)] = available_qty
+        if len(batch) >= 2000:
+            created += record_movements(StockMovement.ADJUST, 'opening', batch)
+            batch = {}
+    return created + record_movements(StockMovement.ADJUST, 'opening', batch)
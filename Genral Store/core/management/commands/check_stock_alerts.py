@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.alerts import expiry_days, refresh_alerts
+from core.models import StockAlert
+
+
+class Command(BaseCommand):
+    help = "Recompute expiry and low-stock alerts. Run it daily (e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help="Alert on batches expiring within this many days (default STOCK_EXPIRY_ALERT_DAYS)."
+        )
+
+    def handle(self, *args, **options):
+        days = expiry_days() if options['days'] is None else options['days']
+        written = refresh_alerts(days=days)
+        self.stdout.write(self.style.SUCCESS(
+            f"{written[StockAlert.EXPIRING]} batches expiring within {days} days, "
+            f"{written[StockAlert.LOW_STOCK]} products below reorder level."
+        ))
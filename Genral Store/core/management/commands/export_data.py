@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exports import CHUNK_SIZE, EXPORTS, FORMATS, ExportError, export_chunks, export_period
+
+
+class Command(BaseCommand):
+    help = "Stream sales, returns, stock or receiving rows to a CSV or Parquet file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--from', dest='start', help="First day (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='end', help="Last day (YYYY-MM-DD)")
+        parser.add_argument('--output', '-o', help="File to write (default: stdout, CSV only)")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            start, end = export_period(options['start'], options['end'])
+        except ExportError as e:
+            raise CommandError(str(e))
+        if options['fmt'] == 'parquet' and not options['output']:
+            raise CommandError("Parquet exports need --output.")
+
+        try:
+            pieces = export_chunks(options['name'], options['fmt'], start, end, options['chunk_size'])
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        if not options['output']:
+            for piece in pieces:
+                self.stdout.write(piece, ending='')
+            return
+
+        if options['fmt'] == 'parquet':
+            f = open(options['output'], 'wb')
+        else:
+            f = open(options['output'], 'w', encoding='utf-8', newline='')
+        with f:
+            for piece in pieces:
+                f.write(piece)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['name']} export to {options['output']}."))
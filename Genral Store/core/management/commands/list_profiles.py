@@ -0,0 +1,60 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profiling import ProfilingError, captured_profiles, cumulative_times, module_names, profile_dir
+
+
+class Command(BaseCommand):
+    help = (
+        "List request profiles captured by ProfilingMiddleware and summarise them by "
+        "cumulative time in the functions of the given modules or packages (all of "
+        "core by default)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help="Profile directory (default: PROFILE_DIR).")
+        parser.add_argument(
+            '--module', action='append', dest='modules',
+            help="Module or package whose functions are summarised; repeat for several (default: core).",
+        )
+        parser.add_argument('--limit', type=int, default=20, help="Newest profiles to read.")
+        parser.add_argument('--top', type=int, default=10, help="Functions shown in the summary.")
+
+    def handle(self, *args, **options):
+        modules = options['modules'] or ['core']
+        try:
+            module_name = module_names(modules)
+        except ImportError as e:
+            raise CommandError(str(e))
+
+        profiles = captured_profiles(options['dir'])[:options['limit']]
+        if not profiles:
+            self.stdout.write(f"No profiles in {options['dir'] or profile_dir()}.")
+            return
+
+        totals = defaultdict(float)
+        calls = defaultdict(int)
+        for meta in profiles:
+            try:
+                times = cumulative_times(meta, module_name)
+            except (ProfilingError, OSError) as e:
+                self.stderr.write(f"{meta['name']}: {e}")
+                continue
+            slowest = max(times.items(), key=lambda item: item[1], default=None)
+            self.stdout.write(
+                f"{meta['captured_at']}  {meta['method']:<6} {meta['url']:<40} "
+                f"{meta['status']} {meta['elapsed_ms']:>9.1f}ms  {meta['profiler']:<12}"
+                + (f" {slowest[0]} {slowest[1] * 1000:.1f}ms" if slowest else '')
+            )
+            for function, seconds in times.items():
+                totals[function] += seconds
+                calls[function] += 1
+
+        self.stdout.write(f"\nCumulative time in {', '.join(modules)} over {len(profiles)} profiles:")
+        ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:options['top']]
+        for function, seconds in ranked:
+            self.stdout.write(
+                f"  {function:<48} {seconds * 1000:>10.1f}ms total  "
+                f"{seconds * 1000 / calls[function]:>9.1f}ms avg  ({calls[function]} profiles)"
+            )
@@ -0,0 +1,70 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils.dateparse import parse_date
+
+from core.models import SaleInfo, SaleReturnDetail
+from core.reports import ROLLUPS, computed_rollups
+
+
+def month_ranges(start, end):
+    """
+    (first, last) day pairs covering start..end one calendar month at a time.
+    """
+    while start <= end:
+        next_month = (start.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        yield start, min(end, next_month - datetime.timedelta(days=1))
+        start = next_month
+
+
+class Command(BaseCommand):
+    help = "Backfill or rebuild the daily sales rollups from SaleInfo/SaleDetail and returns."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help="First day (YYYY-MM-DD), default: first sale")
+        parser.add_argument('--to', dest='end', help="Last day (YYYY-MM-DD), default: last sale")
+
+    def handle(self, *args, **options):
+        start, end = self.date_range(options['start'], options['end'])
+        if start is None or end is None:
+            self.stdout.write("No sales to roll up.")
+            return
+
+        written = 0
+        # One month per transaction keeps memory and lock time bounded
+        for first, last in month_ranges(start, end):
+            with transaction.atomic():
+                for model in ROLLUPS:
+                    model.objects.filter(day__range=(first, last)).delete()
+                for model, deltas in computed_rollups(first, last).items():
+                    dimension = ROLLUPS[model]
+                    rows = [
+                        model(day=day, **({dimension: value} if dimension else {}), **delta)
+                        for (day, value), delta in deltas.items()
+                    ]
+                    written += len(model.objects.bulk_create(rows, batch_size=1000))
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} rollup rows for {start} to {end}."))
+
+    def date_range(self, start, end):
+        bounds = [
+            SaleInfo.objects.aggregate(first=Min('sale_date'), last=Max('sale_date')),
+            SaleReturnDetail.objects.aggregate(first=Min('return_date'), last=Max('return_date')),
+        ]
+        firsts = [b['first'] for b in bounds if b['first']]
+        lasts = [b['last'] for b in bounds if b['last']]
+
+        for option, value in (('--from', start), ('--to', end)):
+            try:
+                if value and parse_date(value) is None:
+                    raise ValueError
+            except ValueError:
+                raise CommandError(f"{option} must be a date (YYYY-MM-DD).")
+
+        start = parse_date(start) if start else min(firsts, default=None)
+        end = parse_date(end) if end else max(lasts, default=None)
+        if start and end and start > end:
+            raise CommandError("--from must not be after --to.")
+        return start, end
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import ProductStockSummary
+from core.stock_summary import COUNTERS, computed_summaries
+
+FIELDS = COUNTERS + ('available_qty',)
+
+
+class Command(BaseCommand):
+    help = "Rebuild ProductStockSummary from ItemStock, or check it with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Only compare the stored summary with ItemStock and report differences."
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            return self.verify()
+
+        with transaction.atomic():
+            ProductStockSummary.objects.all().delete()
+            created = 0
+            batch = []
+            for summary in computed_summaries():
+                batch.append(summary)
+                if len(batch) >= 1000:
+                    created += len(ProductStockSummary.objects.bulk_create(batch))
+                    batch = []
+            created += len(ProductStockSummary.objects.bulk_create(batch))
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stock summary for {created} products."))
+
+    def verify(self):
+        stored = {
+            row['item_code']: row
+            for row in ProductStockSummary.objects.values('item_code', *FIELDS)
+        }
+        problems = []
+        for expected in computed_summaries():
+            row = stored.pop(expected.item_code, None)
+            if row is None:
+                problems.append(f"{expected.item_code}: missing")
+                continue
+            for field in FIELDS:
+                if row[field] != getattr(expected, field):
+                    problems.append(
+                        f"{expected.item_code}: {field} is {row[field]}, expected {getattr(expected, field)}"
+                    )
+        for item_code, row in stored.items():
+            if any(row[field] for field in FIELDS):
+                problems.append(f"{item_code}: has no stock batches")
+
+        for problem in problems:
+            self.stdout.write(problem)
+        if problems:
+            raise CommandError(f"Stock summary has {len(problems)} differences.")
+        self.stdout.write(self.style.SUCCESS("Stock summary matches ItemStock."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.ledger import record_opening_balances, take_snapshot
+
+
+class Command(BaseCommand):
+    help = "Fold new stock movements into StockSnapshot balances. Run it periodically (e.g. nightly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--opening-balances', action='store_true',
+            help="First record an opening movement for stock received before the ledger existed."
+        )
+
+    def handle(self, *args, **options):
+        if options['opening_balances']:
+            created = record_opening_balances()
+            self.stdout.write(f"Recorded {created} opening balances.")
+
+        written = take_snapshot()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} stock snapshots."))
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:22
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_summaries(apps, schema_editor):
+    # Same aggregation as core.stock_summary.computed_summaries(), on the
+    # historical models, so existing stock starts with correct totals
+    ItemStock = apps.get_model('core', 'ItemStock')
+    ProductStockSummary = apps.get_model('core', 'ProductStockSummary')
+    rows = (
+        ItemStock.objects.values('item_code')
+        .annotate(
+            total_qty=Sum('total_qty'),
+            sale_qty=Sum('sale_qty'),
+            sale_return_qty=Sum('sale_return_qty'),
+            stock_return_qty=Sum('stock_return_qty'),
+            available_qty=Sum('available_qty'),
+            batch_count=Count('id'),
+        )
+        .order_by('item_code')
+    )
+    ProductStockSummary.objects.bulk_create(
+        (ProductStockSummary(**row) for row in rows.iterator(chunk_size=2000)),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_documentsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStockSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_code', models.CharField(max_length=50, unique=True)),
+                ('total_qty', models.IntegerField(default=0)),
+                ('sale_qty', models.IntegerField(default=0)),
+                ('sale_return_qty', models.IntegerField(default=0)),
+                ('stock_return_qty', models.IntegerField(default=0)),
+                ('available_qty', models.IntegerField(db_index=True, default=0)),
+                ('batch_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_productstocksummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode_number', models.CharField(max_length=50)),
+                ('item_code', models.CharField(max_length=50)),
+                ('kind', models.CharField(choices=[('receive', 'Receive'), ('sale', 'Sale'), ('sale_return', 'Sale Return'), ('stock_return', 'Stock Return'), ('adjust', 'Adjustment')], max_length=20)),
+                ('qty', models.IntegerField()),
+                ('reference', models.CharField(blank=True, default='', max_length=50)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['barcode_number', 'id'], name='core_stockm_barcode_5f6122_idx'), models.Index(fields=['created_at'], name='core_stockm_created_a48320_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode_number', models.CharField(max_length=50)),
+                ('item_code', models.CharField(max_length=50)),
+                ('balance', models.IntegerField()),
+                ('last_movement_id', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['barcode_number', 'taken_at'], name='core_stocks_barcode_555ac4_idx'), models.Index(fields=['last_movement_id'], name='core_stocks_last_mo_77c26c_idx')],
+            },
+        ),
+    ]
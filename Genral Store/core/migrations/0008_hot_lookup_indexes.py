@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_stock_movement_ledger'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='stockreceivingdetail',
+            name='core_stockr_barcode_37417b_idx',
+        ),
+        migrations.AddIndex(
+            model_name='exchangesaledetail',
+            index=models.Index(fields=['barcode_number'], name='core_exchan_barcode_22453f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemstock',
+            index=models.Index(fields=['barcode_number', 'item_code'], name='core_itemst_barcode_662da3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemstock',
+            index=models.Index(fields=['item_code'], name='core_itemst_item_co_b88950_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saleinfo',
+            index=models.Index(fields=['sale_date'], name='core_salein_sale_da_5df203_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salereturn',
+            index=models.Index(fields=['barcode_number'], name='core_salere_barcode_a720cb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salereturndetail',
+            index=models.Index(fields=['sale_number'], name='core_salere_sale_nu_c186e4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockreceving',
+            index=models.Index(fields=['order_number'], name='core_stockr_order_n_233570_idx'),
+        ),
+    ]
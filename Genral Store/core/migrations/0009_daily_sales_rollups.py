@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:34
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('sale_count', models.PositiveIntegerField(default=0)),
+                ('qty_sold', models.IntegerField(default=0)),
+                ('amount_sold', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('return_count', models.PositiveIntegerField(default=0)),
+                ('qty_returned', models.IntegerField(default=0)),
+                ('amount_returned', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyCompanySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('company_name', models.CharField(max_length=100)),
+                ('qty_sold', models.IntegerField(default=0)),
+                ('amount_sold', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('qty_returned', models.IntegerField(default=0)),
+                ('amount_returned', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'company_name'), name='unique_daily_company_sales')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyItemSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('item_code', models.CharField(max_length=50)),
+                ('qty_sold', models.IntegerField(default=0)),
+                ('amount_sold', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('qty_returned', models.IntegerField(default=0)),
+                ('amount_returned', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'item_code'), name='unique_daily_item_sales')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_daily_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='itemstock',
+            name='core_itemst_item_co_b88950_idx',
+        ),
+        migrations.AddIndex(
+            model_name='itemstock',
+            index=models.Index(fields=['item_code', 'expire_date'], name='core_itemst_item_co_d2ff2b_idx'),
+        ),
+    ]
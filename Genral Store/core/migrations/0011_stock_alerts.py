@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_itemstock_fefo_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('expiring', 'Expiring'), ('low_stock', 'Low Stock')], max_length=20)),
+                ('item_code', models.CharField(max_length=50)),
+                ('product_name', models.CharField(max_length=100)),
+                ('company_name', models.CharField(max_length=100)),
+                ('barcode_number', models.CharField(blank=True, default='', max_length=50)),
+                ('expire_date', models.DateField(blank=True, null=True)),
+                ('available_qty', models.IntegerField()),
+                ('reorder_level', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='stockassigned',
+            name='reorder_level',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='itemstock',
+            index=models.Index(condition=models.Q(('available_qty__gt', 0)), fields=['expire_date'], name='itemstock_open_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockassigned',
+            index=models.Index(fields=['reorder_level'], name='core_stocka_reorder_fe7b96_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockalert',
+            index=models.Index(fields=['kind', 'expire_date'], name='core_stocka_kind_5ef6dd_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleinfo',
+            name='client_reference',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.core.validators import MinValueValidator
 from decimal import Decimal
+from django.utils import timezone
 
 
 class StockAssigned(models.Model):
@@ -8,12 +9,17 @@ class StockAssigned(models.Model):
     product_name = models.CharField(max_length=100)
     company_name = models.CharField(max_length=100)
     specification = models.CharField(max_length=255, blank=True, null=True)
+    # Raise a low-stock alert when available stock drops below this (0 = never)
+    reorder_level = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.item_code} - {self.product_name}"
 
     class Meta:
         ordering = ['item_code']
+        indexes = [
+            models.Index(fields=['reorder_level']),
+        ]
 
 
 class VenderDetails(models.Model):
@@ -36,6 +42,11 @@ class stockreceving(models.Model):
     total_qty= models.PositiveIntegerField(validators=[MinValueValidator(0)])
     total_amount= models.DecimalField(max_digits=14, decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))])
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_number']),
+        ]
+
 
 
 class StockReceivingDetail(models.Model):
@@ -54,9 +65,9 @@ class StockReceivingDetail(models.Model):
         return f"{self.order_number} - {self.product.product_name}"
 
     class Meta:
+        # barcode_number is already indexed by its unique constraint
         indexes = [
             models.Index(fields=['order_number']),
-            models.Index(fields=['barcode_number']),
         ]
 
 
@@ -90,6 +101,20 @@ class ItemStock(models.Model):
         )
         super().save(*args, **kwargs)
 
+    class Meta:
+        # (barcode_number, item_code) also serves lookups by barcode alone;
+        # (item_code, expire_date) serves lookups by item and FEFO allocation;
+        # the partial expire_date index only holds batches with stock left,
+        # for the expiry alerts
+        indexes = [
+            models.Index(fields=['barcode_number', 'item_code']),
+            models.Index(fields=['item_code', 'expire_date']),
+            models.Index(
+                fields=['expire_date'], condition=models.Q(available_qty__gt=0),
+                name='itemstock_open_expiry_idx',
+            ),
+        ]
+
 
 
 
@@ -134,6 +159,11 @@ class SaleReturnDetail(models.Model):
     def __str__(self):
         return self.return_number
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sale_number']),
+        ]
+
 
 
 class SaleReturn(models.Model):
@@ -152,6 +182,11 @@ class SaleReturn(models.Model):
     sale_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['barcode_number']),
+        ]
+
 
 
 class ExchangeSale(models.Model):
@@ -176,6 +211,11 @@ class ExchangeSaleDetail(models.Model):
     qty = models.PositiveIntegerField(validators=[MinValueValidator(0)])
     amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))])
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['barcode_number']),
+        ]
+
 
 
 class SaleInfo(models.Model):
@@ -193,10 +233,18 @@ class SaleInfo(models.Model):
     cash_return = models.DecimalField(
         max_digits=14, decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))]
     )
+    # Set by the till for sales recorded offline, so a re-sent sale is not
+    # posted twice; see core.offline
+    client_reference = models.CharField(max_length=64, unique=True, blank=True, null=True)
 
     def __str__(self):
         return self.sale_number
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sale_date']),
+        ]
+
 
 class SaleDetail(models.Model):
     sale = models.ForeignKey(SaleInfo, on_delete=models.CASCADE, related_name='details')
@@ -217,3 +265,184 @@ class SaleDetail(models.Model):
         return f"{self.product_name} ({self.item_code})"
 
     
+
+
+
+class DocumentSequence(models.Model):
+    # One row per document type; see core.sequences for how numbers are handed out.
+    name = models.CharField(max_length=30, unique=True)
+    next_value = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+
+class ProductStockSummary(models.Model):
+    # Running per-product totals over all ItemStock batches, kept in sync by
+    # core.stock_summary; migration 0006 fills it from existing stock, and
+    # `manage.py rebuild_stock_summary` rebuilds it.
+    item_code = models.CharField(max_length=50, unique=True)
+    total_qty = models.IntegerField(default=0)
+    sale_qty = models.IntegerField(default=0)
+    sale_return_qty = models.IntegerField(default=0)
+    stock_return_qty = models.IntegerField(default=0)
+    available_qty = models.IntegerField(default=0, db_index=True)
+    batch_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.item_code}: {self.available_qty}"
+
+
+
+class StockMovement(models.Model):
+    # Append-only ledger of every stock change; see core.ledger.
+    RECEIVE = 'receive'
+    SALE = 'sale'
+    SALE_RETURN = 'sale_return'
+    STOCK_RETURN = 'stock_return'
+    ADJUST = 'adjust'
+    KIND_CHOICES = [
+        (RECEIVE, 'Receive'),
+        (SALE, 'Sale'),
+        (SALE_RETURN, 'Sale Return'),
+        (STOCK_RETURN, 'Stock Return'),
+        (ADJUST, 'Adjustment'),
+    ]
+
+    barcode_number = models.CharField(max_length=50)
+    item_code = models.CharField(max_length=50)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    qty = models.IntegerField()  # signed: positive adds stock, negative removes it
+    reference = models.CharField(max_length=50, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.kind} {self.barcode_number} {self.qty:+d}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['barcode_number', 'id']),
+            models.Index(fields=['created_at']),
+        ]
+
+
+class StockSnapshot(models.Model):
+    # Balance of a barcode after folding in every movement up to last_movement_id.
+    barcode_number = models.CharField(max_length=50)
+    item_code = models.CharField(max_length=50)
+    balance = models.IntegerField()
+    last_movement_id = models.BigIntegerField()
+    taken_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.barcode_number} @ {self.taken_at}: {self.balance}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['barcode_number', 'taken_at']),
+            models.Index(fields=['last_movement_id']),
+        ]
+
+
+# Daily sales rollups, kept current by core.reports at sale/return time.
+# Amounts are line amounts (qty x sale rate); returns count on the return date.
+
+class DailySalesTotal(models.Model):
+    day = models.DateField(unique=True)
+    sale_count = models.PositiveIntegerField(default=0)
+    qty_sold = models.IntegerField(default=0)
+    amount_sold = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    return_count = models.PositiveIntegerField(default=0)
+    qty_returned = models.IntegerField(default=0)
+    amount_returned = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+
+    def __str__(self):
+        return f"{self.day}: {self.amount_sold}"
+
+
+class DailyItemSales(models.Model):
+    day = models.DateField()
+    item_code = models.CharField(max_length=50)
+    qty_sold = models.IntegerField(default=0)
+    amount_sold = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    qty_returned = models.IntegerField(default=0)
+    amount_returned = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+
+    def __str__(self):
+        return f"{self.day} {self.item_code}: {self.qty_sold}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'item_code'], name='unique_daily_item_sales'),
+        ]
+
+
+class DailyCompanySales(models.Model):
+    day = models.DateField()
+    company_name = models.CharField(max_length=100)
+    qty_sold = models.IntegerField(default=0)
+    amount_sold = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    qty_returned = models.IntegerField(default=0)
+    amount_returned = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+
+    def __str__(self):
+        return f"{self.day} {self.company_name}: {self.qty_sold}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'company_name'], name='unique_daily_company_sales'),
+        ]
+
+
+class StockAlert(models.Model):
+    # Written by `manage.py check_stock_alerts`; see core.alerts.
+    EXPIRING = 'expiring'
+    LOW_STOCK = 'low_stock'
+    KIND_CHOICES = [
+        (EXPIRING, 'Expiring'),
+        (LOW_STOCK, 'Low Stock'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    item_code = models.CharField(max_length=50)
+    product_name = models.CharField(max_length=100)
+    company_name = models.CharField(max_length=100)
+    barcode_number = models.CharField(max_length=50, blank=True, default='')  # expiring batches only
+    expire_date = models.DateField(blank=True, null=True)
+    available_qty = models.IntegerField()
+    reorder_level = models.PositiveIntegerField(blank=True, null=True)  # low stock only
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.kind} {self.barcode_number or self.item_code}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'expire_date']),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    # Token a form submits with a sale or return, and the document it
+    # produced; a resubmission of the token gets that document back. See
+    # core.idempotency.
+    SALE = 'sale'
+    RETURN = 'return'
+    SCOPE_CHOICES = [
+        (SALE, 'Sale'),
+        (RETURN, 'Return'),
+    ]
+
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES)
+    key = models.CharField(max_length=64)
+    document_number = models.CharField(max_length=50)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.scope} {self.key}: {self.document_number}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_key'),
+        ]
@@ -0,0 +1,178 @@
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.utils.dateparse import parse_date
+
+from .ledger import settled_movement_id
+from .models import ItemStock, SaleInfo, StockMovement
+from .pricing import price_lines, sale_rates
+from .sales import SaleError, post_sale, sale_lines_from_json
+from .sequences import next_number
+from .utils import chunks
+
+
+# ----------------------------------------------------
+# OFFLINE TILL: STOCK SNAPSHOT AND SALE SYNC
+# ----------------------------------------------------
+# The sale screen keeps a local copy of what a scan needs (barcode -> item,
+# names, sale rate, stock) so it can keep selling while the server is slow
+# or restarting, and queues the sales it records meanwhile.
+#
+# The copy is versioned by StockMovement id: every stock change appends a
+# movement, so a till holding version v only needs the barcodes moved
+# after v. The version is the settled id (ledger.settled_movement_id), not
+# the newest one, because on PostgreSQL a movement can commit after one
+# with a higher id and would otherwise fall behind a till's version for
+# good. Barcodes that can no longer be sold come back as null.
+#
+# Queued sales are sent back in batches and posted one by one through the
+# same pricing and post_sale() checks as the sale screen. Each carries a
+# client reference (unique on SaleInfo), so a batch re-sent after a lost
+# response posts nothing twice.
+
+SNAPSHOT_FIELDS = ('item_code', 'product_name', 'company_name', 'specification', 'sale_rate', 'available_qty')
+
+def stock_version():
+    return settled_movement_id()
+
+
+def snapshot_item(fields):
+    item_code, product_name, company_name, specification, sale_rate, available_qty = fields
+    if available_qty <= 0:
+        return None
+    return [item_code, product_name, company_name, specification or '', str(sale_rate), available_qty]
+
+
+def dumps(payload):
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def stock_snapshot(since=None):
+    """
+    JSON text of the stock a till may sell offline: every barcode when
+    `since` is None (or too far behind), else the barcodes moved after
+    version `since`.
+
+    {"version": v, "full": bool, "fields": [...], "items": {barcode: [...] or null}}
+    """
+    version = stock_version()
+    limit = getattr(settings, 'OFFLINE_DELTA_LIMIT', 5000)
+    if since is not None and 0 <= since <= version:
+        moved = set(
+            StockMovement.objects.filter(id__gt=since, id__lte=version)
+            .values_list('barcode_number', flat=True)
+            .order_by()
+            .distinct()[:limit + 1]
+        )
+        if len(moved) <= limit:
+            return dumps({
+                'version': version, 'full': False, 'fields': SNAPSHOT_FIELDS,
+                'items': barcode_items(moved),
+            })
+
+    # The full snapshot is the same for every till at a version
+    key = f'offline_snapshot:{version}'
+    text = cache.get(key)
+    if text is None:
+        items = {}
+        rows = ItemStock.objects.order_by('pk').values_list('barcode_number', *SNAPSHOT_FIELDS)
+        for barcode, *fields in rows.iterator(chunk_size=2000):
+            # Same row the scan lookup uses: the first batch of a barcode
+            if barcode not in items:
+                items[barcode] = snapshot_item(fields)
+        text = dumps({
+            'version': version, 'full': True, 'fields': SNAPSHOT_FIELDS,
+            'items': {barcode: item for barcode, item in items.items() if item},
+        })
+        cache.set(key, text, getattr(settings, 'OFFLINE_SNAPSHOT_TTL', 300))
+    return text
+
+
+def barcode_items(barcodes):
+    items = dict.fromkeys(barcodes)
+    for chunk in chunks(barcodes, 500):
+        rows = (
+            ItemStock.objects.filter(barcode_number__in=chunk)
+            .order_by('pk')
+            .values_list('barcode_number', *SNAPSHOT_FIELDS)
+        )
+        first = {}
+        for barcode, *fields in rows:
+            first.setdefault(barcode, fields)
+        for barcode, fields in first.items():
+            items[barcode] = snapshot_item(fields)
+    return items
+
+
+def sync_sales(sales, nowait=False):
+    """
+    Post the sales queued by an offline till, each in its own transaction.
+    Returns one {"client_reference", "status", ...} per sale, where status
+    is "posted" or "duplicate" (with the sale_number) or "rejected" (with
+    the error). A rejected sale does not stop the others.
+    """
+    references = [str(sale.get('client_reference') or '').strip() for sale in sales]
+    posted = dict(
+        SaleInfo.objects.filter(client_reference__in=[ref for ref in references if ref])
+        .values_list('client_reference', 'sale_number')
+    )
+
+    results = []
+    for reference, sale in zip(references, sales):
+        result = {'client_reference': reference}
+        results.append(result)
+        if not reference:
+            result.update(status='rejected', error="client_reference is required")
+            continue
+        if reference in posted:
+            result.update(status='duplicate', sale_number=posted[reference])
+            continue
+        try:
+            sale_info = post_offline_sale(reference, sale, nowait)
+        except IntegrityError:
+            # The same sale was posted by a concurrent sync
+            sale_number = (
+                SaleInfo.objects.filter(client_reference=reference)
+                .values_list('sale_number', flat=True).first()
+            )
+            if sale_number is None:
+                raise
+            result.update(status='duplicate', sale_number=sale_number)
+        except (SaleError, ValueError, TypeError, AttributeError, ArithmeticError) as e:
+            result.update(status='rejected', error=str(e))
+        else:
+            result.update(status='posted', sale_number=sale_info.sale_number)
+        if 'sale_number' in result:
+            posted[reference] = result['sale_number']
+    return results
+
+
+def post_offline_sale(reference, sale, nowait):
+    lines = sale_lines_from_json(sale.get('lines') or [])
+    if not lines:
+        raise SaleError("The sale has no lines.")
+    sale_date = parse_date(str(sale.get('sale_date') or ''))
+    if sale_date is None:
+        raise SaleError("The sale has no valid sale_date.")
+    totals = price_lines(
+        lines,
+        sale_rates(line['barcode_number'] for line in lines if line['barcode_number']),
+        quantity=sale.get('total_quantity'),
+        amount=sale.get('total_amount'),
+    )
+    return post_sale(
+        lines,
+        nowait=nowait,
+        sale_number=next_number('sale'),
+        sale_date=sale_date,
+        customer_name=str(sale.get('customer_name') or ''),
+        customer_contact=str(sale.get('customer_contact') or ''),
+        total_quantity=totals.quantity,
+        total_amount=totals.amount,
+        cash_received=Decimal(str(sale.get('cash_received') or 0)),
+        cash_return=Decimal(str(sale.get('cash_return') or 0)),
+        client_reference=reference,
+    )
@@ -0,0 +1,120 @@
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from .models import ItemStock
+from .sales import PricingError
+
+
+# ----------------------------------------------------
+# SALE / RETURN PRICING
+# ----------------------------------------------------
+# The sale and return screens compute line amounts and totals for display
+# only. Before a sale or return is written, every line is priced again from
+# its batch's sale_rate on ItemStock and the totals are summed in the same
+# pass. A posted rate, amount or total that disagrees rejects the document,
+# and what is stored is always the computed figures.
+#
+# A line sold by item code has no batch yet: only its arithmetic is checked
+# here. Allocation (see sales.allocate_lines) gives it the batch rates, and
+# post_sale() rejects the sale if those change the total the till showed.
+#
+# A return is priced at the rates of the sale it returns against, not the
+# batch's current rate; the refund paid out may be less than the goods'
+# value but never more.
+
+CENT = Decimal('0.01')
+
+Totals = namedtuple('Totals', 'quantity amount')
+
+# Mismatches listed in the error message
+MAX_REPORTED = 5
+
+
+def sale_rates(barcodes):
+    """
+    {barcode: sale_rate} in one query, from the first batch of each barcode
+    (the row the scan lookup shows).
+    """
+    rates = {}
+    rows = (
+        ItemStock.objects.filter(barcode_number__in=set(barcodes))
+        .order_by('pk')
+        .values_list('barcode_number', 'sale_rate')
+    )
+    for barcode, rate in rows:
+        rates.setdefault(barcode, rate)
+    return rates
+
+
+def posted_number(value, name):
+    """
+    A posted header total as a Decimal, or None when it was not posted.
+    """
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        return Decimal(str(value).strip())
+    except InvalidOperation:
+        raise PricingError(f"Invalid {name}: {value!r}")
+
+
+def refund_amount(posted, total):
+    """
+    The refund to record for a return worth `total`: the posted amount
+    (the whole total when not posted), between 0 and `total`.
+    """
+    refund = posted_number(posted, 'amount refunded')
+    if refund is None:
+        return total
+    if not 0 <= refund <= total:
+        raise PricingError(f"Amount refunded {refund} must be between 0.00 and {total}.")
+    return refund
+
+
+def price_lines(lines, rates, quantity=None, amount=None):
+    """
+    Price `lines` (dicts with barcode_number, qty, sale_rate and amount)
+    against `rates` ({barcode: sale_rate}) and return their Totals.
+
+    The lines are given the authoritative rate and amount. The posted header
+    `quantity` and `amount` are checked when given. Raises PricingError
+    listing the mismatches.
+    """
+    total_quantity = 0
+    total_amount = Decimal('0.00')
+    mismatches = []
+    for line in lines:
+        barcode = line['barcode_number']
+        qty = line['qty']
+        if qty < 0:
+            raise PricingError(f"Negative quantity for {barcode or line['item_code']}")
+        if barcode:
+            rate = rates.get(barcode)
+            if rate is None:
+                raise PricingError(f"Barcode '{barcode}' is not in stock.")
+            if line['sale_rate'] != rate:
+                mismatches.append(f"{barcode} rate {line['sale_rate']} (stock rate {rate})")
+        else:
+            rate = line['sale_rate']
+        line_amount = (rate * qty).quantize(CENT)
+        if line['amount'] != line_amount:
+            mismatches.append(f"{barcode or line['item_code']} amount {line['amount']} (expected {line_amount})")
+        line['sale_rate'] = rate
+        line['amount'] = line_amount
+        total_quantity += qty
+        total_amount += line_amount
+
+    posted_quantity = posted_number(quantity, 'total quantity')
+    if posted_quantity is not None and posted_quantity != total_quantity:
+        mismatches.append(f"total quantity {posted_quantity} (expected {total_quantity})")
+    posted_amount = posted_number(amount, 'total amount')
+    if posted_amount is not None and posted_amount != total_amount:
+        mismatches.append(f"total amount {posted_amount} (expected {total_amount})")
+
+    if mismatches:
+        more = len(mismatches) - MAX_REPORTED
+        raise PricingError(
+            "Prices do not match the stock records: " + '; '.join(mismatches[:MAX_REPORTED])
+            + (f" and {more} more" if more > 0 else '')
+        )
+    return Totals(total_quantity, total_amount)
@@ -0,0 +1,296 @@
+import cProfile
+import importlib
+import json
+import os
+import pstats
+import re
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+# ----------------------------------------------------
+# OPT-IN REQUEST PROFILING
+# ----------------------------------------------------
+# With PROFILING_ENABLED, a staff user can profile a single request by
+# sending an `X-Profile` header or a `_profile` query parameter. The value
+# picks the profiler: `pyinstrument` (needs the package; saves an HTML flame
+# view and a session file) or anything else for cProfile (saves a pstats
+# file). Every profile gets a JSON sidecar with the URL, time and status.
+# `manage.py list_profiles` summarises what was captured.
+#
+# Without PROFILING_ENABLED the middleware removes itself at startup.
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile'
+
+
+class ProfilingError(Exception):
+    """
+    Raised when the requested profiler is not available.
+    """
+
+
+def profile_dir():
+    return str(getattr(settings, 'PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles')))
+
+
+def requested_profiler(request, user):
+    """
+    'cprofile', 'pyinstrument', or None when the request is not to be
+    profiled.
+    """
+    flag = profile_flag(request)
+    if not flag or not (user and user.is_staff):
+        return None
+    return 'pyinstrument' if flag.lower() == 'pyinstrument' else 'cprofile'
+
+
+def profile_flag(request):
+    flag = request.META.get(PROFILE_HEADER) or request.GET.get(PROFILE_PARAM)
+    return None if flag == '0' else flag
+
+
+def profile_name(request):
+    """
+    File name stem: timestamp, method and a slug of the path.
+    """
+    stamp = time.strftime('%Y%m%d-%H%M%S') + f'-{int(time.time() * 1000) % 1000:03d}'
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+    return f'{stamp}-{request.method}-{slug[:60]}'
+
+
+class CProfiler:
+    suffix = '.prof'
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def save(self, path):
+        self.profiler.dump_stats(path + self.suffix)
+        return [path + self.suffix]
+
+
+class PyinstrumentProfiler:
+    suffix = '.pyisession'
+
+    def __init__(self):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ProfilingError("The 'pyinstrument' package is not installed.")
+        self.profiler = Profiler()
+        self.session = None
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.session = self.profiler.stop()
+
+    def save(self, path):
+        self.session.save(path + self.suffix)
+        with open(path + '.html', 'w', encoding='utf-8') as f:
+            f.write(self.profiler.output_html())
+        return [path + self.suffix, path + '.html']
+
+
+PROFILERS = {
+    'cprofile': CProfiler,
+    'pyinstrument': PyinstrumentProfiler,
+}
+
+
+class ProfilingMiddleware:
+    """
+    Run a flagged request from a staff user under a profiler and save the
+    result to PROFILE_DIR.
+
+    Under ASGI, cProfile only sees the event loop thread (not the ORM's
+    worker thread); pyinstrument follows the awaited view.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user = getattr(request, 'user', None)
+        kind = requested_profiler(request, user)
+        if kind is None:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        try:
+            profiler = PROFILERS[kind]()
+            profiler.start()
+        except (ProfilingError, ValueError) as e:  # ValueError: another profiler is active
+            response = self.get_response(request)
+            response['X-Profile-Error'] = str(e)
+            return response
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        return self.save(request, response, user, profiler, kind, start)
+
+    async def __acall__(self, request):
+        # request.user would hit the session synchronously; only look the
+        # user up for flagged requests
+        kind = user = None
+        if profile_flag(request):
+            user = await request.auser()
+            kind = requested_profiler(request, user)
+        if kind is None:
+            return await self.get_response(request)
+
+        start = time.perf_counter()
+        try:
+            profiler = PROFILERS[kind]()
+            profiler.start()
+        except (ProfilingError, ValueError) as e:
+            response = await self.get_response(request)
+            response['X-Profile-Error'] = str(e)
+            return response
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.stop()
+        return self.save(request, response, user, profiler, kind, start)
+
+    def save(self, request, response, user, profiler, kind, start):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        name = profile_name(request)
+        files = profiler.save(os.path.join(directory, name))
+        with open(os.path.join(directory, name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'url': request.get_full_path(),
+                'method': request.method,
+                'view': request.resolver_match.view_name if request.resolver_match else None,
+                'status': response.status_code,
+                'elapsed_ms': round(elapsed_ms, 2),
+                'profiler': kind,
+                'user': user.get_username(),
+                'captured_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'files': [os.path.basename(path) for path in files],
+            }, f, indent=2)
+
+        response['X-Profile-Id'] = name
+        return response
+
+
+# ----------------------------------------------------
+# READING CAPTURED PROFILES
+# ----------------------------------------------------
+
+def captured_profiles(directory=None):
+    """
+    Metadata of every captured profile, newest first, with the stem `name`
+    and the `directory` it was read from.
+    """
+    directory = directory or profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for entry in os.listdir(directory):
+        if not entry.endswith('.json'):
+            continue
+        with open(os.path.join(directory, entry), encoding='utf-8') as f:
+            meta = json.load(f)
+        meta.update(name=entry[:-len('.json')], directory=directory)
+        profiles.append(meta)
+    return sorted(profiles, key=lambda meta: meta['name'], reverse=True)
+
+
+def module_names(modules):
+    """
+    A function giving the dotted module name of a source file when it is one
+    of `modules` or inside one of them (for packages), and None otherwise.
+    Raises ImportError for a module that cannot be imported.
+    """
+    roots = []
+    for name in modules:
+        module = importlib.import_module(name)
+        path = os.path.normcase(os.path.realpath(module.__file__))
+        roots.append((name, os.path.dirname(path) if hasattr(module, '__path__') else path))
+
+    @lru_cache(maxsize=None)
+    def module_name(filename):
+        if not filename:
+            return None
+        filename = os.path.normcase(os.path.realpath(filename))
+        for name, root in roots:
+            if filename == root:
+                return name
+            if filename.startswith(root + os.sep) and filename.endswith('.py'):
+                parts = os.path.relpath(filename, root)[:-len('.py')].split(os.sep)
+                if parts[-1] == '__init__':
+                    parts.pop()
+                return '.'.join([name] + parts)
+        return None
+
+    return module_name
+
+
+def cumulative_times(meta, module_name):
+    """
+    {'module.function': cumulative seconds} for the functions in one captured
+    profile whose file `module_name` (see module_names) recognises.
+    """
+    path = os.path.join(meta['directory'], meta['name'])
+
+    if meta['profiler'] == 'pyinstrument':
+        return pyinstrument_times(path + PyinstrumentProfiler.suffix, module_name)
+
+    times = {}
+    for (filename, _, function), (_, _, _, cumulative, _) in pstats.Stats(path + CProfiler.suffix).stats.items():
+        module = module_name(filename)
+        if module:
+            key = f'{module}.{function}'
+            times[key] = times.get(key, 0) + cumulative
+    return times
+
+
+def pyinstrument_times(path, module_name):
+    try:
+        from pyinstrument.session import Session
+    except ImportError:
+        raise ProfilingError("Reading pyinstrument profiles needs the 'pyinstrument' package.")
+
+    times = defaultdict(float)
+
+    def walk(frame, active):
+        # Recursive calls are only counted at their outermost frame
+        key = (frame.file_path, frame.function)
+        module = module_name(frame.file_path)
+        if module and key not in active:
+            times[f'{module}.{frame.function}'] += frame.time
+            active = active | {key}
+        for child in frame.children:
+            walk(child, active)
+
+    root = Session.load(path).root_frame()
+    if root is not None:
+        walk(root, frozenset())
+    return dict(times)
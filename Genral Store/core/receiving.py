@@ -0,0 +1,301 @@
+import csv
+import io
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from .cache import invalidate_on_commit
+from .ledger import record_movements
+from .models import ItemStock, StockAssigned, StockMovement, StockReceivingDetail, stockreceving
+from .stock_summary import apply_deltas, stock_deltas
+from .utils import chunks
+
+
+# ----------------------------------------------------
+# STOCK RECEIVING
+# ----------------------------------------------------
+# Rows are received in chunks. Each chunk costs two IN queries (item codes
+# and already-received barcodes) plus batched INSERTs, however many lines it
+# has. Bad rows are collected as errors and skipped; the rest are posted.
+
+
+class StockReceiver:
+    """
+    Receive purchase-order rows for one vendor under one order number.
+
+    Call add_rows() once or several times (e.g. per chunk of an uploaded
+    file) inside a transaction, then finish() to write the header.
+    """
+
+    def __init__(self, vendor, order_number, order_date, batch_size=500, max_errors=None):
+        self.vendor = vendor
+        self.order_number = order_number
+        self.order_date = order_date
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.errors = []
+        self.error_count = 0
+        self.rows_seen = 0
+        self.rows_received = 0
+        self.total_qty = 0
+        self.total_amount = Decimal('0.00')
+
+    def error(self, row_number, message):
+        self.error_count += 1
+        if self.max_errors is None or len(self.errors) < self.max_errors:
+            self.errors.append((row_number, message))
+
+    def parse_row(self, row_number, row):
+        """
+        Validate the scalar fields of a row. Returns a dict or None on error.
+        """
+        item_code = str(row.get('item_code') or '').strip()
+        barcode = str(row.get('barcode_number') or '').strip()
+        if not item_code:
+            self.error(row_number, "Item code is missing.")
+            return None
+        if not barcode:
+            self.error(row_number, "Barcode is missing.")
+            return None
+
+        try:
+            qty = int(row.get('qty') or 0)
+            rate = Decimal(str(row.get('rate') or '0'))
+            sale_rate = Decimal(str(row.get('sale_rate') or '0'))
+        except (TypeError, ValueError, InvalidOperation):
+            self.error(row_number, "Qty, rate and sale rate must be numbers.")
+            return None
+        if qty < 0 or rate < 0 or sale_rate < 0:
+            self.error(row_number, "Qty, rate and sale rate cannot be negative.")
+            return None
+
+        exp_date = row.get('exp_date')
+        try:
+            exp_date = (
+                datetime.strptime(str(exp_date).strip(), "%Y-%m-%d").date()
+                if exp_date else None
+            )
+        except ValueError:
+            self.error(row_number, f"Expiry date '{exp_date}' is not YYYY-MM-DD.")
+            return None
+
+        return {
+            'row_number': row_number,
+            'item_code': item_code,
+            'barcode': barcode,
+            'qty': qty,
+            'rate': rate,
+            'sale_rate': sale_rate,
+            'exp_date': exp_date,
+        }
+
+    def add_rows(self, rows, start=1):
+        """
+        Validate and post a chunk of rows. `start` is the number of the first
+        row, used in error messages.
+        """
+        parsed = []
+        for row_number, row in enumerate(rows, start=start):
+            self.rows_seen += 1
+            values = self.parse_row(row_number, row)
+            if values:
+                parsed.append(values)
+
+        if parsed:
+            self.post_rows(parsed)
+        self.errors.sort()
+
+    def post_rows(self, parsed):
+        """
+        Resolve item codes and duplicate barcodes for parsed rows, then insert.
+        """
+        products = StockAssigned.objects.in_bulk(
+            {values['item_code'] for values in parsed}, field_name='item_code'
+        )
+        received = set(
+            StockReceivingDetail.objects.filter(
+                barcode_number__in={values['barcode'] for values in parsed}
+            ).values_list('barcode_number', flat=True)
+        )
+
+        details = []
+        stocks = []
+        deltas = stock_deltas()
+        for values in parsed:
+            product = products.get(values['item_code'])
+            barcode = values['barcode']
+            if product is None:
+                self.error(values['row_number'], f"Item code '{values['item_code']}' does not exist.")
+                continue
+            if barcode in received:
+                self.error(values['row_number'], f"Barcode '{barcode}' already exists.")
+                continue
+            received.add(barcode)
+
+            details.append(StockReceivingDetail(
+                order_number=self.order_number,
+                order_date=self.order_date,
+                vender=self.vendor,
+                product=product,
+                barcode_number=barcode,
+                qty=values['qty'],
+                rate=values['rate'],
+                sale_rate=values['sale_rate'],
+                expire_date=values['exp_date']
+            ))
+            stocks.append(ItemStock(
+                order_number=self.order_number,
+                vender_code=self.vendor.vender_code,
+                item_code=product.item_code,
+                product_name=product.product_name,
+                company_name=product.company_name,
+                specification=product.specification,
+                barcode_number=barcode,
+                total_qty=values['qty'],
+                rate=values['rate'],
+                sale_rate=values['sale_rate'],
+                expire_date=values['exp_date'],
+                available_qty=values['qty'],
+            ))
+            deltas[product.item_code]['total_qty'] += values['qty']
+            deltas[product.item_code]['batch_count'] += 1
+            self.total_qty += values['qty']
+            self.total_amount += values['qty'] * values['rate']
+
+        StockReceivingDetail.objects.bulk_create(details, batch_size=self.batch_size)
+        ItemStock.objects.bulk_create(stocks, batch_size=self.batch_size)
+        apply_deltas(deltas)
+        record_movements(StockMovement.RECEIVE, self.order_number, {
+            (stock.barcode_number, stock.item_code): stock.total_qty for stock in stocks
+        })
+        self.rows_received += len(details)
+
+        # Barcodes may have been cached as "not found" before receiving
+        invalidate_on_commit(detail.barcode_number for detail in details)
+
+    def finish(self):
+        """
+        Write the receiving header. Returns None if no row was received.
+        """
+        if not self.rows_received:
+            return None
+        return stockreceving.objects.create(
+            order_number=self.order_number,
+            order_date=self.order_date,
+            vender_code=self.vendor.vender_code,
+            vendor_name=self.vendor.vender_name,
+            total_qty=self.total_qty,
+            total_amount=self.total_amount
+        )
+
+
+def receive_stock(vendor, rows, order_number, order_date, batch_size=500):
+    """
+    Receive a list of rows in one go. Returns the StockReceiver for its
+    counters and errors; the caller owns the transaction.
+    """
+    receiver = StockReceiver(vendor, order_number, order_date, batch_size=batch_size)
+    receiver.add_rows(rows)
+    receiver.finish()
+    return receiver
+
+
+# ----------------------------------------------------
+# PURCHASE-ORDER FILE UPLOADS
+# ----------------------------------------------------
+# Uploaded files are read row by row and posted in fixed-size chunks, so
+# memory use depends on the chunk size, not on the length of the file.
+
+COLUMN_ALIASES = {
+    'item_code': 'item_code',
+    'item code': 'item_code',
+    'barcode': 'barcode_number',
+    'barcode_number': 'barcode_number',
+    'barcode number': 'barcode_number',
+    'qty': 'qty',
+    'quantity': 'qty',
+    'rate': 'rate',
+    'sale_rate': 'sale_rate',
+    'sale rate': 'sale_rate',
+    'exp_date': 'exp_date',
+    'exp.date': 'exp_date',
+    'expire_date': 'exp_date',
+    'expiry date': 'exp_date',
+}
+
+
+class UploadError(Exception):
+    """
+    Raised when an uploaded purchase order cannot be read at all.
+    """
+
+
+def normalise_header(header):
+    return [COLUMN_ALIASES.get(str(name or '').strip().lower(), None) for name in header]
+
+
+def iter_csv_rows(uploaded_file):
+    """
+    Yield one dict per CSV line, decoding the upload lazily.
+    """
+    text = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    try:
+        header = normalise_header(next(reader, []))
+        for values in reader:
+            if any(value.strip() for value in values):
+                yield {name: value for name, value in zip(header, values) if name}
+    except UnicodeDecodeError:
+        raise UploadError("CSV file must be UTF-8 encoded.")
+    finally:
+        text.detach()
+
+
+def iter_xlsx_rows(uploaded_file):
+    """
+    Yield one dict per row of the first worksheet (needs openpyxl).
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise UploadError("Excel uploads need the 'openpyxl' package; upload a CSV instead.")
+
+    try:
+        workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    except Exception:
+        raise UploadError("Could not read the Excel file.")
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = normalise_header(next(rows, ()))
+        for values in rows:
+            if any(value not in (None, '') for value in values):
+                row = {name: value for name, value in zip(header, values) if name}
+                if isinstance(row.get('exp_date'), datetime):
+                    row['exp_date'] = row['exp_date'].strftime("%Y-%m-%d")
+                yield row
+    finally:
+        workbook.close()
+
+
+def iter_upload_rows(uploaded_file):
+    name = (uploaded_file.name or '').lower()
+    if name.endswith('.csv'):
+        return iter_csv_rows(uploaded_file)
+    if name.endswith('.xlsx'):
+        return iter_xlsx_rows(uploaded_file)
+    raise UploadError("Only .csv and .xlsx purchase orders are supported.")
+
+
+def receive_upload(receiver, uploaded_file, chunk_size=500, progress=None):
+    """
+    Stream an uploaded purchase order into `receiver` chunk by chunk.
+
+    `progress`, if given, is called with the receiver after every chunk.
+    The caller owns the transaction and calls receiver.finish().
+    """
+    start = 1
+    for chunk in chunks(iter_upload_rows(uploaded_file), chunk_size):
+        receiver.add_rows(chunk, start=start)
+        start += len(chunk)
+        if progress:
+            progress(receiver)
+    return receiver
@@ -0,0 +1,220 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncMonth, TruncYear
+from django.utils.dateparse import parse_date
+
+from .models import (
+    DailyCompanySales, DailyItemSales, DailySalesTotal, ItemStock, SaleDetail, SaleInfo,
+    SaleReturn, SaleReturnDetail,
+)
+
+
+# ----------------------------------------------------
+# DAILY SALES ROLLUPS
+# ----------------------------------------------------
+# Every sale and return adds its totals to three small tables: one row per
+# day, per day and item, and per day and company. Reports for a month or a
+# year read those rows instead of scanning SaleInfo/SaleDetail.
+#
+# Unlike the per-product stock summary, the rollups are updated in their own
+# short transaction once the sale has committed: every sale of the day
+# touches the same DailySalesTotal row, and holding that row lock for the
+# whole sale would make every till wait for every other one. A rollup lost to
+# a crash between the two commits is repaired by rebuild_sales_rollups.
+
+# model -> the column the rows are split by (None: one row per day)
+ROLLUPS = {
+    DailySalesTotal: None,
+    DailyItemSales: 'item_code',
+    DailyCompanySales: 'company_name',
+}
+
+SALE_COUNTERS = ('qty_sold', 'amount_sold', 'qty_returned', 'amount_returned')
+TOTAL_COUNTERS = ('sale_count', 'return_count') + SALE_COUNTERS
+
+CENT = Decimal('0.01')
+
+PERIODS = {
+    'day': None,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+GROUPS = {
+    'total': DailySalesTotal,
+    'item': DailyItemSales,
+    'company': DailyCompanySales,
+}
+
+
+def as_day(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, str):
+        return parse_date(value)
+    return value
+
+
+def rollup_deltas():
+    """
+    An empty {model: {(day, value): {counter: delta}}} accumulator.
+    """
+    return {model: defaultdict(lambda: defaultdict(int)) for model in ROLLUPS}
+
+
+def add_lines(deltas, day, lines, qty_counter, amount_counter):
+    for line in lines:
+        for model, dimension in ROLLUPS.items():
+            value = line.get(dimension) if dimension else None
+            if dimension and not value:
+                continue
+            delta = deltas[model][(day, value)]
+            delta[qty_counter] += line['qty']
+            delta[amount_counter] += line['amount']
+
+
+def record_sale(day, lines):
+    """
+    Add a posted sale to the rollups once the current transaction commits.
+    `lines` are dicts with item_code, company_name, qty and amount.
+    """
+    day = as_day(day)
+    deltas = rollup_deltas()
+    deltas[DailySalesTotal][(day, None)]['sale_count'] += 1
+    add_lines(deltas, day, lines, 'qty_sold', 'amount_sold')
+    apply_rollups_on_commit(deltas)
+
+
+def record_return(day, lines):
+    """
+    Add a sale return to the rollups of its return date once the current
+    transaction commits. Lines without an item_code (barcode no longer in
+    stock) only count towards the day total.
+    """
+    day = as_day(day)
+    deltas = rollup_deltas()
+    deltas[DailySalesTotal][(day, None)]['return_count'] += 1
+    add_lines(deltas, day, lines, 'qty_returned', 'amount_returned')
+    apply_rollups_on_commit(deltas)
+
+
+def apply_rollups_on_commit(deltas):
+    # robust: a failed rollup update is logged, it must not fail a committed sale
+    transaction.on_commit(lambda: apply_rollups(deltas), robust=True)
+
+
+@transaction.atomic
+def apply_rollups(deltas):
+    for model, rows in deltas.items():
+        apply_rollup(model, ROLLUPS[model], rows)
+
+
+def apply_rollup(model, dimension, deltas):
+    """
+    Add {(day, value): {counter: delta}} to a rollup table, creating missing
+    rows. Rows of one day with the same deltas share one F() UPDATE.
+    """
+    by_day = defaultdict(dict)
+    for (day, value), delta in deltas.items():
+        by_day[day][value] = delta
+
+    for day, values in by_day.items():
+        rows = model.objects.filter(day=day)
+        if dimension:
+            existing = set(
+                rows.filter(**{f'{dimension}__in': values}).values_list(dimension, flat=True)
+            )
+            missing = [model(day=day, **{dimension: v}) for v in values if v not in existing]
+        else:
+            missing = [] if rows.exists() else [model(day=day)]
+        if missing:
+            model.objects.bulk_create(missing, ignore_conflicts=True)
+
+        groups = defaultdict(list)
+        for value, delta in values.items():
+            key = tuple(sorted((counter, n) for counter, n in delta.items() if n))
+            if key:
+                groups[key].append(value)
+        for key, group in groups.items():
+            target = rows.filter(**{f'{dimension}__in': group}) if dimension else rows
+            target.update(**{counter: F(counter) + n for counter, n in key})
+
+
+def computed_rollups(start, end):
+    """
+    Rollup deltas for sales and returns dated start..end, aggregated from
+    the document tables (used to backfill or rebuild the rollups).
+
+    Returns without a return date cannot be placed on a day and are skipped.
+    """
+    deltas = rollup_deltas()
+
+    for row in (
+        SaleInfo.objects.filter(sale_date__range=(start, end))
+        .values('sale_date').annotate(sales=Count('id')).order_by()
+    ):
+        deltas[DailySalesTotal][(row['sale_date'], None)]['sale_count'] += row['sales']
+    for row in (
+        SaleReturnDetail.objects.filter(return_date__range=(start, end))
+        .values('return_date').annotate(returns=Count('id')).order_by()
+    ):
+        deltas[DailySalesTotal][(row['return_date'], None)]['return_count'] += row['returns']
+
+    sold = (
+        SaleDetail.objects.filter(sale__sale_date__range=(start, end))
+        .values('item_code', 'company_name', day=F('sale__sale_date'))
+        .annotate(qty=Sum('qty'), amount=Sum('amount'))
+        .order_by()
+    )
+    for row in sold.iterator(chunk_size=2000):
+        add_lines(deltas, row['day'], [row], 'qty_sold', 'amount_sold')
+
+    # Returned barcodes are attributed to the first stock batch carrying them,
+    # as sale_return does
+    batch = ItemStock.objects.filter(barcode_number=OuterRef('barcode_number')).order_by('pk')
+    returned = (
+        SaleReturn.objects.filter(return_detail__return_date__range=(start, end))
+        .annotate(
+            item_code=Subquery(batch.values('item_code')[:1]),
+            company_name=Subquery(batch.values('company_name')[:1]),
+        )
+        .values('item_code', 'company_name', day=F('return_detail__return_date'))
+        .annotate(qty=Sum('qty'), amount=Sum('total_amount'))
+        .order_by()
+    )
+    for row in returned.iterator(chunk_size=2000):
+        add_lines(deltas, row['day'], [row], 'qty_returned', 'amount_returned')
+
+    return deltas
+
+
+def sales_report(start, end, group='total', period='day'):
+    """
+    Rollup rows for start..end, summed per period (day/month/year) and, for
+    the item and company groups, per item code or company.
+    """
+    model = GROUPS[group]
+    dimension = ROLLUPS[model]
+    counters = TOTAL_COUNTERS if model is DailySalesTotal else SALE_COUNTERS
+
+    rows = model.objects.filter(day__range=(start, end))
+    trunc = PERIODS[period]
+    rows = rows.annotate(period=trunc('day') if trunc else F('day'))
+    columns = ('period', dimension) if dimension else ('period',)
+
+    report = []
+    for row in (
+        rows.values(*columns)
+        .annotate(**{counter: Sum(counter) for counter in counters})
+        .order_by(*columns)
+    ):
+        # SQLite sums decimals without their scale; put the cents back
+        for amount in ('amount_sold', 'amount_returned'):
+            row[amount] = (row[amount] or Decimal('0')).quantize(CENT)
+        row['amount_net'] = row['amount_sold'] - row['amount_returned']
+        report.append(row)
+    return report
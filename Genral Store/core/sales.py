@@ -0,0 +1,402 @@
+import datetime
+import hashlib
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, transaction
+from django.db.models import F, OuterRef, Prefetch, Q, Subquery, Sum
+
+from .allocation import batch_queues, is_open, open_batches, plan_batches
+from .cache import invalidate_on_commit
+from .ledger import record_movements
+from .models import ItemStock, SaleDetail, SaleInfo, SaleReturn, StockMovement
+from .reports import as_day, record_sale
+from .stock_summary import apply_deltas, stock_deltas
+
+
+# ----------------------------------------------------
+# SALE POSTING
+# ----------------------------------------------------
+# A sale is posted with a fixed number of statements regardless of basket
+# size: one locking SELECT for every referenced ItemStock row, one INSERT for
+# the header, a batched INSERT for the lines and one F() UPDATE per distinct
+# line quantity for stock.
+#
+# On PostgreSQL the locking SELECT takes row locks, so tills selling different
+# barcodes never wait for each other; tills after the same barcode queue on
+# that row (or fail at once with nowait=True). Stock counters are only ever
+# changed with F() expressions, never by saving a value read earlier.
+
+
+class SaleError(Exception):
+    """
+    Raised when a sale cannot be posted (unknown barcode, not enough stock).
+    """
+
+
+class PricingError(SaleError):
+    """
+    Raised when posted rates, amounts or totals disagree with the stock
+    records (see core.pricing).
+    """
+
+
+def sale_lines_from_post(post):
+    """
+    Turn the parallel `field[]` lists posted by sale.html into line dicts.
+    """
+    barcodes = post.getlist("barcode[]")
+    item_codes = post.getlist("item_code[]")
+    product_names = post.getlist("product_name[]")
+    company_names = post.getlist("company_name[]")
+    specifications = post.getlist("specification[]")
+    quantities = post.getlist("qty[]")
+    sale_rates = post.getlist("sale_rate[]")
+    amounts = post.getlist("amount[]")
+
+    lines = []
+    for i in range(len(barcodes)):
+        # A line with an item code but no barcode is sold by item code
+        if not barcodes[i].strip() and not item_codes[i].strip():
+            continue
+        lines.append({
+            'barcode_number': barcodes[i].strip(),
+            'item_code': item_codes[i],
+            'product_name': product_names[i],
+            'company_name': company_names[i],
+            'specification': specifications[i] or '',
+            'qty': int(quantities[i] or 0),
+            'sale_rate': Decimal(sale_rates[i] or 0),
+            'amount': Decimal(amounts[i] or 0),
+        })
+    return lines
+
+
+def sale_lines_from_json(rows):
+    """
+    Line dicts, as sale_lines_from_post() builds them, from the JSON lines
+    of a sale queued by an offline till.
+    """
+    lines = []
+    for row in rows:
+        barcode = str(row.get('barcode_number') or '').strip()
+        item_code = str(row.get('item_code') or '').strip()
+        if not barcode and not item_code:
+            continue
+        lines.append({
+            'barcode_number': barcode,
+            'item_code': item_code,
+            'product_name': str(row.get('product_name') or ''),
+            'company_name': str(row.get('company_name') or ''),
+            'specification': str(row.get('specification') or ''),
+            'qty': int(row.get('qty') or 0),
+            'sale_rate': Decimal(str(row.get('sale_rate') or 0)),
+            'amount': Decimal(str(row.get('amount') or 0)),
+        })
+    return lines
+
+
+def lock_stock(barcodes, nowait=False, item_codes=(), day=None, pks=()):
+    """
+    ItemStock rows for `barcodes`, plus the open batches of `item_codes` on
+    `day` (see allocation.open_batches) and the rows in `pks`, locked until
+    the transaction ends.
+
+    Rows are locked in primary key order, so two tills with overlapping
+    baskets queue instead of deadlocking. With `nowait` a row already locked
+    by another till raises SaleError instead of waiting.
+    """
+    match = Q(barcode_number__in=barcodes)
+    if item_codes:
+        match |= open_batches(item_codes, day or datetime.date.today())
+    if pks:
+        match |= Q(pk__in=pks)
+    rows = (
+        ItemStock.objects.select_for_update(nowait=nowait)
+        .filter(match)
+        .order_by('pk')
+    )
+    try:
+        return list(rows)
+    except OperationalError:
+        if not nowait:
+            raise
+        raise SaleError("This stock is being updated at another till, please try again.")
+
+
+def update_stock_counts(quantities, counter):
+    """
+    Add {ItemStock pk: qty} to `counter` and move available_qty with it.
+
+    Rows with the same qty share one F() UPDATE.
+    """
+    sign = -1 if counter in ('sale_qty', 'stock_return_qty') else 1
+    by_qty = defaultdict(list)
+    for pk, qty in quantities.items():
+        by_qty[qty].append(pk)
+    for qty, pks in by_qty.items():
+        ItemStock.objects.filter(pk__in=pks).update(**{
+            counter: F(counter) + qty,
+            'available_qty': F('available_qty') + sign * qty,
+        })
+
+
+def post_sale(lines, nowait=False, **header):
+    """
+    Create a SaleInfo with its SaleDetail rows and decrement stock.
+
+    `header` holds the SaleInfo fields. Lines with a barcode sell that batch;
+    lines with only an item code are allocated across the item's batches
+    (see allocate_lines). Every line is validated against the locked
+    ItemStock rows before anything is written; a SaleError leaves the
+    database untouched. `nowait` is passed on to lock_stock().
+    """
+    scanned = defaultdict(int)
+    by_item = defaultdict(int)
+    for line in lines:
+        if line['barcode_number']:
+            scanned[(line['barcode_number'], line['item_code'])] += line['qty']
+        else:
+            by_item[line['item_code']] += line['qty']
+    day = as_day(header.get('sale_date')) or datetime.date.today()
+
+    with transaction.atomic():
+        barcodes = {barcode for barcode, _ in scanned}
+        # Only the batches the allocation is planned to take from are locked,
+        # not every open batch of the item
+        planned = plan_batches(by_item, scanned, day) if by_item else ()
+        locked = lock_stock(barcodes, nowait=nowait, pks=planned)
+        stocks = {
+            (stock.barcode_number, stock.item_code): stock
+            for stock in locked if stock.barcode_number in barcodes
+        }
+
+        taken = defaultdict(int)
+        for key, qty in scanned.items():
+            stock = stocks.get(key)
+            if stock is None:
+                raise SaleError(f"Barcode '{key[0]}' is not in stock.")
+            if stock.available_qty < qty:
+                raise SaleError(f"Insufficient stock for {stock.product_name}")
+            taken[stock.pk] += qty
+
+        if by_item:
+            try:
+                lines, picked = allocate_lines(lines, [s for s in locked if is_open(s, day)], taken)
+            except SaleError:
+                # Another till sold from a planned batch in between: lock
+                # every open batch of the items and allocate from those
+                locked = lock_stock(barcodes, nowait=nowait, item_codes=by_item, day=day)
+                lines, picked = allocate_lines(lines, [s for s in locked if is_open(s, day)], taken)
+            for pk, qty in picked.items():
+                taken[pk] += qty
+            # The allocated lines carry their batches' rates; a total the till
+            # did not show would not match the cash taken, so it is confirmed
+            allocated = sum((line['amount'] for line in lines), Decimal('0.00'))
+            if allocated != header.get('total_amount'):
+                raise PricingError(
+                    f"The batches allocated bring the total to {allocated}, not "
+                    f"{header.get('total_amount')}; please confirm the total."
+                )
+
+        sale_info = SaleInfo.objects.create(**header)
+
+        SaleDetail.objects.bulk_create([
+            SaleDetail(sale=sale_info, **line) for line in lines
+        ])
+
+        # Baskets are mostly qty 1 or 2, so grouping rows by quantity turns the
+        # stock decrement into a handful of F() updates instead of one per line.
+        deltas = stock_deltas()
+        moved = defaultdict(int)
+        for line in lines:
+            deltas[line['item_code']]['sale_qty'] += line['qty']
+            moved[(line['barcode_number'], line['item_code'])] -= line['qty']
+        update_stock_counts(taken, 'sale_qty')
+        apply_deltas(deltas)
+        record_movements(StockMovement.SALE, sale_info.sale_number, moved)
+        record_sale(sale_info.sale_date, lines)
+
+        invalidate_on_commit(barcode for barcode, _ in moved)
+
+    return sale_info
+
+
+def allocate_lines(lines, batches, taken):
+    """
+    Replace every line without a barcode by one line per batch it is taken
+    from, in FEFO/FIFO order, at that batch's sale rate.
+
+    `batches` are the locked open batches and `taken` the {pk: qty} already
+    sold from them by scanned lines. Returns the new lines and the {pk: qty}
+    they take.
+    """
+    queues = batch_queues(batches, reserved=taken)
+    allocated = []
+    picked = defaultdict(int)
+    for line in lines:
+        if line['barcode_number']:
+            allocated.append(line)
+            continue
+        queue = queues.get(line['item_code'])
+        if queue is None or queue.available < line['qty']:
+            raise SaleError(f"Insufficient stock for item {line['item_code']}")
+        for batch, qty in queue.take(line['qty']):
+            picked[batch.pk] += qty
+            allocated.append(dict(
+                line,
+                barcode_number=batch.barcode_number,
+                product_name=batch.product_name,
+                company_name=batch.company_name,
+                specification=batch.specification or '',
+                qty=qty,
+                sale_rate=batch.sale_rate,
+                amount=batch.sale_rate * qty,
+            ))
+    return allocated, picked
+
+
+# ----------------------------------------------------
+# SALE DETAILS FOR RETURNS
+# ----------------------------------------------------
+# The return screen looks a sale up by number. A posted sale never changes
+# except by being returned against, so its payload is cached until a return
+# referencing it commits. Amounts are sent as decimal strings, and every line
+# carries the quantity already returned so the screen can cap what is left.
+
+def sale_details_key(sale_number):
+    digest = hashlib.md5(sale_number.encode()).hexdigest()
+    return f'sale_details:{digest}'
+
+
+def sale_details(sale_number):
+    """
+    Payload of a sale for the return screen, or None if there is no such
+    sale.
+    """
+    key = sale_details_key(sale_number)
+    payload = cache.get(key)
+    if payload is None:
+        payload = sale_details_payload(sale_details_query(sale_number).first())
+        if payload is not None:
+            cache.set(key, payload, getattr(settings, 'SALE_DETAILS_TTL', 3600))
+    return payload
+
+
+async def asale_details(sale_number):
+    """
+    sale_details() for async views.
+    """
+    key = sale_details_key(sale_number)
+    payload = await cache.aget(key)
+    if payload is None:
+        payload = sale_details_payload(await sale_details_query(sale_number).afirst())
+        if payload is not None:
+            await cache.aset(key, payload, getattr(settings, 'SALE_DETAILS_TTL', 3600))
+    return payload
+
+
+def sale_details_query(sale_number):
+    # Returned quantity of the line's barcode over every return against this
+    # sale, fetched with the lines in the same prefetch query
+    returned = (
+        SaleReturn.objects.filter(
+            return_detail__sale_number=OuterRef('sale__sale_number'),
+            barcode_number=OuterRef('barcode_number'),
+        )
+        .values('barcode_number')
+        .annotate(total=Sum('qty'))
+        .values('total')
+    )
+    lines = SaleDetail.objects.annotate(returned_total=Subquery(returned)).order_by('id')
+    return (
+        SaleInfo.objects.filter(sale_number=sale_number)
+        .prefetch_related(Prefetch('details', queryset=lines))
+    )
+
+
+def sale_details_payload(sale):
+    if sale is None:
+        return None
+
+    # A barcode sold on several lines has its returns counted against the
+    # first lines first
+    left = {}
+    items = []
+    for line in sale.details.all():
+        left.setdefault(line.barcode_number, line.returned_total or 0)
+        returned_qty = min(line.qty, left[line.barcode_number])
+        left[line.barcode_number] -= returned_qty
+        items.append({
+            'barcode': line.barcode_number,
+            'item_code': line.item_code,
+            'description': line.product_name,
+            'specification': line.specification or '',
+            'qty': line.qty,
+            'returned_qty': returned_qty,
+            'sale_rate': str(line.sale_rate),
+            'amount': str(line.amount),
+        })
+    return {
+        'sale_number': sale.sale_number,
+        'sale_date': sale.sale_date.strftime('%Y-%m-%d'),
+        'customer_name': sale.customer_name,
+        'customer_contact': sale.customer_contact,
+        'total_amount': str(sale.total_amount),
+        'items': items,
+    }
+
+
+def check_returnable(sale_number, lines):
+    """
+    Raise SaleError unless every barcode in `lines` can still be returned
+    against `sale_number`: sold on it, and not already returned up to the
+    quantity sold. Returns {barcode: sale_rate} as sold (the rate of the
+    barcode's first line), which is what a return refunds.
+
+    The sale row is locked first, so two returns against the same sale
+    queue and each sees the other's quantities; the cached payload the
+    return screen caps quantities with may be stale in another worker.
+    """
+    sale_id = (
+        SaleInfo.objects.select_for_update()
+        .filter(sale_number=sale_number)
+        .values_list('pk', flat=True)
+        .first()
+    )
+    if sale_id is None:
+        raise SaleError(f"Sale {sale_number} not found.")
+
+    left = defaultdict(int)
+    rates = {}
+    sold = SaleDetail.objects.filter(sale_id=sale_id).order_by('id').values_list('barcode_number', 'qty', 'sale_rate')
+    for barcode, qty, sale_rate in sold:
+        left[barcode] += qty
+        rates.setdefault(barcode, sale_rate)
+    returned = (
+        SaleReturn.objects.filter(return_detail__sale_number=sale_number)
+        .values_list('barcode_number').annotate(total=Sum('qty'))
+    )
+    for barcode, qty in returned.order_by():
+        left[barcode] -= qty
+
+    asked = defaultdict(int)
+    for line in lines:
+        asked[line['barcode_number']] += line['qty']
+    for barcode, qty in asked.items():
+        if qty > left[barcode]:
+            raise SaleError(
+                f"Only {max(left[barcode], 0)} of {barcode} can still be returned against sale {sale_number}."
+            )
+    return rates
+
+
+def invalidate_sale_details(sale_number):
+    """
+    Drop the cached payload of a sale once the current transaction commits
+    (call when a return or exchange references the sale).
+    """
+    if sale_number:
+        transaction.on_commit(lambda: cache.delete(sale_details_key(sale_number)))
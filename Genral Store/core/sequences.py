@@ -0,0 +1,148 @@
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import BigIntegerField, F, Max
+from django.db.models.functions import Cast, Greatest
+
+from .models import (
+    DocumentSequence, SaleInfo, SaleReturnDetail, StockAssigned, StockReceivingDetail,
+    VenderDetails,
+)
+
+
+# ----------------------------------------------------
+# DOCUMENT NUMBERS
+# ----------------------------------------------------
+# Sale, return, receiving, item and vendor numbers come from one row per
+# document type in DocumentSequence. A number is taken with a single-row
+# UPDATE ... SET next_value = next_value + n, which the database serialises,
+# so two tills can never be handed the same number.
+#
+# Each row is created on first use, seeded from the highest number already
+# stored in the document table so existing data keeps counting up. Item
+# codes can also be typed in by hand (see edit_product): advance() moves
+# the sequence past a numeric code entered that way so it is never handed
+# out again. A code edited into a block another worker has already
+# reserved is not caught, so keep DOCUMENT_NUMBER_BLOCK_SIZE at 1 for items
+# if codes are edited often.
+#
+# Numbers are unique but may have gaps. The sale and return views take a
+# number before their posting transaction, so the sequence row is never
+# locked for the length of a sale; a document that then fails keeps its
+# number unused, as do numbers left in a block (see SequenceBlocks).
+
+# name -> (width, model, field)
+SEQUENCES = {
+    'sale': (7, SaleInfo, 'sale_number'),
+    'return': (6, SaleReturnDetail, 'return_number'),
+    'receiving': (7, StockReceivingDetail, 'order_number'),
+    'item': (6, StockAssigned, 'item_code'),
+    'vendor': (6, VenderDetails, 'vender_code'),
+}
+
+
+def seed_value(name):
+    """
+    First free number for a sequence, based on the existing documents.
+    """
+    width, model, field = SEQUENCES[name]
+    # Only all-digit numbers count, compared as integers: a hand-typed code
+    # such as 'TEMP' must not hide the highest real one.
+    last = (
+        model.objects.filter(**{f'{field}__regex': r'^[0-9]+$'})
+        .aggregate(max_no=Max(Cast(field, BigIntegerField())))['max_no']
+    )
+    return (last or 0) + 1
+
+
+def format_number(name, value):
+    return str(value).zfill(SEQUENCES[name][0])
+
+
+def allocate(name, count=1):
+    """
+    Reserve `count` consecutive numbers and return the first one (an int).
+
+    Runs inside the caller's transaction if there is one: a rollback gives
+    the number back, but the sequence row stays locked until the caller
+    commits.
+    """
+    with transaction.atomic():
+        rows = DocumentSequence.objects.filter(name=name)
+        if not rows.update(next_value=F('next_value') + count):
+            try:
+                with transaction.atomic():
+                    DocumentSequence.objects.create(name=name, next_value=seed_value(name))
+            except IntegrityError:
+                pass  # another worker created it first
+            rows.update(next_value=F('next_value') + count)
+        return rows.values_list('next_value', flat=True).get() - count
+
+
+def advance(name, number):
+    """
+    Make sure the sequence will not hand out `number`, a document number
+    entered by hand and already saved. Non-numeric numbers can never clash.
+
+    A sequence that has no row yet needs nothing: it is seeded past the
+    saved number on first use.
+    """
+    if number.isdigit():
+        DocumentSequence.objects.filter(name=name).update(
+            next_value=Greatest(F('next_value'), int(number) + 1)
+        )
+
+
+def peek_number(name):
+    """
+    The number the next document would get, for display only.
+    """
+    value = DocumentSequence.objects.filter(name=name).values_list('next_value', flat=True).first()
+    return format_number(name, value if value is not None else seed_value(name))
+
+
+class SequenceBlocks:
+    """
+    Per-process cache of pre-reserved number blocks.
+
+    Each refill reserves `block_size` numbers with one UPDATE, so a worker only
+    touches the sequence row once per block. Numbers left in a block when the
+    process exits are never used, which leaves gaps.
+    """
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def take(self, name):
+        if connection.in_atomic_block:
+            # A rolled-back refill would hand the same block to another worker.
+            raise RuntimeError("Number blocks must be refilled outside a transaction.")
+        with self._lock:
+            start, end = self._blocks.get(name, (0, 0))
+            if start >= end:
+                start = allocate(name, self.block_size)
+                end = start + self.block_size
+            self._blocks[name] = (start + 1, end)
+            return start
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+number_blocks = SequenceBlocks(getattr(settings, 'DOCUMENT_NUMBER_BLOCK_SIZE', 1))
+
+
+def next_number(name):
+    """
+    Allocate the next document number as a zero-padded string.
+
+    With DOCUMENT_NUMBER_BLOCK_SIZE > 1 numbers come from this process's
+    pre-reserved block when called outside a transaction.
+    """
+    if number_blocks.block_size > 1 and not connection.in_atomic_block:
+        return format_number(name, number_blocks.take(name))
+    return format_number(name, allocate(name))
@@ -0,0 +1,95 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, Sum
+
+from .models import ItemStock, ProductStockSummary
+
+
+# ----------------------------------------------------
+# PER-PRODUCT STOCK SUMMARY
+# ----------------------------------------------------
+# ProductStockSummary holds one row per item_code with the totals of all its
+# ItemStock batches. Every stock movement passes its per-item deltas to
+# apply_deltas() in the same transaction, so the summary never has to be
+# recomputed from the batches.
+
+COUNTERS = ('total_qty', 'sale_qty', 'sale_return_qty', 'stock_return_qty', 'batch_count')
+
+
+def stock_deltas():
+    """
+    An empty {item_code: {counter: delta}} accumulator.
+    """
+    return defaultdict(lambda: defaultdict(int))
+
+
+def available_delta(delta):
+    return (
+        delta.get('total_qty', 0)
+        - delta.get('sale_qty', 0)
+        + delta.get('sale_return_qty', 0)
+        - delta.get('stock_return_qty', 0)
+    )
+
+
+def apply_deltas(deltas):
+    """
+    Add per-item counter deltas to the summary rows, creating missing rows.
+
+    Items with the same deltas (e.g. every line of a basket sold once) share
+    one UPDATE, so the cost is one SELECT plus one UPDATE per distinct delta.
+
+    Must run inside a transaction. The SELECT locks the summary rows in
+    item_code order first, so the grouped UPDATEs (whose order depends on
+    the quantities) never lock two items in opposite orders at two tills.
+    """
+    if not deltas:
+        return
+
+    existing = set(
+        ProductStockSummary.objects.select_for_update()
+        .filter(item_code__in=deltas)
+        .order_by('item_code')
+        .values_list('item_code', flat=True)
+    )
+    missing = sorted(code for code in deltas if code not in existing)
+    if missing:
+        ProductStockSummary.objects.bulk_create(
+            [ProductStockSummary(item_code=code) for code in missing],
+            ignore_conflicts=True
+        )
+
+    groups = defaultdict(list)
+    for item_code, delta in deltas.items():
+        key = tuple(delta.get(counter, 0) for counter in COUNTERS)
+        if any(key):
+            groups[key].append(item_code)
+
+    for key, item_codes in groups.items():
+        delta = dict(zip(COUNTERS, key))
+        changes = {
+            counter: F(counter) + value for counter, value in delta.items() if value
+        }
+        if available_delta(delta):
+            changes['available_qty'] = F('available_qty') + available_delta(delta)
+        ProductStockSummary.objects.filter(item_code__in=item_codes).update(**changes)
+
+
+def computed_summaries():
+    """
+    Summary rows computed from scratch by aggregating ItemStock.
+    """
+    rows = (
+        ItemStock.objects.values('item_code')
+        .annotate(
+            total_qty=Sum('total_qty'),
+            sale_qty=Sum('sale_qty'),
+            sale_return_qty=Sum('sale_return_qty'),
+            stock_return_qty=Sum('stock_return_qty'),
+            available_qty=Sum('available_qty'),
+            batch_count=Count('id'),
+        )
+        .order_by('item_code')
+    )
+    for row in rows.iterator(chunk_size=2000):
+        yield ProductStockSummary(**row)
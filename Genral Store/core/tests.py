@@ -1,3 +1,1340 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import unittest
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .alerts import expiring_batches, low_stock_products
+from .allocation import open_batches
+from .cache import barcode_cache, barcode_versions, bump_versions, invalidate_on_commit, lookup_barcode
+from .instrumentation import stats_by_view
+from .models import *
+from .offline import stock_snapshot
+from .ledger import balance_as_of, record_opening_balances, take_snapshot
+from .pricing import PricingError, price_lines, sale_rates
+from .receiving import receive_stock
+from .sales import SaleError, check_returnable, post_sale
+from .sequences import SequenceBlocks, allocate, next_number, peek_number
+from .stock_summary import apply_deltas, stock_deltas
+
+
+def make_stock(barcode='111', item_code='000001', qty=10, sale_rate='50.00', expire_date=None):
+    return ItemStock.objects.create(
+        order_number='0000001',
+        vender_code='000001',
+        item_code=item_code,
+        product_name='Soap',
+        company_name='Acme',
+        barcode_number=barcode,
+        total_qty=qty,
+        rate=Decimal('40.00'),
+        sale_rate=Decimal(sale_rate),
+        expire_date=expire_date,
+    )
+
+
+class BarcodeCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        barcode_cache.clear()
+
+    def test_commit_in_another_worker_is_seen(self):
+        stock = make_stock()
+        lookup_barcode('111')
+
+        # Another worker sells and commits: its local cache is not this one
+        ItemStock.objects.filter(pk=stock.pk).update(available_qty=4)
+        bump_versions(['111'])
+
+        self.assertEqual(lookup_barcode('111')['available_qty'], 4)
+
+    def test_lookup_racing_a_sale_does_not_restore_the_old_row(self):
+        stock = make_stock()
+        version = barcode_versions(['111'])['111']
+        stale = lookup_barcode('111')
+        # The sale commits after the lookup read the row but before it stored it
+        ItemStock.objects.filter(pk=stock.pk).update(available_qty=4)
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_on_commit(['111'])
+        barcode_cache.set('111', stale, version)
+
+        self.assertEqual(lookup_barcode('111')['available_qty'], 4)
+
+    def test_repeated_scan_is_served_from_cache(self):
+        make_stock()
+        url = reverse('get_product_by_barcode')
+
+        self.client.get(url, {'barcode': '111'})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'barcode': '111'})
+
+        self.assertEqual(response.json()['available_qty'], 10)
+        self.assertEqual(barcode_cache.stats()['hits'], 1)
+        self.assertEqual(barcode_cache.stats()['misses'], 1)
+
+    def test_batch_scan_resolves_misses_in_one_query(self):
+        make_stock(barcode='111')
+        make_stock(barcode='222', item_code='000002', qty=0)
+        url = reverse('get_products_by_barcodes')
+        self.client.get(reverse('get_product_by_barcode'), {'barcode': '111'})
+
+        with self.assertNumQueries(1):
+            response = self.client.post(url, {'barcodes': ['111', '222', '333', '222']},
+                                        content_type='application/json')
+
+        results = response.json()['results']
+        self.assertEqual(results['111']['available_qty'], 10)
+        self.assertEqual(results['222'], {'item_code': '000002', 'qty': 0})
+        self.assertEqual(results['333'], {})
+        with self.assertNumQueries(0):
+            self.client.post(url, {'barcodes': ['222', '333']}, content_type='application/json')
+        self.assertEqual(self.client.post(url, {'barcodes': 'x'},
+                                          content_type='application/json').status_code, 400)
+
+    def test_sale_invalidates_cached_barcode(self):
+        make_stock()
+        url = reverse('get_product_by_barcode')
+        self.client.get(url, {'barcode': '111'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('sales'), {
+                'sale_date': '2025-01-01',
+                'customer_name': 'Walk-in',
+                'total_quantity': 3,
+                'total_amount': '150.00',
+                'cash_received': '150.00',
+                'cash_return': '0.00',
+                'barcode[]': ['111'],
+                'item_code[]': ['000001'],
+                'product_name[]': ['Soap'],
+                'company_name[]': ['Acme'],
+                'specification[]': [''],
+                'qty[]': ['3'],
+                'sale_rate[]': ['50.00'],
+                'amount[]': ['150.00'],
+            })
+
+        response = self.client.get(url, {'barcode': '111'})
+        self.assertEqual(response.json()['available_qty'], 7)
+
+
+def sale_line(barcode='111', item_code='000001', qty=1, sale_rate='50.00'):
+    return {
+        'barcode_number': barcode,
+        'item_code': item_code,
+        'product_name': 'Soap',
+        'company_name': 'Acme',
+        'specification': '',
+        'qty': qty,
+        'sale_rate': Decimal(sale_rate),
+        'amount': Decimal(sale_rate) * qty,
+    }
+
+
+def sale_header(sale_number='0000001'):
+    return {
+        'sale_number': sale_number,
+        'sale_date': '2025-01-01',
+        'customer_name': 'Walk-in',
+        'total_quantity': 0,
+        'total_amount': Decimal('0.00'),
+        'cash_received': Decimal('0.00'),
+        'cash_return': Decimal('0.00'),
+    }
+
+
+class PostSaleTests(TestCase):
+
+    def test_statement_count_does_not_grow_with_basket(self):
+        for i in range(40):
+            make_stock(barcode=f'B{i}', item_code=str(i).zfill(6))
+
+        def statements(size, sale_number):
+            lines = [sale_line(f'B{i}', str(i).zfill(6)) for i in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                post_sale(lines, **sale_header(sale_number))
+            return len(queries)
+
+        self.assertEqual(statements(5, '0000001'), statements(40, '0000002'))
+        self.assertEqual(SaleDetail.objects.count(), 45)
+        self.assertEqual(ItemStock.objects.get(barcode_number='B3').available_qty, 8)
+        self.assertEqual(ItemStock.objects.get(barcode_number='B30').available_qty, 9)
+
+    def test_insufficient_stock_writes_nothing(self):
+        make_stock(qty=2)
+
+        with self.assertRaises(SaleError):
+            post_sale([sale_line(qty=2), sale_line(qty=1)], **sale_header())
+
+        self.assertFalse(SaleInfo.objects.exists())
+        self.assertEqual(ItemStock.objects.get().available_qty, 2)
+
+
+class BatchAllocationTests(TestCase):
+
+    def setUp(self):
+        make_stock(barcode='EXPIRED', qty=5, expire_date='2024-12-01')
+        make_stock(barcode='JUNE', qty=2, sale_rate='55.00', expire_date='2025-06-01')
+        make_stock(barcode='NONE', qty=10, sale_rate='60.00')
+        make_stock(barcode='MARCH', qty=3, expire_date='2025-03-01')
+
+    def available(self):
+        return dict(ItemStock.objects.values_list('barcode_number', 'available_qty'))
+
+    def test_item_line_is_split_across_batches_first_expiry_first(self):
+        post_sale([sale_line('', qty=6)], **dict(sale_header(), total_amount=Decimal('320.00')))
+
+        lines = SaleDetail.objects.order_by('id').values_list('barcode_number', 'qty', 'sale_rate', 'amount')
+        self.assertEqual(list(lines), [
+            ('MARCH', 3, Decimal('50.00'), Decimal('150.00')),
+            ('JUNE', 2, Decimal('55.00'), Decimal('110.00')),
+            ('NONE', 1, Decimal('60.00'), Decimal('60.00')),
+        ])
+        self.assertEqual(self.available(), {'EXPIRED': 5, 'MARCH': 0, 'JUNE': 0, 'NONE': 9})
+        self.assertEqual(ProductStockSummary.objects.get().sale_qty, 6)
+
+    def test_scanned_lines_are_reserved_before_allocation(self):
+        post_sale([sale_line('MARCH', qty=2), sale_line('', qty=2)],
+                  **dict(sale_header(), total_amount=Decimal('205.00')))
+
+        self.assertEqual(self.available(), {'EXPIRED': 5, 'MARCH': 0, 'JUNE': 1, 'NONE': 10})
+
+    def test_stale_plan_falls_back_to_every_open_batch(self):
+        # The unlocked plan saw only JUNE, as if another till had emptied
+        # MARCH and restocked it before this sale locked its rows
+        june = ItemStock.objects.get(barcode_number='JUNE').pk
+        with mock.patch('core.sales.plan_batches', return_value={june}):
+            post_sale([sale_line('', qty=6)], **dict(sale_header(), total_amount=Decimal('320.00')))
+
+        self.assertEqual(self.available(), {'EXPIRED': 5, 'MARCH': 0, 'JUNE': 0, 'NONE': 9})
+
+    def test_total_the_till_did_not_show_is_rejected(self):
+        # Priced at the first batch's rate, but spanning dearer batches
+        with self.assertRaisesMessage(PricingError, "bring the total to 320.00, not 300.00"):
+            post_sale([sale_line('', qty=6)], **dict(sale_header(), total_amount=Decimal('300.00')))
+
+        self.assertFalse(SaleInfo.objects.exists())
+        self.assertEqual(self.available()['MARCH'], 3)
+
+    def test_expired_batches_are_not_sold(self):
+        with self.assertRaises(SaleError):
+            post_sale([sale_line('', qty=16)], **sale_header())
+
+        self.assertFalse(SaleInfo.objects.exists())
+        self.assertEqual(self.available(), {'EXPIRED': 5, 'MARCH': 3, 'JUNE': 2, 'NONE': 10})
+
+    def test_item_lookup_reports_first_batch_and_open_stock(self):
+        data = self.client.get(reverse('get_item_stock'), {'item_code': '000001'}).json()
+
+        # today is past every expiry date of the fixture
+        self.assertEqual((data['available_qty'], data['sale_rate'], data['batches']), (10, '60.00', 1))
+        self.assertEqual(self.client.get(reverse('get_item_stock'), {'item_code': 'x'}).json(), {})
+
+
+class StockAlertTests(TestCase):
+
+    def setUp(self):
+        today = timezone.now().date()
+        make_stock(barcode='SOON', qty=3, expire_date=today + timezone.timedelta(days=5))
+        make_stock(barcode='LATER', qty=4, expire_date=today + timezone.timedelta(days=90))
+        make_stock(barcode='EXPIRED', qty=2, expire_date=today - timezone.timedelta(days=3))
+        make_stock(barcode='SOLD', qty=0, expire_date=today + timezone.timedelta(days=1))
+        make_stock(barcode='NODATE', qty=6)
+        StockAssigned.objects.create(item_code='000001', product_name='Soap', company_name='Acme',
+                                     reorder_level=20)
+        StockAssigned.objects.create(item_code='000002', product_name='Salt', company_name='Acme',
+                                     reorder_level=10)
+        StockAssigned.objects.create(item_code='000003', product_name='Rice', company_name='Acme')
+        call_command('rebuild_stock_summary', stdout=StringIO())
+
+    def test_command_writes_expiring_and_low_stock_alerts(self):
+        StockAlert.objects.create(kind=StockAlert.LOW_STOCK, item_code='OLD', product_name='Old',
+                                  company_name='Acme', available_qty=0)
+        out = StringIO()
+
+        call_command('check_stock_alerts', '--days', '30', stdout=out)
+
+        self.assertIn('2 batches expiring within 30 days, 2 products below reorder level', out.getvalue())
+        expiring = StockAlert.objects.filter(kind=StockAlert.EXPIRING).order_by('expire_date')
+        self.assertEqual([(a.barcode_number, a.available_qty) for a in expiring], [('EXPIRED', 2), ('SOON', 3)])
+        # 000002 was never received; 000003 has no reorder level
+        low = StockAlert.objects.filter(kind=StockAlert.LOW_STOCK).order_by('item_code')
+        self.assertEqual([(a.item_code, a.available_qty, a.reorder_level) for a in low],
+                         [('000001', 15, 20), ('000002', 0, 10)])
+
+    def test_dashboard_serves_stored_alerts(self):
+        call_command('check_stock_alerts', stdout=StringIO())
+
+        with self.assertNumQueries(4):
+            data = self.client.get(reverse('stock_alerts')).json()
+        self.assertEqual(data['counts'], {'expiring': 2, 'low_stock': 2})
+        self.assertEqual([(a['barcode_number'], a['days_left']) for a in data['expiring']],
+                         [('EXPIRED', -3), ('SOON', 5)])
+        self.assertEqual([a['item_code'] for a in data['low_stock']], ['000002', '000001'])
+
+        data = self.client.get(reverse('stock_alerts'), {'kind': 'low_stock', 'limit': '1'}).json()
+        self.assertNotIn('expiring', data)
+        self.assertEqual(len(data['low_stock']), 1)
+
+
+class OfflineTillTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_stock(barcode='111', qty=3)
+        make_stock(barcode='222', qty=0)
+
+    def snapshot(self, **params):
+        return self.client.get(reverse('offline_stock_snapshot'), params).json()
+
+    def offline_sale(self, reference, barcode='111', qty=1):
+        line = dict(sale_line(barcode, qty=qty), sale_rate='50.00', amount=str(50 * qty))
+        return {
+            'client_reference': reference, 'sale_date': '2025-01-01', 'customer_name': 'Walk-in',
+            'total_quantity': qty, 'total_amount': str(50 * qty), 'lines': [line],
+        }
+
+    def sync(self, *sales):
+        response = self.client.post(reverse('offline_sync_sales'), {'sales': list(sales)},
+                                    content_type='application/json')
+        return [(r['client_reference'], r['status']) for r in response.json()['results']]
+
+    def test_snapshot_then_delta_after_a_sale(self):
+        full = self.snapshot()
+        self.assertTrue(full['full'])
+        # Sold-out barcodes are left out
+        self.assertEqual(full['items'], {'111': ['000001', 'Soap', 'Acme', '', '50.00', 3]})
+
+        post_sale([sale_line(qty=3)], **sale_header())
+
+        delta = self.snapshot(since=full['version'])
+        self.assertFalse(delta['full'])
+        self.assertGreater(delta['version'], full['version'])
+        self.assertEqual(delta['items'], {'111': None})
+
+    def test_sync_posts_each_sale_once(self):
+        results = self.sync(self.offline_sale('a'), self.offline_sale('b', qty=5), self.offline_sale('c'))
+        self.assertEqual(results, [('a', 'posted'), ('b', 'rejected'), ('c', 'posted')])
+
+        # The till never got the response and sends the same batch again
+        results = self.sync(self.offline_sale('a'), self.offline_sale('c'), self.offline_sale('c'))
+        self.assertEqual(results, [('a', 'duplicate'), ('c', 'duplicate'), ('c', 'duplicate')])
+
+        self.assertEqual(SaleInfo.objects.count(), 2)
+        self.assertEqual(ItemStock.objects.get(barcode_number='111').available_qty, 1)
+
+    def test_sync_rejects_malformed_requests(self):
+        url = reverse('offline_sync_sales')
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(url, {'sales': 'x'}, content_type='application/json').status_code, 400)
+        self.assertEqual(self.sync({'sale_date': '2025-01-01'}, dict(self.offline_sale('d'), lines=[])),
+                         [('', 'rejected'), ('d', 'rejected')])
+
+
+def sale_form(key, qty=1):
+    return {
+        'idempotency_key': key, 'sale_date': '2025-01-01', 'customer_name': 'Walk-in',
+        'total_quantity': qty, 'total_amount': str(50 * qty), 'cash_received': '0', 'cash_return': '0',
+        'barcode[]': ['111'], 'item_code[]': ['000001'], 'product_name[]': ['Soap'],
+        'company_name[]': ['Acme'], 'specification[]': [''], 'qty[]': [str(qty)],
+        'sale_rate[]': ['50.00'], 'amount[]': [str(50 * qty)],
+    }
+
+
+def return_form(key):
+    return {
+        'idempotency_key': key, 'sale_number': '0000001', 'return_date': '2025-01-02',
+        'barcode[]': ['111'], 'description[]': ['Soap'], 'specification[]': [''],
+        'qty[]': ['1'], 'sale_rate[]': ['50.00'], 'amount[]': ['50.00'],
+    }
+
+
+class IdempotentSubmissionTests(TestCase):
+
+    def setUp(self):
+        make_stock(qty=10)
+
+    def test_resubmitted_sale_returns_the_recorded_sale(self):
+        first = self.client.post(reverse('sales'), sale_form('k1', qty=2))
+        # The retry stops at the token lookup, before any stock is touched
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.post(reverse('sales'), sale_form('k1', qty=2))
+
+        self.assertEqual(first.status_code, 302)
+        self.assertIn('Sale 0000001 was already recorded.', [str(m) for m in get_messages(second.wsgi_request)])
+        self.assertFalse(any('core_itemstock' in q['sql'] for q in queries.captured_queries))
+        self.assertEqual(SaleInfo.objects.count(), 1)
+        self.assertEqual(ItemStock.objects.get().available_qty, 8)
+
+        # A new form gets a new token and a new sale
+        self.client.post(reverse('sales'), sale_form('k2'))
+        self.assertEqual(ItemStock.objects.get().available_qty, 7)
+
+    def test_resubmitted_return_is_recorded_once(self):
+        self.client.post(reverse('sales'), sale_form('s1', qty=2))
+
+        for _ in range(2):
+            response = self.client.post(reverse('Sale_return'), return_form('r1'))
+            self.assertRedirects(response, reverse('Sale_return'), fetch_redirect_response=False)
+
+        self.assertEqual(SaleReturnDetail.objects.count(), 1)
+        self.assertEqual(ItemStock.objects.get().available_qty, 9)
+        self.assertEqual(IdempotencyKey.objects.get(scope=IdempotencyKey.RETURN).document_number, '000001')
+
+
+class SalePricingTests(TestCase):
+
+    def setUp(self):
+        make_stock(qty=10)
+
+    def test_lines_are_priced_from_stock_in_one_pass(self):
+        lines = [sale_line(qty=3), dict(sale_line('', qty=2), sale_rate=Decimal('7.5'), amount=Decimal('15'))]
+        with self.assertNumQueries(1):
+            rates = sale_rates(['111', '111'])
+
+        self.assertEqual(price_lines(lines, rates, quantity='5', amount='165.00'), (5, Decimal('165.00')))
+        with self.assertRaisesMessage(PricingError, "111 rate 45.00 (stock rate 50.00)"):
+            price_lines([dict(sale_line(), sale_rate=Decimal('45.00'), amount=Decimal('45.00'))], rates)
+        with self.assertRaisesMessage(PricingError, "not in stock"):
+            price_lines([sale_line('999')], rates)
+
+    def test_tampered_sale_is_rejected(self):
+        response = self.client.post(reverse('sales'), dict(sale_form('p1', qty=2), total_amount='1.00'))
+
+        self.assertIn('total amount 1.00 (expected 100.00)', str(list(get_messages(response.wsgi_request))[0]))
+        self.assertFalse(SaleInfo.objects.exists())
+        self.assertEqual(ItemStock.objects.get().available_qty, 10)
+
+        self.client.post(reverse('sales'), dict(sale_form('p2'), **{'sale_rate[]': ['1.00'], 'amount[]': ['1.00']}))
+        self.assertFalse(SaleInfo.objects.exists())
+
+    def test_item_code_sale_must_match_the_batch_rates(self):
+        form = dict(sale_form('p3', qty=2), **{'barcode[]': [''], 'sale_rate[]': ['40.00'], 'amount[]': ['80.00']},
+                    total_amount='80.00')
+        self.client.post(reverse('sales'), form)
+        self.assertFalse(SaleInfo.objects.exists())
+
+        self.client.post(reverse('sales'), dict(sale_form('p4', qty=2), **{'barcode[]': ['']}))
+        self.assertEqual(SaleInfo.objects.get().total_amount, Decimal('100.00'))
+        self.assertEqual(SaleDetail.objects.get().barcode_number, '111')
+
+    def test_return_totals_are_recomputed(self):
+        self.client.post(reverse('sales'), sale_form('s1', qty=2))
+        self.client.post(reverse('Sale_return'), dict(return_form('r1'), total_quantity='1'))
+
+        detail = SaleReturnDetail.objects.get()
+        self.assertEqual((detail.total_quantity, detail.total_amount, detail.amount_refunded),
+                         (1, Decimal('50.00'), Decimal('50.00')))
+
+        response = self.client.post(reverse('Sale_return'), dict(return_form('r2'), amount_refunded='500'))
+        self.assertEqual(response.json()['status'], 'error')
+        self.assertEqual(SaleReturnDetail.objects.count(), 1)
+        self.assertEqual(ItemStock.objects.get().available_qty, 9)
+
+    def test_return_refunds_the_rate_sold_at(self):
+        self.client.post(reverse('sales'), sale_form('s1', qty=2))
+        ItemStock.objects.update(sale_rate=Decimal('60.00'))
+
+        # The cashier may refund less than the goods are worth
+        self.client.post(reverse('Sale_return'), dict(return_form('r1'), amount_refunded='45.5'))
+        response = self.client.post(reverse('Sale_return'), dict(
+            return_form('r2'), **{'sale_rate[]': ['60.00'], 'amount[]': ['60.00']}
+        ))
+
+        self.assertEqual(response.json()['status'], 'error')
+        detail = SaleReturnDetail.objects.get()
+        self.assertEqual((detail.total_amount, detail.amount_refunded), (Decimal('50.00'), Decimal('45.50')))
+        self.assertEqual(SaleReturn.objects.get().sale_amount, Decimal('50.00'))
+
+
+class IdempotentSubmissionConcurrencyTests(TransactionTestCase):
+
+    def submit_together(self, url, form, count=6):
+        """
+        POST the same form from `count` threads at once; returns the status codes.
+        """
+        start = threading.Barrier(count)
+        statuses, errors = [], []
+
+        def run():
+            try:
+                start.wait(10)
+                statuses.append(Client().post(url, form).status_code)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return statuses
+
+    def test_concurrent_duplicate_sales_post_once(self):
+        make_stock(qty=10)
+
+        statuses = self.submit_together(reverse('sales'), sale_form('dup', qty=2))
+
+        self.assertEqual(statuses, [302] * 6)
+        self.assertEqual(SaleInfo.objects.count(), 1)
+        self.assertEqual(SaleDetail.objects.count(), 1)
+        self.assertEqual(ItemStock.objects.get().available_qty, 8)
+        self.assertEqual(StockMovement.objects.count(), 1)
+
+    def test_concurrent_duplicate_returns_post_once(self):
+        make_stock(qty=10)
+        Client().post(reverse('sales'), sale_form('sale', qty=2))
+
+        statuses = self.submit_together(reverse('Sale_return'), return_form('dup'))
+
+        self.assertEqual(statuses, [302] * 6)
+        self.assertEqual(SaleReturnDetail.objects.count(), 1)
+        self.assertEqual(ItemStock.objects.get().available_qty, 9)
+
+
+class ReceiveStockTests(TestCase):
+
+    def setUp(self):
+        self.vendor = VenderDetails.objects.create(
+            vender_code='000001', vender_name='Supplier', company_name='Acme'
+        )
+        StockAssigned.objects.create(item_code='000001', product_name='Soap', company_name='Acme')
+
+    def row(self, barcode, item_code='000001', qty='5', rate='10', exp_date=None):
+        return {
+            'item_code': item_code, 'barcode_number': barcode, 'qty': qty,
+            'rate': rate, 'sale_rate': '12', 'exp_date': exp_date,
+        }
+
+    def test_bad_rows_are_reported_and_good_rows_posted(self):
+        StockReceivingDetail.objects.create(
+            order_number='0000001', order_date='2025-01-01', vender=self.vendor,
+            product=StockAssigned.objects.get(), barcode_number='OLD', qty=1,
+            rate=Decimal('1'), sale_rate=Decimal('1'),
+        )
+        rows = [
+            self.row('A1'),
+            self.row('OLD'),
+            self.row('A2', item_code='999999'),
+            self.row('A1'),
+            self.row('A3', qty='x'),
+            self.row('A4', exp_date='31/12/2025'),
+            self.row('A5', exp_date='2025-12-31'),
+        ]
+
+        receiver = receive_stock(self.vendor, rows, '0000002', '2025-01-02')
+
+        self.assertEqual([n for n, _ in receiver.errors], [2, 3, 4, 5, 6])
+        self.assertEqual(receiver.rows_received, 2)
+        header = stockreceving.objects.get(order_number='0000002')
+        self.assertEqual(header.total_qty, 10)
+        self.assertEqual(header.total_amount, Decimal('100.00'))
+        self.assertEqual(ItemStock.objects.get(barcode_number='A5').available_qty, 5)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def statements(size, prefix):
+            rows = [self.row(f'{prefix}{i}') for i in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                receive_stock(self.vendor, rows, '0000002', '2025-01-02')
+            return len(queries)
+
+        statements(1, 'W')  # creates the product's summary row
+        self.assertEqual(statements(5, 'A'), statements(40, 'B'))
+        self.assertEqual(ItemStock.objects.count(), 46)
+
+
+class PurchaseOrderUploadTests(TestCase):
+
+    def setUp(self):
+        VenderDetails.objects.create(vender_code='000001', vender_name='Supplier', company_name='Acme')
+        StockAssigned.objects.create(item_code='000001', product_name='Soap', company_name='Acme')
+
+    def upload(self, name, content):
+        return self.client.post(reverse('stock_receiving_list'), {
+            'vendor': '000001-Supplier',
+            'upload_id': 'test-upload',
+            'po_file': SimpleUploadedFile(name, content),
+        })
+
+    @override_settings(RECEIVING_CHUNK_SIZE=2)
+    def test_csv_is_received_in_chunks_with_summary(self):
+        content = (
+            "Item Code,Barcode,Qty,Rate,Sale Rate,Exp.Date\n"
+            "000001,C1,5,10,12,2026-01-31\n"
+            "000001,C2,3,10,12,\n"
+            "999999,C3,1,10,12,\n"
+            "000001,C1,1,10,12,\n"
+            "000001,C4,2,10,12,\n"
+        ).encode()
+
+        self.upload('po.csv', content)
+
+        self.assertEqual(
+            sorted(ItemStock.objects.values_list('barcode_number', flat=True)),
+            ['C1', 'C2', 'C4']
+        )
+        self.assertEqual(stockreceving.objects.get().total_qty, 10)
+        progress = self.client.get(reverse('stock_receiving_progress', args=['test-upload'])).json()
+        self.assertTrue(progress['done'])
+        self.assertEqual(progress['rows_seen'], 5)
+        self.assertEqual([e['row'] for e in progress['errors']], [3, 4])
+
+    def test_unsupported_file_type_is_rejected(self):
+        response = self.upload('po.txt', b'item_code\n000001\n')
+
+        self.assertRedirects(response, reverse('stock_receiving_list'))
+        self.assertFalse(ItemStock.objects.exists())
+        # The page stops polling once the failure is published
+        progress = self.client.get(reverse('stock_receiving_progress', args=['test-upload'])).json()
+        self.assertTrue(progress['done'])
+        self.assertTrue(progress['error'])
+
+
+class ProductCatalogueTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        StockAssigned.objects.bulk_create([
+            StockAssigned(item_code=str(i).zfill(6), product_name=f'Product {i}',
+                          company_name='Acme' if i % 2 else 'Globex')
+            for i in range(1, 8)
+        ])
+
+    def search(self, **params):
+        return self.client.get(reverse('product_search'), params).json()
+
+    def test_pages_walk_the_catalogue_in_item_code_order(self):
+        seen = []
+        page = self.search(limit=3)
+        while True:
+            seen += [row['item_code'] for row in page['results']]
+            if not page['next']:
+                break
+            page = self.search(limit=3, after=page['next'])
+
+        self.assertEqual(seen, [str(i).zfill(6) for i in range(1, 8)])
+        self.assertEqual(page['total'], 7)
+
+    def test_search_matches_code_prefix_name_and_company(self):
+        self.assertEqual(len(self.search(q='Globex')['results']), 3)
+        self.assertEqual([r['item_code'] for r in self.search(q='000007')['results']], ['000007'])
+        self.assertEqual([r['item_code'] for r in self.search(q='product 5')['results']], ['000005'])
+
+    def test_count_is_cached_until_a_product_is_added(self):
+        self.search()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.search()['total'], 7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('products'), {'product_name': 'New', 'company_name': 'Acme'})
+
+        self.assertEqual(self.search()['total'], 8)
+
+    def test_products_page_does_not_render_the_catalogue(self):
+        response = self.client.get(reverse('products'))
+
+        self.assertContains(response, '7 items')
+        self.assertNotContains(response, 'Product 3')
+
+
+class TypeaheadTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        StockAssigned.objects.create(item_code='000001', product_name='Sugar', company_name='Acme')
+        StockAssigned.objects.create(item_code='000002', product_name='Soap', company_name='Sunlight')
+        StockAssigned.objects.create(item_code='000003', product_name='Rice', company_name='Sunrise')
+        VenderDetails.objects.create(vender_code='000001', vender_name='Ali Traders', company_name='Acme')
+
+    def codes(self, url_name, **params):
+        return [
+            row.get('item_code') or row.get('vender_code')
+            for row in self.client.get(reverse(url_name), params).json()['results']
+        ]
+
+    def test_prefix_matches_come_before_substring_matches(self):
+        self.assertEqual(self.codes('product_typeahead', q='su'), ['000001', '000002', '000003'])
+        self.assertEqual(self.codes('product_typeahead', q='sun'), ['000002', '000003'])
+        self.assertEqual(self.codes('product_typeahead', q='s', limit=1), ['000001'])
+        self.assertEqual(self.codes('vendor_typeahead', q='acme'), ['000001'])
+
+    def test_results_are_cached_until_the_catalogue_changes(self):
+        self.codes('product_typeahead', q='ri')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.codes('product_typeahead', q='ri'), ['000003'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('products'), {'product_name': 'Rice Flour', 'company_name': 'Acme'})
+
+        self.assertEqual(self.codes('product_typeahead', q='ri'), ['000003', '000004'])
+
+    def test_barcode_resolves_to_product_with_last_rates(self):
+        make_stock(barcode='B1', item_code='000002', sale_rate='55.00')
+        url = reverse('resolve_receiving_barcode')
+
+        product = self.client.get(url, {'barcode': 'B1'}).json()
+        self.assertEqual(product['product_name'], 'Soap')
+        self.assertEqual(product['sale_rate'], '55.00')
+        # A batch barcode is received once, so the screen must not add it again
+        self.assertTrue(product['already_received'])
+
+        by_code = self.client.get(url, {'barcode': '000002'}).json()
+        self.assertEqual((by_code['barcode_number'], by_code['sale_rate'], by_code['already_received']),
+                         ('', '55.00', False))
+        self.assertEqual(self.client.get(url, {'barcode': 'X'}).json(), {})
+
+    def test_receiving_page_does_not_embed_the_catalogue(self):
+        response = self.client.get(reverse('stock_receiving_list'))
+
+        self.assertNotContains(response, 'Sugar')
+        self.assertNotContains(response, 'Ali Traders')
+
+
+class RequestInstrumentationTests(TestCase):
+
+    def setUp(self):
+        barcode_cache.clear()
+        stats_by_view.clear()
+
+    def test_requests_are_timed_and_aggregated_per_view(self):
+        make_stock()
+        response = self.client.get(reverse('get_product_by_barcode'), {'barcode': '111'})
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+        stats = self.client.get(reverse('request_stats')).json()['views']
+        scans = stats['get_product_by_barcode']
+        self.assertEqual((scans['requests'], scans['max_queries']), (1, 1))
+        self.assertEqual(sum(scans['histogram'].values()), 1)
+        self.assertEqual(self.client.get(reverse('request_stats'),
+                                         REMOTE_ADDR='10.0.0.9').status_code, 404)
+
+    @override_settings(N_PLUS_ONE_THRESHOLD=3)
+    def test_repeated_statements_are_tagged(self):
+        make_stock(barcode='A')
+        make_stock(barcode='B', item_code='000002')
+        make_stock(barcode='C', item_code='000003')
+        post_sale([sale_line('A'), sale_line('B', '000002'), sale_line('C', '000003')], **sale_header())
+
+        with self.assertLogs('core.requests', 'WARNING') as logs:
+            self.client.post(reverse('Sale_return'), {
+                'sale_number': '0000001', 'return_date': '2025-01-02',
+                'barcode[]': ['A', 'B', 'C'], 'description[]': ['Soap'] * 3,
+                'specification[]': [''] * 3, 'qty[]': ['1'] * 3,
+                'sale_rate[]': ['50.00'] * 3, 'amount[]': ['50.00'] * 3,
+            })
+
+        self.assertIn('[n+1]', logs.output[0])
+        self.assertEqual(stats_by_view.snapshot()['Sale_return']['n_plus_one'], 1)
+
+
+class RequestProfilingTests(TestCase):
+
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        self.settings_override = override_settings(PROFILING_ENABLED=True, PROFILE_DIR=self.profile_dir.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.staff = User.objects.create_user('manager', password='x', is_staff=True)
+
+    def test_flagged_staff_request_is_profiled_and_summarised(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('sales'), HTTP_X_PROFILE='1')
+
+        name = response['X-Profile-Id']
+        self.assertTrue(os.path.exists(os.path.join(self.profile_dir.name, name + '.prof')))
+        out = StringIO()
+        call_command('list_profiles', stdout=out)
+        self.assertIn('/sales/', out.getvalue())
+        self.assertRegex(out.getvalue(), r'\n  core\.views\.sales +[0-9.]+ms total')
+
+        out = StringIO()
+        call_command('list_profiles', '--module', 'core.cache', '--module', 'core.views', stdout=out)
+        self.assertIn('Cumulative time in core.cache, core.views', out.getvalue())
+        self.assertRegex(out.getvalue(), r'\n  core\.views\.sales +[0-9.]+ms total')
+
+    def test_unflagged_and_non_staff_requests_are_not_profiled(self):
+        self.client.get(reverse('sales'), {'_profile': '1'})
+        self.client.force_login(User.objects.create_user('till', password='x'))
+        self.client.get(reverse('sales'), {'_profile': '1'})
+        self.client.force_login(self.staff)
+        self.client.get(reverse('sales'))
+
+        self.assertEqual(os.listdir(self.profile_dir.name), [])
+
+
+class DocumentSequenceTests(TestCase):
+
+    def test_sequence_is_seeded_from_existing_documents(self):
+        SaleInfo.objects.create(**sale_header('0000041'))
+
+        self.assertEqual(peek_number('sale'), '0000042')
+        self.assertEqual(peek_number('sale'), '0000042')
+        self.assertEqual(next_number('sale'), '0000042')
+        self.assertEqual(next_number('sale'), '0000043')
+        self.assertEqual(next_number('return'), '000001')
+
+    def test_item_code_edited_by_hand_is_not_handed_out_again(self):
+        self.assertEqual(next_number('item'), '000001')
+        product = StockAssigned.objects.create(item_code='000001', product_name='Tea', company_name='Acme')
+
+        self.client.post(reverse('edit_product', args=[product.pk]), {
+            'item_code': '000002', 'product_name': 'Tea', 'company_name': 'Acme',
+        })
+
+        self.assertEqual(StockAssigned.objects.get().item_code, '000002')
+        self.assertEqual(next_number('item'), '000003')
+
+    def test_seed_skips_codes_that_are_not_numbers(self):
+        StockAssigned.objects.create(item_code='000041', product_name='Tea', company_name='Acme')
+        StockAssigned.objects.create(item_code='TEMP', product_name='Salt', company_name='Acme')
+
+        self.assertEqual(next_number('item'), '000042')
+
+    def test_sale_return_ignores_posted_return_number(self):
+        self.client.post(reverse('Sale_return'), {'return_number': '000500'})
+
+        self.assertEqual(SaleReturnDetail.objects.get().return_number, '000001')
+
+
+class DocumentSequenceConcurrencyTests(TransactionTestCase):
+
+    def run_workers(self, worker, count):
+        results = []
+        errors = []
+
+        def run():
+            try:
+                results.extend(worker())
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def test_concurrent_allocations_have_no_gaps_or_duplicates(self):
+        numbers = self.run_workers(lambda: [allocate('sale') for _ in range(25)], 8)
+
+        self.assertEqual(sorted(numbers), list(range(1, 201)))
+
+    def test_concurrent_blocks_have_no_gaps_or_duplicates(self):
+        def worker():
+            blocks = SequenceBlocks(block_size=10)
+            return [blocks.take('sale') for _ in range(30)]
+
+        numbers = self.run_workers(worker, 8)
+
+        self.assertEqual(sorted(numbers), list(range(1, 241)))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Row-level locking needs PostgreSQL")
+class PostgreSQLStockLockingTests(TransactionTestCase):
+    """
+    Run with ERP_DB_PROFILE=postgresql against a local PostgreSQL server.
+    """
+
+    def setUp(self):
+        make_stock(barcode='A', item_code='000001', qty=10)
+        make_stock(barcode='B', item_code='000002', qty=10)
+
+    def hold_sale(self, barcode, qty, holding, release):
+        """
+        In a thread: post a sale and keep its transaction (and row locks) open
+        until `release` is set.
+        """
+        def run():
+            try:
+                with transaction.atomic():
+                    post_sale([sale_line(barcode, qty=qty)], **sale_header('HOLD'))
+                    holding.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.assertTrue(holding.wait(10))
+        return thread
+
+    def test_sales_on_different_barcodes_do_not_block(self):
+        holding, release = threading.Event(), threading.Event()
+        thread = self.hold_sale('A', 1, holding, release)
+        try:
+            with transaction.atomic():
+                # Fail instead of hanging if B were blocked behind A's locks
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = '2s'")
+                post_sale([sale_line('B', item_code='000002')], **sale_header('0000002'))
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(ItemStock.objects.get(barcode_number='B').available_qty, 9)
+
+    def test_sales_on_the_same_barcode_queue_and_see_the_decrement(self):
+        holding, release = threading.Event(), threading.Event()
+        thread = self.hold_sale('A', 6, holding, release)
+        threading.Timer(0.5, release.set).start()
+        try:
+            # Waits for the held sale to commit, then finds only 4 left
+            with self.assertRaisesMessage(SaleError, 'Insufficient stock'):
+                post_sale([sale_line('A', qty=6)], **sale_header('0000002'))
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(ItemStock.objects.get(barcode_number='A').available_qty, 4)
+
+    def test_nowait_fails_at_once_on_a_locked_barcode(self):
+        holding, release = threading.Event(), threading.Event()
+        thread = self.hold_sale('A', 1, holding, release)
+        try:
+            with self.assertRaisesMessage(SaleError, 'another till'):
+                post_sale([sale_line('A')], nowait=True, **sale_header('0000002'))
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(ItemStock.objects.get(barcode_number='A').available_qty, 9)
+
+    def test_snapshot_waits_for_movements_still_committing(self):
+        holding, release = threading.Event(), threading.Event()
+        # A's movement gets the lower id but commits after B's
+        thread = self.hold_sale('A', 1, holding, release)
+        try:
+            post_sale([sale_line('B', item_code='000002')], **sale_header('0000002'))
+            threading.Timer(0.5, release.set).start()
+            take_snapshot()
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(
+            sorted(StockSnapshot.objects.values_list('barcode_number', 'balance')),
+            [('A', -1), ('B', -1)]
+        )
+        self.assertEqual(take_snapshot(), 0)
+
+    def test_offline_version_waits_for_movements_still_committing(self):
+        version = json.loads(stock_snapshot())['version']
+        holding, release = threading.Event(), threading.Event()
+        thread = self.hold_sale('A', 1, holding, release)
+        try:
+            post_sale([sale_line('B', item_code='000002')], **sale_header('0000002'))
+            threading.Timer(0.5, release.set).start()
+            delta = json.loads(stock_snapshot(since=version))
+        finally:
+            release.set()
+            thread.join()
+
+        # A's movement has the lower id but is in the delta all the same
+        self.assertEqual(sorted(delta['items']), ['A', 'B'])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "SQLite profile")
+class SQLiteProductionProfileTests(TestCase):
+
+    def test_production_options_apply_pragmas_on_connect(self):
+        db_path = os.path.join(tempfile.mkdtemp(), 'profile.sqlite3')
+        profile = type(connections['default'])(
+            dict(connection.settings_dict, NAME=db_path, OPTIONS=settings.SQLITE_PRODUCTION_OPTIONS),
+            alias='profile_check',
+        )
+        connections['profile_check'] = profile
+        try:
+            with profile.cursor() as cursor:
+                pragmas = {}
+                for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size'):
+                    cursor.execute(f'PRAGMA {pragma}')
+                    pragmas[pragma] = cursor.fetchone()[0]
+
+            self.assertEqual(pragmas['journal_mode'], 'wal')
+            self.assertEqual(pragmas['synchronous'], 1)  # NORMAL
+            self.assertEqual(pragmas['busy_timeout'], settings.SQLITE_PRODUCTION_OPTIONS['timeout'] * 1000)
+            self.assertLess(pragmas['cache_size'], 0)  # sized in KiB
+
+            with CaptureQueriesContext(profile) as captured:
+                with transaction.atomic(using='profile_check'):
+                    pass
+            self.assertIn('BEGIN IMMEDIATE', [q['sql'] for q in captured.captured_queries])
+        finally:
+            profile.close()
+            del connections['profile_check']
+
+
+class ProductStockSummaryTests(TestCase):
+
+    def setUp(self):
+        self.vendor = VenderDetails.objects.create(
+            vender_code='000001', vender_name='Supplier', company_name='Acme'
+        )
+        StockAssigned.objects.create(item_code='000001', product_name='Soap', company_name='Acme')
+
+    def receive(self, *barcodes):
+        rows = [
+            {'item_code': '000001', 'barcode_number': b, 'qty': 10, 'rate': '1', 'sale_rate': '2'}
+            for b in barcodes
+        ]
+        receive_stock(self.vendor, rows, '0000001', '2025-01-01')
+
+    def test_summary_follows_receiving_sale_and_return(self):
+        self.receive('A', 'B')
+        post_sale([sale_line('A', qty=4), sale_line('B', qty=1)], **sale_header())
+        self.client.post(reverse('Sale_return'), {
+            'sale_number': '0000001',
+            'barcode[]': ['A'], 'description[]': ['Soap'], 'specification[]': [''],
+            'qty[]': ['2'], 'sale_rate[]': ['50.00'], 'amount[]': ['100.00'],
+        })
+
+        summary = ProductStockSummary.objects.get(item_code='000001')
+        self.assertEqual(
+            (summary.total_qty, summary.sale_qty, summary.sale_return_qty,
+             summary.available_qty, summary.batch_count),
+            (20, 5, 2, 17, 2)
+        )
+        call_command('rebuild_stock_summary', '--verify', stdout=StringIO())
+
+    def test_summary_rows_are_locked_in_item_code_order(self):
+        ProductStockSummary.objects.bulk_create([ProductStockSummary(item_code=c) for c in ('B', 'A')])
+        deltas = stock_deltas()
+        deltas['B']['sale_qty'] += 2
+        deltas['A']['sale_qty'] += 1
+
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            apply_deltas(deltas)
+
+        lock = next(q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT'))
+        self.assertRegex(lock, r'ORDER BY (1|"core_productstocksummary"\."item_code") ASC')
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', lock)
+
+    def test_rebuild_repairs_a_drifted_summary(self):
+        self.receive('A')
+        ProductStockSummary.objects.update(available_qty=3)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stock_summary', '--verify', stdout=StringIO())
+        call_command('rebuild_stock_summary', stdout=StringIO())
+
+        self.assertEqual(ProductStockSummary.objects.get().available_qty, 10)
+
+
+class SalesRollupTests(TestCase):
+
+    def setUp(self):
+        make_stock(barcode='A', item_code='000001', qty=50)
+        make_stock(barcode='B', item_code='000002', qty=50)
+        with self.captureOnCommitCallbacks(execute=True):
+            post_sale([sale_line('A', qty=2), sale_line('B', '000002')], **sale_header('0000001'))
+            post_sale([sale_line('A')], **dict(sale_header('0000002'), sale_date='2025-01-20'))
+            post_sale([sale_line('B', '000002', qty=3)], **dict(sale_header('0000003'), sale_date='2025-02-03'))
+            self.client.post(reverse('Sale_return'), {
+                'sale_number': '0000001', 'return_date': '2025-01-20',
+                'barcode[]': ['A'], 'description[]': ['Soap'], 'specification[]': [''],
+                'qty[]': ['1'], 'sale_rate[]': ['50.00'], 'amount[]': ['50.00'],
+            })
+
+    def rollup_rows(self):
+        return {
+            model.__name__: sorted(
+                model.objects.values_list(*[f.name for f in model._meta.fields if f.name != 'id'])
+            )
+            for model in (DailySalesTotal, DailyItemSales, DailyCompanySales)
+        }
+
+    def test_sales_and_returns_update_daily_rollups(self):
+        day = DailySalesTotal.objects.get(day='2025-01-20')
+        self.assertEqual(
+            (day.sale_count, day.qty_sold, day.amount_sold, day.return_count, day.qty_returned),
+            (1, 1, Decimal('50.00'), 1, 1)
+        )
+        soap = DailyItemSales.objects.get(day='2025-01-01', item_code='000001')
+        self.assertEqual((soap.qty_sold, soap.amount_sold), (2, Decimal('100.00')))
+        self.assertEqual(DailyCompanySales.objects.get(day='2025-01-01').qty_sold, 3)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        incremental = self.rollup_rows()
+        DailyItemSales.objects.update(qty_sold=0)
+
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_undated_return_is_stored_on_the_day_it_is_rolled_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('Sale_return'), {
+                'sale_number': '0000002',
+                'barcode[]': ['A'], 'description[]': ['Soap'], 'specification[]': [''],
+                'qty[]': ['1'], 'sale_rate[]': ['50.00'], 'amount[]': ['50.00'],
+            })
+        incremental = self.rollup_rows()
+
+        self.assertEqual(SaleReturnDetail.objects.latest('id').return_date, timezone.now().date())
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_monthly_report_reads_rollups(self):
+        response = self.client.get(reverse('sales_report'), {
+            'from': '2025-01-01', 'to': '2025-12-31', 'period': 'month', 'format': 'json',
+        })
+
+        rows = response.json()['rows']
+        self.assertEqual([(r['sale_count'], r['qty_sold'], r['amount_net']) for r in rows],
+                         [(2, 4, '150.00'), (1, 3, '150.00')])
+
+        page = self.client.get(reverse('sales_report'), {'group': 'company', 'period': 'year',
+                                                         'from': '2025-01-01', 'to': '2025-12-31'})
+        self.assertContains(page, 'Acme')
+
+
+class SaleDetailsLookupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_stock(barcode='A', qty=50, sale_rate='19.99')
+        make_stock(barcode='B', item_code='000002', qty=50)
+        post_sale([sale_line('A', qty=3, sale_rate='19.99'), sale_line('B', '000002')],
+                  **sale_header('0000001'))
+
+    def lookup(self):
+        return self.client.get(reverse('get_sale_details'), {'sale_number': '0000001'})
+
+    def return_one(self, barcode='A'):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('Sale_return'), {
+                'sale_number': '0000001', 'return_date': '2025-01-02',
+                'barcode[]': [barcode], 'description[]': ['Soap'], 'specification[]': [''],
+                'qty[]': ['1'], 'sale_rate[]': ['19.99'], 'amount[]': ['19.99'],
+            })
+
+    def test_payload_keeps_decimal_precision_and_is_cached(self):
+        with self.assertNumQueries(2):
+            data = self.lookup().json()
+        self.assertEqual([(i['barcode'], i['qty'], i['sale_rate'], i['amount']) for i in data['items']],
+                         [('A', 3, '19.99', '59.97'), ('B', 1, '50.00', '50.00')])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.lookup().json(), data)
+        self.assertEqual(self.client.get(reverse('get_sale_details'),
+                                         {'sale_number': 'missing'}).status_code, 404)
+
+    def test_return_beyond_the_quantity_sold_is_rejected(self):
+        for _ in range(3):
+            self.return_one('A')
+        # Another worker's cache may still offer the barcode; the server checks
+        cache.clear()
+        self.return_one('A')
+        self.return_one('X')
+
+        self.assertEqual(SaleReturn.objects.filter(barcode_number='A').count(), 3)
+        self.assertFalse(SaleReturn.objects.filter(barcode_number='X').exists())
+        with self.assertRaisesMessage(SaleError, "Sale 0000009 not found."):
+            check_returnable('0000009', [{'barcode_number': 'A', 'qty': 1}])
+
+    def test_return_refreshes_returned_quantities(self):
+        self.assertEqual([i['returned_qty'] for i in self.lookup().json()['items']], [0, 0])
+
+        self.return_one('A')
+        self.return_one('A')
+
+        self.assertEqual([i['returned_qty'] for i in self.lookup().json()['items']], [2, 0])
+
+
+class AsyncLookupTests(TestCase):
+
+    def setUp(self):
+        make_stock(barcode='A', qty=50, sale_rate='19.99')
+        post_sale([sale_line('A', qty=3, sale_rate='19.99')], **sale_header('0000001'))
+        self.product = self.client.get(reverse('get_product_by_barcode'), {'barcode': 'A'}).json()
+        self.sale = self.client.get(reverse('get_sale_details'), {'sale_number': '0000001'}).json()
+        barcode_cache.clear()
+        cache.clear()
+        stats_by_view.clear()
+
+    async def test_async_views_match_sync_views(self):
+        product = await self.async_client.get(reverse('aget_product_by_barcode'), {'barcode': 'A'})
+        sale = await self.async_client.get(reverse('aget_sale_details'), {'sale_number': '0000001'})
+        missing = await self.async_client.get(reverse('aget_sale_details'), {'sale_number': 'x'})
+
+        self.assertEqual(product.json(), self.product)
+        self.assertEqual(sale.json(), self.sale)
+        self.assertEqual(missing.status_code, 404)
+        # the instrumentation middleware sees the async ORM's queries
+        stats = stats_by_view.snapshot()
+        self.assertEqual(stats['aget_product_by_barcode']['max_queries'], 1)
+        self.assertEqual(stats['aget_sale_details']['max_queries'], 2)
+
+
+class DataExportTests(TestCase):
+
+    def setUp(self):
+        make_stock(barcode='A', qty=50)
+        post_sale([sale_line('A', qty=2)], **sale_header('0000001'))
+        post_sale([sale_line('A')], **dict(sale_header('0000002'), sale_date='2025-02-01'))
+
+    def download(self, name, **params):
+        response = self.client.get(reverse('export_data', args=[name, 'csv']), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_sales_csv_streams_filtered_rows(self):
+        lines = self.download('sales', **{'from': '2025-01-01', 'to': '2025-01-31'})
+
+        self.assertEqual(lines[0].split(',')[:3], ['sale_number', 'sale_date', 'customer_name'])
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('0000001,2025-01-01,Walk-in'))
+
+    def test_rows_are_read_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.download('stock')
+        self.assertEqual(len(queries), 1)
+
+    def test_unknown_export_is_rejected(self):
+        response = self.client.get(reverse('export_data', args=['secrets', 'csv']))
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_dates_are_rejected(self):
+        for params in ({'from': '2025-13-01'}, {'to': 'yesterday'}):
+            response = self.client.get(reverse('export_data', args=['sales', 'csv']), params)
+            self.assertEqual(response.status_code, 400)
+        with self.assertRaisesMessage(CommandError, "Invalid date 'yesterday'"):
+            call_command('export_data', 'sales', '--to', 'yesterday', stdout=StringIO())
+
+    def test_export_command_writes_csv(self):
+        out = StringIO()
+        call_command('export_data', 'sales', '--from', '2025-02-01', stdout=out)
+
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+    def test_parquet_export_keeps_types(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        import io
+
+        response = self.client.get(reverse('export_data', args=['sales', 'parquet']))
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(table.column('amount').to_pylist(), [Decimal('100.00'), Decimal('50.00')])
+
+
+class StockLedgerTests(TestCase):
+
+    def setUp(self):
+        self.vendor = VenderDetails.objects.create(
+            vender_code='000001', vender_name='Supplier', company_name='Acme'
+        )
+        StockAssigned.objects.create(item_code='000001', product_name='Soap', company_name='Acme')
+        receive_stock(self.vendor, [
+            {'item_code': '000001', 'barcode_number': b, 'qty': 10, 'rate': '1', 'sale_rate': '2'}
+            for b in ('A', 'B')
+        ], '0000001', '2025-01-01')
+
+    def test_movements_are_written_for_receiving_and_sales(self):
+        post_sale([sale_line('A', qty=3)], **sale_header('0000007'))
+
+        self.assertEqual(
+            list(StockMovement.objects.filter(barcode_number='A').values_list('kind', 'qty', 'reference')),
+            [('receive', 10, '0000001'), ('sale', -3, '0000007')]
+        )
+
+    def test_balance_reads_snapshot_plus_tail(self):
+        post_sale([sale_line('A', qty=3)], **sale_header('0000001'))
+        self.assertEqual(take_snapshot(), 2)
+        middle = timezone.now()
+        post_sale([sale_line('A', qty=2)], **sale_header('0000002'))
+
+        self.assertEqual(take_snapshot(), 1)
+        self.assertEqual(take_snapshot(), 0)
+        self.assertEqual(balance_as_of('A'), 5)
+        self.assertEqual(balance_as_of('A', middle), 7)
+        self.assertEqual(balance_as_of('B'), 10)
+
+    def test_opening_balances_cover_stock_received_before_the_ledger(self):
+        StockMovement.objects.filter(barcode_number='B').delete()
+
+        self.assertEqual(record_opening_balances(), 1)
+        self.assertEqual(balance_as_of('B'), 10)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Reads SQLite query plans")
+class IndexUsageTests(TestCase):
+    """
+    Every hot lookup made by core.views and its services must be answered
+    from an index. SQLite reports a full table scan as "SCAN <table>"
+    without "USING ... INDEX".
+    """
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        full_scans = [
+            line for line in plan.splitlines()
+            if 'SCAN' in line and 'INDEX' not in line
+        ]
+        self.assertEqual(full_scans, [], f"{queryset.query}\n{plan}")
+
+    def test_hot_queries_use_indexes(self):
+        hot_queries = [
+            # get_product_by_barcode, sale_return
+            ItemStock.objects.filter(barcode_number='1'),
+            # post_sale
+            ItemStock.objects.filter(barcode_number__in=['1', '2']),
+            ItemStock.objects.filter(barcode_number='1', item_code='000001'),
+            ItemStock.objects.filter(item_code='000001'),
+            # sales by item code (FEFO allocation)
+            ItemStock.objects.filter(
+                Q(barcode_number__in=['1']) | open_batches(['000001'], timezone.now().date())
+            ),
+            # stock receiving
+            StockAssigned.objects.filter(item_code__in=['000001', '000002']),
+            StockReceivingDetail.objects.filter(barcode_number__in=['1', '2']),
+            StockReceivingDetail.objects.filter(order_number='0000001'),
+            stockreceving.objects.filter(order_number='0000001'),
+            # get_sale_details and returns against a sale
+            SaleInfo.objects.filter(sale_number='0000001'),
+            SaleDetail.objects.filter(sale_id=1),
+            SaleReturnDetail.objects.filter(sale_number='0000001'),
+            SaleReturn.objects.filter(barcode_number='1'),
+            ExchangeSaleDetail.objects.filter(barcode_number='1'),
+            # date-range reporting
+            SaleInfo.objects.filter(sale_date__range=('2025-01-01', '2025-01-31')).order_by('sale_date'),
+            # stock alerts
+            expiring_batches(timezone.now().date(), 30),
+            low_stock_products(),
+            # stock summary, ledger and document numbers
+            ProductStockSummary.objects.filter(item_code__in=['000001']),
+            StockMovement.objects.filter(barcode_number='1', id__gt=10),
+            DocumentSequence.objects.filter(name='sale'),
+        ]
+        for queryset in hot_queries:
+            with self.subTest(query=str(queryset.query)):
+                self.assertUsesIndex(queryset)
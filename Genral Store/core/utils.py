@@ -0,0 +1,13 @@
+from itertools import islice
+
+
+def chunks(iterable, size):
+    """
+    Yield lists of up to `size` items from any iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -1,12 +1,40 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
 from django.contrib import messages
+from django.core.cache import cache
 from decimal import Decimal
 from django.db import IntegrityError, transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from .models import *
-from django.db.models import Max
+from .alerts import alert_dashboard
+from .allocation import item_availability
+from .cache import (
+    alookup_barcode, barcode_cache, invalidate_on_commit, lookup_barcode, lookup_barcodes,
+)
+from .catalogue import (
+    PAGE_SIZE, TYPEAHEAD_LIMIT, invalidate_catalogue, product_count, product_page,
+    resolve_barcode, suggestions,
+)
+from .receiving import StockReceiver, receive_stock, receive_upload
+from .sales import (
+    asale_details, check_returnable, invalidate_sale_details, lock_stock, post_sale, sale_details,
+    sale_lines_from_post, update_stock_counts,
+)
+from .exports import FORMATS, ExportError, export_chunks, export_period
+from .idempotency import DuplicateSubmission, claim, completed_document
+from .instrumentation import stats_by_view
+from .offline import stock_snapshot, sync_sales
+from .pricing import price_lines, refund_amount, sale_rates
+from .ledger import record_movements
+from .reports import GROUPS, PERIODS, record_return, sales_report as build_sales_report
+from .sequences import advance, next_number, peek_number
+from .stock_summary import apply_deltas, stock_deltas
 import json
-from datetime import datetime
+import os
+import uuid
+from collections import defaultdict
+from django.http import HttpResponse
 
 
 
@@ -17,23 +45,17 @@ from datetime import datetime
 # -----------------------------
 def products(request):
     """
-    Display all products and handle adding a new product via POST.
+    Display the product catalogue and handle adding a new product via POST.
+    The table itself is filled page by page from product_search.
     """
 
-    # Get all products
-    products = StockAssigned.objects.all().order_by('item_code')
+    product_total = product_count()
     form_errors = False
 
-    # Generate next auto item_code (6 digits)
-    last_item = StockAssigned.objects.order_by('-id').first()
-    if last_item and last_item.item_code.isdigit():
-        next_item_code = str(int(last_item.item_code) + 1).zfill(6)
-    else:
-        next_item_code = "000001"
+    # Preview of the next auto item_code (6 digits)
+    next_item_code = peek_number('item')
 
     if request.method == 'POST':
-        # Always use auto-generated item_code
-        item_code = next_item_code
         product_name = request.POST.get('product_name', '').strip()
         company_name = request.POST.get('company_name', '').strip()
         specification = request.POST.get('specification', '').strip()
@@ -45,6 +67,8 @@ def products(request):
 
         else:
             try:
+                # Always use auto-generated item_code
+                item_code = next_number('item')
                 with transaction.atomic():
                     StockAssigned.objects.create(
                         item_code=item_code,
@@ -52,6 +76,7 @@ def products(request):
                         company_name=company_name,
                         specification=specification or ''
                     )
+                    invalidate_catalogue('products')
                 messages.success(request, f"Product '{product_name}' added successfully.")
                 return redirect('products')
 
@@ -64,6 +89,28 @@ def products(request):
 
 
 
+# -----------------------------
+# Product Search (JSON pages)
+# -----------------------------
+def product_search(request):
+    """
+    One keyset page of products matching `q`, starting after item code `after`.
+    """
+    query = request.GET.get('q', '').strip()
+    after = request.GET.get('after', '').strip()
+    try:
+        limit = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        limit = PAGE_SIZE
+
+    rows, next_cursor = product_page(query, after, limit)
+    return JsonResponse({
+        'results': rows,
+        'next': next_cursor,
+        'total': product_count(),
+    })
+
+
 # -----------------------------
 # Edit Product
 # -----------------------------
@@ -107,6 +154,8 @@ def edit_product(request, product_id):
                     product.company_name = company_name
                     product.specification = specification
                     product.save()
+                    advance('item', item_code)
+                    invalidate_catalogue('products')
                 messages.success(request, f"Product '{product_name}' updated successfully.")
                 return redirect('products')
             except IntegrityError:
@@ -128,6 +177,7 @@ def delete_product(request, product_id):
         return redirect('products')
     product_name = product.product_name
     product.delete()
+    invalidate_catalogue('products')
     messages.success(request, f"Product '{product_name}' deleted successfully.")
     return redirect('products')
 
@@ -139,29 +189,23 @@ def vendor_details(request):
     vendors = VenderDetails.objects.all().order_by('vender_code')
     form_errors = False
 
-    # Auto-generate next vendor code (6 digits)
-    last_vendor = VenderDetails.objects.order_by('-id').first()
-    if last_vendor and last_vendor.vender_code.isdigit():
-        next_vendor_code = str(int(last_vendor.vender_code) + 1).zfill(6)
-    else:
-        next_vendor_code = "000001"
+    # Preview of the next auto vendor code (6 digits)
+    next_vendor_code = peek_number('vendor')
 
     # Handle POST - Add Vendor
     if request.method == 'POST':
-        vender_code = request.POST.get('vender_code', '').strip()
         vender_name = request.POST.get('vender_name', '').strip()
         vender_number = request.POST.get('vender_number', '').strip()
         company_name = request.POST.get('company_name', '').strip()
 
         # Validation
-        if not vender_code or not vender_name or not company_name:
-            form_errors = True
-            messages.error(request, "Vendor Code, Vendor Name, and Company Name are required.")
-        elif VenderDetails.objects.filter(vender_code__iexact=vender_code).exists():
+        if not vender_name or not company_name:
             form_errors = True
-            messages.error(request, f"Vendor with code '{vender_code}' already exists.")
+            messages.error(request, "Vendor Name and Company Name are required.")
         else:
             try:
+                # Always use auto-generated vender_code
+                vender_code = next_number('vendor')
                 with transaction.atomic():
                     VenderDetails.objects.create(
                         vender_code=vender_code,
@@ -169,6 +213,7 @@ def vendor_details(request):
                         vender_number=vender_number,
                         company_name=company_name
                     )
+                    invalidate_catalogue('vendors')
                 messages.success(request, f"Vendor '{vender_name}' added successfully.")
                 return redirect('vendor_details')
             except IntegrityError:
@@ -201,6 +246,7 @@ def edit_vendor(request, vendor_id):
             return render(request, 'edit_vendor.html', {'vendor': vendor})
 
         vendor.save()
+        invalidate_catalogue('vendors')
         messages.success(request, "Vendor updated successfully.")
         return redirect('vendor_details')
 
@@ -215,6 +261,7 @@ def delete_vendor(request, vendor_id):
 
     if request.method == 'POST':
         vendor.delete()
+        invalidate_catalogue('vendors')
         messages.success(request, "Vendor deleted successfully.")
         return redirect('vendor_details')
 
@@ -227,24 +274,98 @@ def delete_vendor(request, vendor_id):
 
 
 # ----------------------------------------------------
-def generate_order_number():
-    last_order = StockReceivingDetail.objects.aggregate(
-        max_no=Max('order_number')
-    )['max_no']
+# STOCK RECEIVING
+# ----------------------------------------------------
+MAX_REPORTED_ROW_ERRORS = 20
 
-    if last_order and last_order.isdigit():
-        return str(int(last_order) + 1).zfill(7)
-    return "0000001"
+
+def report_receiving(request, receiver):
+    """
+    Turn a StockReceiver's outcome into flash messages.
+    """
+    for row_number, error in receiver.errors[:MAX_REPORTED_ROW_ERRORS]:
+        messages.warning(request, f"Row {row_number}: {error}")
+    if receiver.error_count > MAX_REPORTED_ROW_ERRORS:
+        messages.warning(
+            request,
+            f"... and {receiver.error_count - MAX_REPORTED_ROW_ERRORS} more rejected rows."
+        )
+
+    if receiver.rows_received:
+        messages.success(
+            request,
+            f"Stock received successfully: {receiver.rows_received} of "
+            f"{receiver.rows_seen} rows."
+        )
+    else:
+        messages.error(request, "No rows were received.")
+
+
+def receiving_progress_key(upload_id):
+    return f"receiving-progress:{upload_id}"
+
+
+def receive_purchase_order_file(request, vendor, today_date):
+    """
+    Receive an uploaded CSV/XLSX purchase order in fixed-size chunks.
+
+    Progress is published in the cache under the client's `upload_id` so the
+    page can poll stock_receiving_progress while the upload is processed
+    (the poll may reach another worker; see CACHES in settings).
+    """
+    upload_id = request.POST.get('upload_id', '')[:64]
+    receive_number = next_number('receiving')
+    receiver = StockReceiver(
+        vendor, receive_number, today_date, max_errors=MAX_REPORTED_ROW_ERRORS
+    )
+
+    def publish(receiver, done=False, error=None):
+        if upload_id:
+            cache.set(receiving_progress_key(upload_id), {
+                'done': done,
+                'error': error,
+                'rows_seen': receiver.rows_seen,
+                'rows_received': receiver.rows_received,
+                'error_count': receiver.error_count,
+                'errors': [
+                    {'row': row_number, 'error': error}
+                    for row_number, error in receiver.errors
+                ],
+            }, timeout=3600)
+
+    try:
+        with transaction.atomic():
+            receive_upload(
+                receiver,
+                request.FILES['po_file'],
+                chunk_size=getattr(settings, 'RECEIVING_CHUNK_SIZE', 500),
+                progress=publish
+            )
+            receiver.finish()
+    except Exception as e:
+        publish(receiver, done=True, error=str(e))
+        messages.error(request, str(e))
+        return redirect('stock_receiving_list')
+
+    publish(receiver, done=True)
+    report_receiving(request, receiver)
+    return redirect('stock_receiving_list')
+
+
+def stock_receiving_progress(request, upload_id):
+    progress = cache.get(receiving_progress_key(upload_id))
+    if progress is None:
+        return JsonResponse({'error': 'Unknown upload'}, status=404)
+    return JsonResponse(progress)
 
 
 def stock_receiving_list(request):
-    receive_number = generate_order_number()
+    # Preview only; the number is allocated when the order is posted
+    receive_number = peek_number('receiving')
 
-    print('receive_number', receive_number)
     today_date = timezone.now().date()
 
-    vendors = VenderDetails.objects.all()
-    products = StockAssigned.objects.all()
+    # Vendors and products are looked up through the typeahead endpoints
 
     if request.method == "POST":
         vendor_raw = request.POST.get('vendor')
@@ -259,6 +380,9 @@ def stock_receiving_list(request):
             messages.error(request, "Selected vendor does not exist.")
             return redirect('stock_receiving_list')
 
+        if request.FILES.get('po_file'):
+            return receive_purchase_order_file(request, vendor, today_date)
+
         rows_json = request.POST.get('rows', '[]')
         try:
             rows = json.loads(rows_json)
@@ -270,157 +394,175 @@ def stock_receiving_list(request):
             messages.error(request, "No products added.")
             return redirect('stock_receiving_list')
 
-        errors = []
-
-        # -----------------------------
-        # CALCULATE TOTALS FIRST
-        # -----------------------------
-        total_qty = 0
-        total_amount = Decimal('0.00')
-
-        for row in rows:
-            qty = int(row.get('qty', 0))
-            rate = Decimal(row.get('rate', '0'))
-            total_qty += qty
-            total_amount += qty * rate
-
+        receive_number = next_number('receiving')
         try:
             with transaction.atomic():
+                receiver = receive_stock(vendor, rows, receive_number, today_date)
+        except Exception as e:
+            messages.error(request, str(e))
+            return redirect('stock_receiving_list')
 
-                # -----------------------------
-                # CREATE HEADER (ONCE)
-                # -----------------------------
-                stockreceving.objects.create(
-                    order_number=receive_number,
-                    order_date=today_date,
-                    vender_code=vendor.vender_code,
-                    vendor_name=vendor.vender_name,
-                    total_qty=total_qty,
-                    total_amount=total_amount
-                )
+        report_receiving(request, receiver)
+        return redirect('stock_receiving_list')
 
-                # -----------------------------
-                # CREATE DETAILS
-                # -----------------------------
-                for idx, row in enumerate(rows, start=1):
-                    product = StockAssigned.objects.get(
-                        item_code=row.get('item_code')
-                    )
+    return render(request, "stock_receiving.html", locals())
 
-                    barcode = row.get('barcode_number')
-                    qty = int(row.get('qty', 0))
-                    rate = Decimal(row.get('rate', '0'))
-                    sale_rate = Decimal(row.get('sale_rate', '0'))
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from .models import ItemStock
 
-                    exp_date = row.get('exp_date')
-                    print('exp_date', exp_date)
-                    exp_date = (
-                        datetime.strptime(exp_date, "%Y-%m-%d").date()
-                        if exp_date else None
-                    )
+def scan_result(stock_detail):
+    """
+    What the sale screen gets for one scanned barcode.
+    """
+    # Silent fail if not found
+    if not stock_detail:
+        return {}
 
-                    if StockReceivingDetail.objects.filter(
-                        barcode_number=barcode
-                    ).exists():
-                        raise ValueError(
-                            f"Row {idx}: Barcode '{barcode}' already exists."
-                        )
-
-                    StockReceivingDetail.objects.create(
-                        order_number=receive_number,
-                        order_date=today_date,
-                        vender=vendor,
-                        product=product,
-                        barcode_number=barcode,
-                        qty=qty,
-                        rate=rate,
-                        sale_rate=sale_rate,
-                        expire_date=exp_date
-                    )
+    # Out of stock check
+    if stock_detail['available_qty'] <= 0:
+        return {
+            'item_code': stock_detail['item_code'],
+            'qty': 0
+        }
 
-                    ItemStock.objects.create(
-                        order_number=receive_number,
-                        vender_code=vendor.vender_code,
-                        item_code=product.item_code,
-                        product_name=product.product_name,
-                        company_name=product.company_name,
-                        specification=product.specification,
-                        barcode_number=barcode,
-                        total_qty=qty,
-                        rate=rate,
-                        sale_rate=sale_rate,
-                        expire_date=exp_date,
-                        sale_qty=0,
-                        sale_return_qty=0,
-                        stock_return_qty=0,
-                        
-                    )
+    return dict(stock_detail, qty=1)  # ✅ each scan adds 1
 
 
-        except Exception as e:
-            messages.error(request, str(e))
-            return redirect('stock_receiving_list')
+def get_product_by_barcode(request):
+    barcode = request.GET.get('barcode')
 
-        messages.success(request, "Stock received successfully.")
-        return redirect('stock_receiving_list')
+    if not barcode:
+        return JsonResponse({}, status=200)
 
-    return render(request, "stock_receiving.html", locals())
+    return JsonResponse(scan_result(lookup_barcode(barcode)))
 
-from django.http import JsonResponse
-from .models import ItemStock
 
-def get_product_by_barcode(request):
+async def aget_product_by_barcode(request):
+    """
+    get_product_by_barcode for the ASGI deployment: a cache miss awaits the
+    database instead of holding a worker thread.
+    """
     barcode = request.GET.get('barcode')
-    print('barcode:', barcode)
 
     if not barcode:
         return JsonResponse({}, status=200)
 
-    stock_detail = ItemStock.objects.filter(
-        barcode_number=barcode
-    ).first()
+    return JsonResponse(scan_result(await alookup_barcode(barcode)))
 
-    print('stock_detail:', stock_detail)
 
-    # Silent fail if not found
-    if not stock_detail:
+SCAN_BATCH_LIMIT = 100
+
+
+def get_products_by_barcodes(request):
+    """
+    Resolve a burst of scans at once.
+
+    POST {"barcodes": [...]} -> {"results": {barcode: scan result}}, with
+    the same per-barcode result as get_product_by_barcode.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST a JSON list of barcodes'}, status=405)
+    try:
+        barcodes = json.loads(request.body or b'{}').get('barcodes')
+    except (ValueError, AttributeError):
+        barcodes = None
+    if not isinstance(barcodes, list):
+        return JsonResponse({'error': 'Expected {"barcodes": [...]}'}, status=400)
+    if len(barcodes) > SCAN_BATCH_LIMIT:
+        return JsonResponse({'error': f'At most {SCAN_BATCH_LIMIT} barcodes per request'}, status=400)
+
+    barcodes = [str(barcode).strip() for barcode in barcodes]
+    snapshots = lookup_barcodes(barcode for barcode in barcodes if barcode)
+    return JsonResponse({
+        'results': {barcode: scan_result(snapshot) for barcode, snapshot in snapshots.items()}
+    })
+
+
+def get_item_stock(request):
+    """
+    Sell by item code: product, stock across open batches and the sale
+    rate of the batch sold first ({} when none is left).
+    """
+    item_code = request.GET.get('item_code', '').strip()
+    stock = item_availability(item_code) if item_code else None
+    if not stock:
         return JsonResponse({})
+    return JsonResponse(dict(stock, qty=1))
 
-    # Out of stock check
-    if stock_detail.available_qty <= 0:
-        return JsonResponse({
-            'item_code': stock_detail.item_code,
-            'qty': 0
-        })
 
-    data = {
-    'item_code': stock_detail.item_code,
-    'product_name': stock_detail.product_name,
-    'company_name': stock_detail.company_name,
-    'specification': stock_detail.specification or '',
-    'sale_rate': stock_detail.sale_rate,   # ✅ numeric
-    'qty': 1,                               # ✅ each scan adds 1
-    'available_qty': stock_detail.available_qty
-    }
+def typeahead_limit(request):
+    try:
+        return int(request.GET.get('limit', TYPEAHEAD_LIMIT))
+    except ValueError:
+        return TYPEAHEAD_LIMIT
 
 
-    return JsonResponse(data)
+def product_typeahead(request):
+    """
+    Products whose code/name starts with, or name/company contains, `q`.
+    """
+    return JsonResponse({
+        'results': suggestions('products', request.GET.get('q', ''), typeahead_limit(request))
+    })
+
+
+def vendor_typeahead(request):
+    """
+    Vendors whose code/name starts with, or name/company contains, `q`.
+    """
+    return JsonResponse({
+        'results': suggestions('vendors', request.GET.get('q', ''), typeahead_limit(request))
+    })
+
+
+def resolve_receiving_barcode(request):
+    """
+    Product scanned on the receiving screen, by batch barcode or item code
+    ({} if unknown); see catalogue.resolve_barcode.
+    """
+    barcode = request.GET.get('barcode', '').strip()
+    product = resolve_barcode(barcode) if barcode else None
+    return JsonResponse(product or {})
+
+
+def barcode_cache_stats(request):
+    """
+    Hit/miss counters of the in-process barcode cache.
+    """
+    return JsonResponse(barcode_cache.stats())
 
 
+def request_stats(request):
+    """
+    Latency histogram, query counts and DB time per view, collected by
+    RequestStatsMiddleware in this process (internal IPs and staff only).
+    """
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS):
+        raise Http404
+    if request.GET.get('reset') == '1':
+        stats_by_view.clear()
+    return JsonResponse({'pid': os.getpid(), 'views': stats_by_view.snapshot()})
 
 
+# Alerts returned per kind by stock_alerts unless ?limit= says otherwise
+ALERT_LIMIT = 100
 
 
+def stock_alerts(request):
+    """
+    Dashboard feed of the alerts written by `manage.py check_stock_alerts`:
+    counts per kind and the first ?limit= alerts of each (?kind= for one).
+    """
+    kinds = dict(StockAlert.KIND_CHOICES)
+    kind = request.GET.get('kind')
+    try:
+        limit = max(0, int(request.GET.get('limit', ALERT_LIMIT)))
+    except ValueError:
+        limit = ALERT_LIMIT
+    return JsonResponse(alert_dashboard([kind] if kind in kinds else list(kinds), limit))
 
-def generate_sale_number():
-    last_sale = SaleInfo.objects.aggregate(
-        max_no=Max('sale_number')
-    )['max_no']
 
-    if last_sale and last_sale.isdigit():
-        return str(int(last_sale) + 1).zfill(7)
 
-    return "0000001"
 
 
 
@@ -430,77 +572,55 @@ from datetime import date
 
 def sales(request):
     if request.method == "POST":
+        # A resubmitted form (double click, browser retry) gets its sale back
+        idempotency_key = request.POST.get('idempotency_key', '').strip()[:64]
+        recorded = completed_document(IdempotencyKey.SALE, idempotency_key)
+        if recorded:
+            messages.info(request, f"Sale {recorded} was already recorded.")
+            return redirect('sales')
+
         try:
-            with transaction.atomic():
+            # 🔐 Generate sale number ONLY here
+            sale_number = next_number('sale')
 
-                # 🔐 Generate sale number ONLY here
-                sale_number = generate_sale_number()
+            with transaction.atomic():
+                claim(IdempotencyKey.SALE, idempotency_key, sale_number)
 
                 sale_date = request.POST.get("sale_date")
                 customer_name = request.POST.get("customer_name")
                 customer_contact = request.POST.get("contact_number", "")
-                total_quantity = int(request.POST.get("total_quantity", 0) or 0)
-                total_amount = Decimal(request.POST.get("total_amount", "0.00") or 0)
                 cash_received = Decimal(request.POST.get("cash_received", "0.00") or 0)
                 cash_return = Decimal(request.POST.get("cash_return", "0.00") or 0)
 
-                sale_info = SaleInfo.objects.create(
+                # Totals are recomputed from the stock rates, never taken as posted
+                lines = sale_lines_from_post(request.POST)
+                totals = price_lines(
+                    lines,
+                    sale_rates(line['barcode_number'] for line in lines if line['barcode_number']),
+                    quantity=request.POST.get("total_quantity"),
+                    amount=request.POST.get("total_amount"),
+                )
+
+                post_sale(
+                    lines,
+                    nowait=getattr(settings, 'STOCK_LOCK_NOWAIT', False),
                     sale_number=sale_number,
                     sale_date=sale_date,
                     customer_name=customer_name,
                     customer_contact=customer_contact,
-                    total_quantity=total_quantity,
-                    total_amount=total_amount,
+                    total_quantity=totals.quantity,
+                    total_amount=totals.amount,
                     cash_received=cash_received,
                     cash_return=cash_return
                 )
 
-                # --- Sale Detail ---
-                barcodes = request.POST.getlist("barcode[]")
-                item_codes = request.POST.getlist("item_code[]")
-                product_names = request.POST.getlist("product_name[]")
-                company_names = request.POST.getlist("company_name[]")
-                specifications = request.POST.getlist("specification[]")
-                quantities = request.POST.getlist("qty[]")
-                sale_rates = request.POST.getlist("sale_rate[]")
-                amounts = request.POST.getlist("amount[]")
-
-                for i in range(len(barcodes)):
-                    if not barcodes[i].strip():
-                        continue
-
-                    qty = int(quantities[i] or 0)
-
-                    # ✅ Backend stock validation
-                    stock = ItemStock.objects.select_for_update().get(
-                        barcode_number=barcodes[i],
-                        item_code=item_codes[i]
-                    )
-
-                    if stock.available_qty < qty:
-                        raise Exception(
-                            f"Insufficient stock for {stock.product_name}"
-                        )
-
-                    SaleDetail.objects.create(
-                        sale=sale_info,  # <-- must link to the sale
-                        barcode_number=barcodes[i],
-                        item_code=item_codes[i],
-                        product_name=product_names[i],
-                        company_name=company_names[i],
-                        specification=specifications[i] or '',
-                        qty=qty,
-                        sale_rate=Decimal(sale_rates[i] or 0),
-                        amount=Decimal(amounts[i] or 0)
-                    )
-
-                    # ✅ ONLY update sale_qty
-                    stock.sale_qty += qty
-                    stock.save()
-
                 messages.success(request, "Sale recorded successfully!")
                 return redirect('sales')
 
+        except DuplicateSubmission as e:
+            messages.info(request, f"Sale {e.document_number} was already recorded.")
+            return redirect('sales')
+
         except Exception as e:
             messages.error(request, str(e))
             return redirect('sales')
@@ -508,7 +628,8 @@ def sales(request):
     # GET request
     context = {
         "today": date.today().strftime("%Y-%m-%d"),
-        "sale_number": generate_sale_number()
+        "sale_number": peek_number('sale'),
+        "idempotency_key": uuid.uuid4().hex,
     }
     return render(request, "sale.html", context)
 
@@ -517,54 +638,68 @@ def sales(request):
 
 
 
-from django.shortcuts import get_object_or_404, render
-from django.http import JsonResponse
-from .models import SaleInfo, SaleDetail
+# ----------------------------------------------------
+# OFFLINE TILL
+# ----------------------------------------------------
+OFFLINE_SYNC_LIMIT = 50
 
-def get_sale_details(request):
-    sale_number = request.GET.get('sale_number')
-    if not sale_number:
-        return JsonResponse({'error': 'Sale number not provided'}, status=400)
 
+def offline_stock_snapshot(request):
+    """
+    Stock snapshot for the offline till; ?since=<version> for the changes
+    after a snapshot the till already holds.
+    """
     try:
-        sale = SaleInfo.objects.get(sale_number=sale_number)
-        sale_items = SaleDetail.objects.filter(sale=sale)  # ✅ directly use the ForeignKey
-
-        data = {
-            'sale_date': sale.sale_date.strftime('%Y-%m-%d'),
-            'customer_name': sale.customer_name,
-            'customer_contact': sale.customer_contact,
-            'items': [
-                {
-                    'barcode': item.barcode_number,
-                    'item_code': item.item_code,
-                    'description': item.product_name,
-                    'specification': item.specification or '',
-                    'qty': item.qty,
-                    'sale_rate': float(item.sale_rate),
-                    'amount': float(item.amount)
-                }
-                for item in sale_items
-            ]
-        }
-        return JsonResponse(data)
-    except SaleInfo.DoesNotExist:
-        return JsonResponse({'error': 'Sale not found'}, status=404)
+        since = int(request.GET['since'])
+    except (KeyError, ValueError):
+        since = None
+    return HttpResponse(stock_snapshot(since), content_type='application/json')
 
 
+def offline_sync_sales(request):
+    """
+    POST {"sales": [...]} queued by an offline till -> {"results": [...]},
+    one result per sale in order (see offline.sync_sales).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST a JSON list of sales'}, status=405)
+    try:
+        sales = json.loads(request.body or b'{}').get('sales')
+    except (ValueError, AttributeError):
+        sales = None
+    if not isinstance(sales, list) or not all(isinstance(sale, dict) for sale in sales):
+        return JsonResponse({'error': 'Expected {"sales": [{...}, ...]}'}, status=400)
+    if len(sales) > OFFLINE_SYNC_LIMIT:
+        return JsonResponse({'error': f'At most {OFFLINE_SYNC_LIMIT} sales per request'}, status=400)
+
+    return JsonResponse({
+        'results': sync_sales(sales, nowait=getattr(settings, 'STOCK_LOCK_NOWAIT', False))
+    })
 
 
+def get_sale_details(request):
+    sale_number = request.GET.get('sale_number', '').strip()
+    if not sale_number:
+        return JsonResponse({'error': 'Sale number not provided'}, status=400)
 
+    data = sale_details(sale_number)
+    if data is None:
+        return JsonResponse({'error': 'Sale not found'}, status=404)
+    return JsonResponse(data)
 
-def generate_return_number():
-    last_return = SaleReturnDetail.objects.order_by('-id').first()
 
-    if last_return and last_return.return_number.isdigit():
-        next_number = int(last_return.return_number) + 1
-    else:
-        next_number = 1
+async def aget_sale_details(request):
+    """
+    get_sale_details for the ASGI deployment, using the async cache and ORM.
+    """
+    sale_number = request.GET.get('sale_number', '').strip()
+    if not sale_number:
+        return JsonResponse({'error': 'Sale number not provided'}, status=400)
 
-    return str(next_number).zfill(6)
+    data = await asale_details(sale_number)
+    if data is None:
+        return JsonResponse({'error': 'Sale not found'}, status=404)
+    return JsonResponse(data)
 
 
 
@@ -573,11 +708,21 @@ def generate_return_number():
 
 def sale_return(request):
     today = timezone.now().date()
-    return_number = generate_return_number()
+    return_number = peek_number('return')
 
     if request.method == 'POST':
+        # A resubmitted form gets the return it already recorded
+        idempotency_key = request.POST.get('idempotency_key', '').strip()[:64]
+        if completed_document(IdempotencyKey.RETURN, idempotency_key):
+            return redirect('Sale_return')
+
         try:
+            # The posted return number is only a preview; always allocate here
+            return_number = next_number('return')
+
             with transaction.atomic():
+                claim(IdempotencyKey.RETURN, idempotency_key, return_number)
+
                 # -----------------------
                 # MAIN RETURN INFO
                 # -----------------------
@@ -585,8 +730,8 @@ def sale_return(request):
                 sale_date = request.POST.get('sale_date') or None
                 customer_name = request.POST.get('customer_name', '')
                 customer_contact = request.POST.get('contact_number', '')
-                return_number = request.POST.get('return_number') or generate_return_number()
-                return_date = request.POST.get('return_date') or None
+                # Stored as rolled up, so rebuild_sales_rollups finds the same day
+                return_date = request.POST.get('return_date') or today
                 reason = request.POST.get('return_reason', '')
 
                 # -----------------------
@@ -596,19 +741,43 @@ def sale_return(request):
                 descriptions = request.POST.getlist('description[]')
                 specifications = request.POST.getlist('specification[]')
                 qtys = request.POST.getlist('qty[]')
-                sale_amounts = [Decimal(r or '0.00') for r in request.POST.getlist('sale_rate[]')]
-                amounts = [Decimal(a or '0.00') for a in request.POST.getlist('amount[]')]
+                sale_amounts = request.POST.getlist('sale_rate[]')
+                amounts = request.POST.getlist('amount[]')
+                rows = min(len(barcodes), len(qtys), len(sale_amounts), len(amounts))
 
-                # -----------------------
-                # CALCULATE ORIGINAL SALE TOTAL (STATIC)
-                # -----------------------
-                original_total_amount = sum(sale_amounts[i] * int(qtys[i] or 0) for i in range(len(qtys)))
+                lines = []
+                for i in range(rows):
+                    barcode = barcodes[i].strip()
+                    qty = int(qtys[i] or 0)
+                    if not barcode or qty <= 0:
+                        continue
+                    lines.append({
+                        'barcode_number': barcode,
+                        'description': descriptions[i],
+                        'specification': specifications[i],
+                        'qty': qty,
+                        'sale_rate': Decimal(sale_amounts[i] or '0.00'),
+                        'amount': Decimal(amounts[i] or '0.00'),
+                    })
+
+                # Rates as sold; a return refunds what the customer paid
+                sold_rates = check_returnable(sale_number, lines) if lines else {}
+
+                # Lock the returned batches; the first batch of a barcode takes the return
+                stocks = {}
+                for stock in lock_stock(
+                    [line['barcode_number'] for line in lines],
+                    nowait=getattr(settings, 'STOCK_LOCK_NOWAIT', False),
+                ):
+                    stocks.setdefault(stock.barcode_number, stock)
 
                 # -----------------------
-                # CALCULATE REFUND AMOUNT
+                # RECOMPUTE RETURN TOTALS
                 # -----------------------
-                total_quantity = sum(int(q or 0) for q in qtys)
-                amount_refunded = sum(int(qtys[i] or 0) * sale_amounts[i] for i in range(len(qtys)))
+                # Line amounts and totals come from the rates of the sale;
+                # the cashier may refund less than the goods are worth
+                totals = price_lines(lines, sold_rates, quantity=request.POST.get('total_quantity'))
+                amount_refunded = refund_amount(request.POST.get('amount_refunded'), totals.amount)
 
                 # -----------------------
                 # SAVE HEADER
@@ -621,62 +790,130 @@ def sale_return(request):
                     return_number=return_number,
                     return_date=return_date,
                     reason_for_return=reason,
-                    total_quantity=total_quantity,
-                    total_amount=original_total_amount,  # STATIC
-                    amount_refunded=amount_refunded      # DYNAMIC
+                    total_quantity=totals.quantity,
+                    total_amount=totals.amount,
+                    amount_refunded=amount_refunded
                 )
 
                 # -----------------------
                 # SAVE EACH ITEM AND UPDATE STOCK
                 # -----------------------
-                rows = min(len(barcodes), len(qtys), len(sale_amounts), len(amounts))
+                deltas = stock_deltas()
+                returned = defaultdict(int)
+                returned_by_pk = defaultdict(int)
+                report_lines = []
 
-                for i in range(rows):
-                    barcode = barcodes[i].strip()
-                    if not barcode:
-                        continue
-
-                    qty = int(qtys[i] or 0)
-                    if qty <= 0:
-                        continue
+                for line in lines:
+                    barcode = line['barcode_number']
+                    qty = line['qty']
 
                     # Save SaleReturn item
                     SaleReturn.objects.create(
                         return_detail=return_detail,
                         barcode_number=barcode,
-                        description=descriptions[i],
-                        specification=specifications[i],
+                        description=line['description'],
+                        specification=line['specification'],
                         qty=qty,
-                        sale_amount=sale_amounts[i],
-                        total_amount=sale_amounts[i] * qty  # Use returned qty
+                        sale_amount=line['sale_rate'],
+                        total_amount=line['amount']
                     )
 
                     # Update ItemStock
-                    try:
-                        stock_item = ItemStock.objects.get(barcode_number=barcode)
-                        stock_item.sale_return_qty += qty
-                        stock_item.save()  # available_qty auto-updates
-                    except ItemStock.DoesNotExist:
-                        pass
+                    stock_item = stocks.get(barcode)
+                    if stock_item is not None:
+                        returned_by_pk[stock_item.pk] += qty
+                        deltas[stock_item.item_code]['sale_return_qty'] += qty
+                        returned[(barcode, stock_item.item_code)] += qty
+                    report_lines.append({
+                        'item_code': stock_item.item_code if stock_item else None,
+                        'company_name': stock_item.company_name if stock_item else None,
+                        'qty': qty,
+                        'amount': line['amount'],
+                    })
+
+                update_stock_counts(returned_by_pk, 'sale_return_qty')
+                apply_deltas(deltas)
+                record_movements(StockMovement.SALE_RETURN, return_number, returned)
+                record_return(return_date, report_lines)
+                invalidate_on_commit(barcode for barcode, _ in returned)
+                invalidate_sale_details(sale_number)
 
                 # -----------------------
                 # REDIRECT AFTER ALL ROWS PROCESSED
                 # -----------------------
                 return redirect('Sale_return')
 
+        except DuplicateSubmission:
+            return redirect('Sale_return')
+
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)})
 
     return render(request, 'sale_return.html', {
         'today': today,
-        'return_number': return_number
+        'return_number': return_number,
+        'idempotency_key': uuid.uuid4().hex,
     })
 
 
+# ----------------------------------------------------
+# SALES REPORT
+# ----------------------------------------------------
+def report_date(value, default):
+    try:
+        return parse_date(value or '') or default
+    except ValueError:  # well formed but impossible, e.g. 2025-02-30
+        return default
 
 
+def sales_report(request):
+    """
+    Sales and returns per day/month/year, in total or per item or company,
+    read from the daily rollups. ?format=json returns the rows as JSON.
+    """
+    today = timezone.now().date()
+    start = report_date(request.GET.get('from'), today.replace(day=1))
+    end = report_date(request.GET.get('to'), today)
+    group = request.GET.get('group', 'total')
+    period = request.GET.get('period', 'day')
+    if group not in GROUPS:
+        group = 'total'
+    if period not in PERIODS:
+        period = 'day'
+
+    rows = build_sales_report(start, end, group, period)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'from': start, 'to': end, 'group': group, 'period': period, 'rows': rows,
+        })
 
+    return render(request, 'sales_report.html', {
+        'rows': rows,
+        'start': start,
+        'end': end,
+        'group': group,
+        'period': period,
+        'groups': GROUPS,
+        'periods': PERIODS,
+    })
 
 
-
-
+# ----------------------------------------------------
+# DATA EXPORTS (CSV / PARQUET DOWNLOADS)
+# ----------------------------------------------------
+def export_data(request, name, fmt):
+    """
+    Stream sales, returns, stock or receiving rows as CSV or Parquet,
+    optionally limited to ?from=YYYY-MM-DD&to=YYYY-MM-DD.
+    """
+    try:
+        start, end = export_period(request.GET.get('from'), request.GET.get('to'))
+        pieces = export_chunks(name, fmt, start, end)
+    except ExportError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    filename = '_'.join([name] + [str(day) for day in (start, end) if day]) + f'.{fmt}'
+    response = StreamingHttpResponse(pieces, content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,11 +46,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.RequestStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,9 +86,91 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file (not the default in-memory database) so concurrency tests
+        # get real SQLite locking between threads.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# SQLite tuning for the shop server, selected with ERP_DB_PROFILE=production.
+# WAL lets tills read while another till writes, the busy timeout makes a
+# writer wait for the lock instead of failing with "database is locked", and
+# IMMEDIATE makes every atomic block (all the write views) take the write
+# lock up front instead of upgrading a read lock halfway through.
+
+SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        f"PRAGMA mmap_size={int(os.environ.get('ERP_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))};"
+        f"PRAGMA cache_size=-{int(os.environ.get('ERP_SQLITE_CACHE_KB', 64 * 1024))};"
+        'PRAGMA temp_store=MEMORY;'
+    ),
+    'timeout': int(os.environ.get('ERP_SQLITE_TIMEOUT', 20)),
+    'transaction_mode': 'IMMEDIATE',
+}
+
+DB_PROFILE = os.environ.get('ERP_DB_PROFILE', 'development')
+
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'OPTIONS': SQLITE_PRODUCTION_OPTIONS,
+        # Keep each worker's connection (and its page cache) between requests
+        'CONN_MAX_AGE': int(os.environ.get('ERP_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+    })
+
+# PostgreSQL for multi-store / multi-worker installs (needs psycopg),
+# selected with ERP_DB_PROFILE=postgresql. Stock rows are locked per row
+# there, so only tills selling the same barcode wait for each other;
+# lock_timeout bounds that wait.
+
+if DB_PROFILE == 'postgresql':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('ERP_PG_NAME', 'erp'),
+        'USER': os.environ.get('ERP_PG_USER', 'erp'),
+        'PASSWORD': os.environ.get('ERP_PG_PASSWORD', ''),
+        'HOST': os.environ.get('ERP_PG_HOST', 'localhost'),
+        'PORT': os.environ.get('ERP_PG_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('ERP_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'options': f"-c lock_timeout={int(os.environ.get('ERP_PG_LOCK_TIMEOUT_MS', 10000))}",
+        },
+    }
+
+# Fail a sale at once when another till holds one of its stock rows,
+# instead of waiting (PostgreSQL only; SQLite locks the whole database)
+
+STOCK_LOCK_NOWAIT = os.environ.get('ERP_STOCK_LOCK_NOWAIT', '') == '1'
+
+
+# Cache shared by the worker processes. Upload progress, barcode cache
+# versions, sale lookups and offline snapshots are written by one request
+# and read by the next, which may reach another worker. The in-process
+# default (LocMemCache) only suits a single process such as runserver, so
+# the production and postgresql profiles use a file cache shared by every
+# worker on the host (ERP_CACHE_DIR); ERP_REDIS_URL shares one Redis
+# server across hosts (needs the redis package).
+
+CACHE_DIR = os.environ.get('ERP_CACHE_DIR', BASE_DIR / 'cache')
+
+REDIS_URL = os.environ.get('ERP_REDIS_URL', '')
+
+if REDIS_URL:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }}
+elif DB_PROFILE in ('production', 'postgresql') or 'ERP_CACHE_DIR' in os.environ:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+    }}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,6 +207,55 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Request instrumentation (core.instrumentation). Every request is timed and
+# its queries counted; requests slower than SLOW_REQUEST_MS, or running one
+# statement N_PLUS_ONE_THRESHOLD times or more, are logged as warnings.
+# ERP_REQUEST_LOG_LEVEL=INFO logs every request. Aggregates per view are
+# served at /internal/request-stats/ to INTERNAL_IPS and staff users.
+
+SLOW_REQUEST_MS = int(os.environ.get('ERP_SLOW_REQUEST_MS', 500))
+
+N_PLUS_ONE_THRESHOLD = 10
+
+INTERNAL_IPS = ['127.0.0.1']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{asctime} {levelname} {name} {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'core.requests': {
+            'level': os.environ.get('ERP_REQUEST_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
+
+
+# Opt-in request profiling (core.profiling), enabled with ERP_PROFILING=1.
+# Staff users then profile a request by sending `X-Profile: 1` (cProfile) or
+# `X-Profile: pyinstrument`, or by adding `?_profile=1`. Profiles are saved
+# to PROFILE_DIR; `manage.py list_profiles` summarises them.
+
+PROFILING_ENABLED = os.environ.get('ERP_PROFILING', '') == '1'
+
+PROFILE_DIR = os.environ.get('ERP_PROFILE_DIR', BASE_DIR / 'profiles')
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
@@ -131,3 +265,55 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Barcode lookup cache used by the sale screen (entries, seconds). Each
+# worker keeps its own; entries are checked against versions in the shared
+# cache (CACHES above), so a sale committed in one worker is seen by all
+
+BARCODE_CACHE_SIZE = 5000
+
+BARCODE_CACHE_TTL = 300
+
+
+# Rows per chunk when receiving an uploaded purchase order
+
+RECEIVING_CHUNK_SIZE = 500
+
+
+# Document numbers reserved per worker process at a time (1 = one UPDATE per
+# document). Numbers are never handed out twice, but are not gap-free: the
+# sale and return views take theirs before the posting transaction, so a
+# document that fails validation skips its number
+
+DOCUMENT_NUMBER_BLOCK_SIZE = 1
+
+
+# Seconds the product count on the products page may be served from cache
+
+PRODUCT_COUNT_TTL = 300
+
+
+# Seconds a product/vendor typeahead result may be served from cache
+
+TYPEAHEAD_CACHE_TTL = 60
+
+
+# Seconds a sale looked up on the return screen may be served from cache
+# (returns against the sale drop it at once)
+
+SALE_DETAILS_TTL = 3600
+
+
+# Days ahead `manage.py check_stock_alerts` warns about expiring batches
+
+STOCK_EXPIRY_ALERT_DAYS = 30
+
+
+# Offline till: seconds a full stock snapshot may be served from cache (it
+# is keyed by stock version, so this only bounds memory), and the number of
+# changed barcodes above which a till gets a full snapshot instead of a delta
+
+OFFLINE_SNAPSHOT_TTL = 300
+
+OFFLINE_DELTA_LIMIT = 5000
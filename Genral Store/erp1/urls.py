@@ -8,6 +8,9 @@ urlpatterns = [
     # List and Add Products
     path('', views.products, name='products'),
 
+    # Product catalogue pages (JSON)
+    path('products/search/', views.product_search, name='product_search'),
+
     # Edit a Product
     path('products/edit/<int:product_id>/', views.edit_product, name='edit_product'),
 
@@ -25,15 +28,49 @@ urlpatterns = [
 
     # Stock Receiving Details
     path('stock-receiving/', views.stock_receiving_list, name='stock_receiving_list'),
+
+    path('stock-receiving/progress/<str:upload_id>/', views.stock_receiving_progress, name='stock_receiving_progress'),
     
     
     path('sales/', views.sales, name='sales'),
 
     path('Sales_return/', views.sale_return, name='Sale_return'),
     
+    path('reports/sales/', views.sales_report, name='sales_report'),
+
+    # Expiry / low-stock alerts (JSON), refreshed by `manage.py check_stock_alerts`
+    path('reports/stock-alerts/', views.stock_alerts, name='stock_alerts'),
+
+    # CSV / Parquet downloads, e.g. exports/sales.csv?from=2025-01-01&to=2025-01-31
+    path('exports/<slug:name>.<slug:fmt>', views.export_data, name='export_data'),
+
     path('get-sale-details/', views.get_sale_details, name='get_sale_details'),
 
+    # Offline till: stock snapshot (?since=<version> for a delta) and sale sync
+    path('offline/stock-snapshot/', views.offline_stock_snapshot, name='offline_stock_snapshot'),
+
+    path('offline/sync-sales/', views.offline_sync_sales, name='offline_sync_sales'),
+
+    # Async variants of the read-only lookups, for the ASGI deployment
+    path('async/get-sale-details/', views.aget_sale_details, name='aget_sale_details'),
+
+    path('async/ajax/get-product/', views.aget_product_by_barcode, name='aget_product_by_barcode'),
+
 
     path('ajax/get-product/', views.get_product_by_barcode, name='get_product_by_barcode'),
+
+    path('ajax/get-products/', views.get_products_by_barcodes, name='get_products_by_barcodes'),
+
+    path('ajax/get-item/', views.get_item_stock, name='get_item_stock'),
+
+    path('ajax/products/', views.product_typeahead, name='product_typeahead'),
+
+    path('ajax/vendors/', views.vendor_typeahead, name='vendor_typeahead'),
+
+    path('ajax/resolve-barcode/', views.resolve_receiving_barcode, name='resolve_receiving_barcode'),
+
+    path('ajax/barcode-cache-stats/', views.barcode_cache_stats, name='barcode_cache_stats'),
+
+    path('internal/request-stats/', views.request_stats, name='request_stats'),
     
    ]